@@ -0,0 +1,107 @@
+"""Micro-benchmark of the per request authentication cost: the previous path (read
+and parse the user database, decode and verify the token, build a new bearer scheme)
+against the current one (in memory user store and cache of verified tokens).
+
+Run it from the root of the repository:
+
+    python -m benchmarks.bench_auth --requests 20000 --json auth.json
+
+The cost of `/token` (bcrypt) is reported as well, it is the same before and after
+but now runs in a thread pool instead of blocking the event loop.
+"""
+
+import argparse
+import os
+import time
+from datetime import timedelta
+from typing import Callable
+
+from fastapi.security import OAuth2PasswordBearer
+from jose import jwt
+from passlib.context import CryptContext
+
+os.environ.setdefault("SECRET_KEY", "0" * 64)
+os.environ.setdefault("ALGORITHM", "HS256")
+
+from seiright.app.api_models import get_user  # noqa: E402
+from seiright.app.security import (  # noqa: E402
+    algorithm,
+    authenticate_user,
+    create_access_token,
+    oauth2_scheme,
+    secret_key,
+    verify_token,
+)
+from seiright.app.utils import UserStore, read_db  # noqa: E402
+
+from .report import write_report  # noqa: E402
+
+USERNAME = "monte"
+PASSWORD = "secret"
+
+
+def previous_auth(token: str):
+    OAuth2PasswordBearer(tokenUrl="token")
+    payload = jwt.decode(token, secret_key(), algorithms=[algorithm()])
+    return get_user(read_db(), payload.get("sub"))
+
+
+def current_auth(store: UserStore) -> Callable[[str], object]:
+    def auth(token: str):
+        oauth2_scheme()
+        return get_user(store.users(), verify_token(token))  # type: ignore
+
+    return auth
+
+
+def previous_login() -> object:
+    context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+    user = get_user(read_db(), USERNAME)
+    return context.verify(PASSWORD, user.hashed_password)  # type: ignore
+
+
+def current_login(store: UserStore) -> Callable[[], object]:
+    return lambda: authenticate_user(store.users(), USERNAME, PASSWORD)
+
+
+def measure(call: Callable[[], object], repeat: int) -> dict:
+    call()
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        call()
+    elapsed = time.perf_counter() - t0
+    return {"requests": repeat, "us_per_request": elapsed / repeat * 1e6}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--logins", type=int, default=5)
+    parser.add_argument("--json", help="path of the json report")
+    args = parser.parse_args()
+
+    store = UserStore()
+    token = create_access_token({"sub": USERNAME}, timedelta(minutes=30))
+    auth = current_auth(store)
+    cases = {
+        "request auth (previous)": (lambda: previous_auth(token), args.requests),
+        "request auth": (lambda: auth(token), args.requests),
+        "login (previous)": (previous_login, args.logins),
+        "login": (current_login(store), args.logins),
+    }
+
+    results = []
+    print(f"{'case':<28} {'requests':>9} {'us/request':>12}")
+    for name, (call, repeat) in cases.items():
+        result = {"case": name, **measure(call, repeat)}
+        results.append(result)
+        print(f"{name:<28} {repeat:>9} {result['us_per_request']:>12.1f}")
+
+    if args.json:
+        write_report(
+            args.json, "auth", results, requests=args.requests, logins=args.logins
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""Benchmark of the representation of the extracted text: memory held per page
+and time to build the text sent to the llm, with blocks (`ExtractedPage`) against
+the previous single string re-wrapped as a whole.
+
+Run it from the root of the repository:
+
+    python -m benchmarks.bench_blocks --sizes 1 5 20 --json blocks.json
+
+Both start from the blocks of the streaming extractor. `held_mb` is the memory
+(python heap, `tracemalloc`) still held once the prompt is built: the text and the
+prompt for the string, the page and the prompt for the blocks.
+"""
+
+import argparse
+import textwrap
+import time
+import tracemalloc
+from typing import Callable
+
+from seiright.core._types import ExtractorConfig
+from seiright.core.blocks import ExtractedPage, title_banner
+from seiright.core.extractor import extract_html
+
+from .bench_extraction import generate_page
+from .report import write_report
+
+CONFIG = ExtractorConfig(max_bytes=2**62, max_text_chars=2**62)
+
+
+def string_prompt(blocks: list[tuple[str, str, int]], title: str | None) -> tuple:
+    """the single string of the previous `extract_text_from_url`, re-wrapped as a
+    whole by the previous `reformat_extracted_text`"""
+    lines = [
+        f"\n{'#' * int(tag[1:])} {text}\n" if tag.startswith("h") else text
+        for tag, text, _ in blocks
+    ]
+    text = "\n".join(lines)
+    wrapped = textwrap.fill(
+        text, width=80, break_long_words=False, replace_whitespace=False
+    )
+    return text, title_banner(title) + wrapped
+
+
+def blocks_prompt(blocks: list[tuple[str, str, int]], title: str | None) -> tuple:
+    page = ExtractedPage.from_blocks(blocks, title)
+    return page, page.render_prompt()
+
+
+CASES: dict[str, Callable[[list, str | None], tuple]] = {
+    "string (previous)": string_prompt,
+    "blocks": blocks_prompt,
+}
+
+
+def measure(build: Callable, blocks: list, title: str | None, repeat: int) -> dict:
+    timings = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        build(blocks, title)
+        timings.append(time.perf_counter() - t0)
+
+    tracemalloc.start()
+    held = build(blocks, title)
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del held
+    return {
+        "seconds": min(timings),
+        "held_mb": current / 1024 / 1024,
+        "peak_mb": peak / 1024 / 1024,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=float, nargs="+", default=[1, 5, 20])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--json", help="path of the json report")
+    args = parser.parse_args()
+
+    results = []
+    print(
+        f"{'page':>8} {'representation':<20} {'time (s)':>9} {'held (MB)':>10} "
+        f"{'peak (MB)':>10} {'blocks':>8}"
+    )
+    for size in args.sizes:
+        extractor = extract_html(generate_page(size), config=CONFIG)
+        collector = extractor.collector
+        blocks = [
+            (tag, text, position)
+            for (tag, text), position in zip(collector.blocks, collector.positions)
+        ]
+        for name, build in CASES.items():
+            result = {"page_mb": size, "representation": name, "blocks": len(blocks)}
+            result.update(measure(build, blocks, extractor.title, args.repeat))
+            results.append(result)
+            print(
+                f"{size:>6.1f}MB {name:<20} {result['seconds']:>9.3f} "
+                f"{result['held_mb']:>10.1f} {result['peak_mb']:>10.1f} "
+                f"{len(blocks):>8}"
+            )
+
+    if args.json:
+        write_report(args.json, "blocks", results, sizes=args.sizes, repeat=args.repeat)
+
+
+if __name__ == "__main__":
+    main()
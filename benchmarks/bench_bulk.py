@@ -0,0 +1,157 @@
+"""Benchmark of the bulk runner (`seiright check`): throughput over a list of urls
+at increasing concurrency, and the work redone when an interrupted run resumes.
+The pages are the html fixtures (local fixture server) and the llm is the fake
+OpenAI server, so it runs offline.
+
+Run it from the root of the repository:
+
+    python -m benchmarks.bench_bulk --urls 500 --concurrency 4 16 64 \\
+        --llm-latency 0.2 --json bulk.json
+
+Every url is distinct (query string) and the verdict cache is disabled, so that
+every url downloads a page and calls the llm. The resume case interrupts a run
+halfway and starts it again: `redone` counts the llm calls made for urls which
+were already checked before the interruption.
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import tempfile
+from pathlib import Path
+
+from .report import write_report
+from .servers import FakeLLMServer, FixtureServer
+
+FIXTURES = ["home.html", "pricing.html", "savings.html"]
+
+
+def build_checker():
+    from seiright.core.factory import build_checker
+    from seiright.core._types import LLMProvider
+
+    return build_checker(LLMProvider.OPENAI, "gpt-4o")
+
+
+class StoppingWriter:
+    """writer which sets `stop` once `stop_after` verdicts were written"""
+
+    def __init__(self, writer, stop_after: int | None):
+        self.writer = writer
+        self.stop_after = stop_after
+        self.stop = asyncio.Event()
+        self.written = 0
+
+    def completed(self, retry_failed: bool = False) -> set[str]:
+        return self.writer.completed(retry_failed)
+
+    def write(self, verdict) -> None:
+        self.writer.write(verdict)
+        self.written += 1
+        if self.written == self.stop_after:
+            self.stop.set()
+
+    def close(self) -> None:
+        self.writer.close()
+
+
+async def run(urls: list[str], output: Path, concurrency: int, stop_after=None):
+    from seiright.core.bulk import open_writer, run_bulk
+    from seiright.core.web_crawler import aclose_http_client
+
+    checker = build_checker()
+    writer = StoppingWriter(open_writer(output), stop_after)
+    task = asyncio.create_task(
+        run_bulk(
+            checker,
+            urls,
+            writer,
+            max_fetches=concurrency,
+            max_llm_calls=concurrency,
+        )
+    )
+    try:
+        if stop_after is None:
+            return await task
+        # interrupts the run once `stop_after` verdicts are written
+        await writer.stop.wait()
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+    finally:
+        writer.close()
+        await checker.aclose()
+        await aclose_http_client()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--urls", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[4, 16, 64])
+    parser.add_argument("--llm-latency", type=float, default=0.2)
+    parser.add_argument("--json", help="path of the json report")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+
+    results = []
+    with FixtureServer() as pages, FakeLLMServer(latency=args.llm_latency) as llm:
+        os.environ.update(
+            OPENAI_API_KEY="sk-benchmark",
+            OPENAI_BASE_URL=llm.openai_base_url,
+            VERDICT_CACHE_SIZE="0",
+        )
+        urls = [
+            pages.url(FIXTURES[i % len(FIXTURES)], query=f"i={i}")
+            for i in range(args.urls)
+        ]
+        print(f"{'case':<24} {'urls/s':>8} {'seconds':>8} {'llm calls':>10}")
+        for concurrency in args.concurrency:
+            with tempfile.TemporaryDirectory() as tmp:
+                calls = llm.calls
+                summary = asyncio.run(run(urls, Path(tmp) / "out.jsonl", concurrency))
+            result = {
+                "case": f"concurrency {concurrency}",
+                "urls_per_second": summary.checked / summary.seconds,
+                "seconds": summary.seconds,
+                "failed": summary.failed,
+            }
+            results.append(result)
+            print(
+                f"{result['case']:<24} {result['urls_per_second']:>8.1f} "
+                f"{summary.seconds:>8.2f} {llm.calls - calls:>10}"
+            )
+
+        concurrency = max(args.concurrency)
+        with tempfile.TemporaryDirectory() as tmp:
+            output = Path(tmp) / "out.jsonl"
+            calls = llm.calls
+            asyncio.run(run(urls, output, concurrency, stop_after=len(urls) // 2))
+            summary = asyncio.run(run(urls, output, concurrency))
+            redone = llm.calls - calls - len(urls)
+            rows = len(output.read_text().splitlines())
+        results.append(
+            {
+                "case": "interrupted and resumed",
+                "skipped": summary.skipped,
+                "redone": redone,
+            }
+        )
+        print(
+            f"{'interrupted and resumed':<24} skipped {summary.skipped}, "
+            f"{rows} rows for {len(urls)} urls, {redone} llm calls redone"
+        )
+
+    if args.json:
+        write_report(
+            args.json,
+            "bulk",
+            results,
+            **{k: v for k, v in vars(args).items() if k != "json"},
+        )
+
+
+if __name__ == "__main__":
+    main()
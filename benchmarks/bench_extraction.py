@@ -0,0 +1,167 @@
+"""Benchmark of the html extraction: parse time and peak memory of the streaming
+extractor (both parser backends) against the previous BeautifulSoup implementation,
+on large synthetic pages.
+
+Run it from the root of the repository:
+
+    python -m benchmarks.bench_extraction --sizes 1 5 20 --json extraction.json
+
+Peak memory is measured with `tracemalloc`, i.e. it covers the python heap. The
+buffers of libxml2 (lxml backend) are not traced, they stay bounded by the chunk
+size since no tree is built.
+"""
+
+import argparse
+import json
+import random
+import time
+import tracemalloc
+from typing import Callable
+
+from bs4 import BeautifulSoup
+
+from seiright.core._types import ExtractorConfig
+from seiright.core.extractor import StreamingExtractor
+
+from .report import write_report
+
+CHUNK_SIZE = 64 * 1024
+WORDS = (
+    "account bank savings checking interest rate apy fdic insured deposit loan "
+    "credit card fees overdraft transfer wire mobile app business personal"
+).split()
+
+
+def generate_page(size_mb: float, seed: int = 0) -> bytes:
+    """builds a synthetic marketing page of roughly `size_mb` megabytes, with the
+    usual mix of navigation, scripts, headings, paragraphs and lists"""
+    rng = random.Random(seed)
+    target = int(size_mb * 1024 * 1024)
+
+    def sentence(n: int) -> str:
+        return " ".join(rng.choice(WORDS) for _ in range(n))
+
+    nav = (
+        "<nav><ul>"
+        + "".join(f"<li><a href='/{w}'>{w}</a></li>" for w in WORDS)
+        + "</ul></nav>"
+    )
+    parts = [
+        "<html><head><title>Synthetic bank</title>",
+        "<style>p{margin:0}</style></head><body>",
+        nav,
+    ]
+    size = sum(len(p) for p in parts)
+    section = 0
+    while size < target:
+        section += 1
+        block = (
+            f"<h2>{sentence(4)} {section}</h2>"
+            f"<div class='copy'><p>{sentence(60)} <b>{sentence(3)}</b> {sentence(40)}</p>"
+            f"<ul>{''.join(f'<li>{sentence(8)}</li>' for _ in range(5))}</ul></div>"
+            f"<script>var s{section} = {json.dumps(sentence(80))};</script>"
+        )
+        parts.append(block)
+        size += len(block)
+    parts.append("</body></html>")
+    return "".join(parts).encode("utf-8")
+
+
+def legacy_extract(html: bytes) -> tuple[str, str | None]:
+    """the BeautifulSoup implementation the streaming extractor replaced"""
+    soup = BeautifulSoup(html.decode("utf-8"), "html.parser")
+    title_tag = soup.find("title")
+    title = title_tag.get_text(strip=True) or None if title_tag else None
+    extracted_text = []
+    for element in soup.find_all(["p", "h1", "h2", "h3", "h4", "h5", "h6", "li"]):
+        text = element.get_text(strip=True)
+        if text:
+            if element.name.startswith("h"):
+                extracted_text.append(f"\n{'#' * int(element.name[1:])} {text}\n")
+            else:
+                extracted_text.append(text)
+    return "\n".join(extracted_text), title
+
+
+def streaming_extract(backend: str, limited: bool) -> Callable[[bytes], tuple]:
+    config = ExtractorConfig(backend=backend, chunk_size=CHUNK_SIZE)  # type: ignore
+    if not limited:
+        config = config.model_copy(update={"max_bytes": 2**62, "max_text_chars": 2**62})
+
+    def extract(html: bytes) -> tuple[str, str | None]:
+        extractor = StreamingExtractor(config=config, encoding="utf-8")
+        for start in range(0, len(html), CHUNK_SIZE):
+            extractor.feed(html[start : start + CHUNK_SIZE])
+            if extractor.done:
+                break
+        return extractor.result()
+
+    return extract
+
+
+def measure(extract: Callable[[bytes], tuple], html: bytes, repeat: int) -> dict:
+    timings = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        text, _ = extract(html)
+        timings.append(time.perf_counter() - t0)
+
+    tracemalloc.start()
+    extract(html)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "seconds": min(timings),
+        "peak_mb": peak / 1024 / 1024,
+        "text_chars": len(text),
+    }
+
+
+def implementations() -> dict[str, Callable[[bytes], tuple]]:
+    impls = {
+        "bs4 (previous)": legacy_extract,
+        "stream html.parser": streaming_extract("html.parser", limited=False),
+        "stream html.parser, default limits": streaming_extract(
+            "html.parser", limited=True
+        ),
+    }
+    try:
+        import lxml  # noqa: F401
+
+        impls["stream lxml"] = streaming_extract("lxml", limited=False)
+        impls["stream lxml, default limits"] = streaming_extract("lxml", limited=True)
+    except ImportError:
+        pass
+    return impls
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=float, nargs="+", default=[1, 5, 20])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--json", help="path of the json report")
+    args = parser.parse_args()
+
+    results = []
+    print(
+        f"{'page':>8} {'implementation':<36} {'time (s)':>9} {'peak (MB)':>10} {'chars':>10}"
+    )
+    for size in args.sizes:
+        html = generate_page(size)
+        for name, extract in implementations().items():
+            result = {"page_mb": size, "implementation": name}
+            result.update(measure(extract, html, args.repeat))
+            results.append(result)
+            print(
+                f"{size:>6.1f}MB {name:<36} {result['seconds']:>9.3f} "
+                f"{result['peak_mb']:>10.1f} {result['text_chars']:>10}"
+            )
+
+    if args.json:
+        write_report(
+            args.json, "extraction", results, sizes=args.sizes, repeat=args.repeat
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,194 @@
+"""End-to-end load test of `/check-compliance`: the service runs in uvicorn and
+checks the html fixtures (local fixture server) with a fake OpenAI/Anthropic
+server standing in for the llm apis, so it runs offline. Reports the throughput
+and the p50/p95/p99 latency at increasing concurrency.
+
+Run it from the root of the repository:
+
+    python -m benchmarks.bench_load --concurrency 1 4 16 64 --requests 200 \\
+        --llm-latency 0.3 --jitter 0.2 --json load.json
+
+Every request checks a distinct url and the verdict cache is disabled unless
+`--cached` is set, so that every request downloads the page and calls the llm.
+`--error-rate` and `--rate-limit-rate` inject 500s and 429s in the llm calls,
+`--fallbacks` routes the checks over fallback models as well (`LLM_FALLBACKS`).
+"""
+
+import argparse
+import asyncio
+import itertools
+import logging
+import os
+import socket
+import statistics
+import threading
+import time
+from typing import Iterator
+
+import httpx
+import uvicorn
+
+from .report import write_report
+from .servers import FakeLLMServer, FixtureServer
+
+USERNAME = "monte"
+PASSWORD = "secret"
+
+
+def configure(llm: FakeLLMServer, cached: bool, fallbacks: str) -> None:
+    """points the service at the fake llm server, must run before it is imported"""
+    os.environ.update(
+        OPENAI_API_KEY="sk-benchmark",
+        OPENAI_BASE_URL=llm.openai_base_url,
+        ANTHROPIC_API_KEY="sk-benchmark",
+        ANTHROPIC_BASE_URL=llm.anthropic_base_url,
+        LLM_FALLBACKS=fallbacks,
+    )
+    os.environ.setdefault("SECRET_KEY", "0" * 64)
+    os.environ.setdefault("ALGORITHM", "HS256")
+    if not cached:
+        os.environ["VERDICT_CACHE_SIZE"] = "0"
+
+
+class ServiceThread:
+    """runs the service in uvicorn, in a daemon thread"""
+
+    def __init__(self):
+        from seiright.app.main import app
+
+        # the service logs every request and llm call at info level
+        logging.getLogger().setLevel(logging.WARNING)
+
+        self.socket = socket.socket()
+        self.socket.bind(("127.0.0.1", 0))
+        config = uvicorn.Config(app, log_level="warning", access_log=False)
+        self.server = uvicorn.Server(config)
+        self._thread = threading.Thread(
+            target=self.server.run, kwargs={"sockets": [self.socket]}, daemon=True
+        )
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.socket.getsockname()
+        return f"http://{host}:{port}"
+
+    def __enter__(self):
+        self._thread.start()
+        while not self.server.started:
+            time.sleep(0.01)
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.server.should_exit = True
+        self._thread.join()
+
+
+def summarize(latencies: list[float], errors: int, elapsed: float) -> dict:
+    total = len(latencies) + errors
+    result = {
+        "ok": len(latencies),
+        "error_rate": errors / total,
+        "requests_per_second": total / elapsed,
+    }
+    if len(latencies) >= 2:
+        q = statistics.quantiles(latencies, n=100, method="inclusive")
+        result.update(p50_ms=q[49] * 1e3, p95_ms=q[94] * 1e3, p99_ms=q[98] * 1e3)
+    return result
+
+
+async def run_level(
+    client: httpx.AsyncClient,
+    urls: Iterator[str],
+    concurrency: int,
+    requests: int,
+) -> dict:
+    latencies: list[float] = []
+    errors = 0
+    remaining = iter(range(requests))
+
+    async def worker() -> None:
+        nonlocal errors
+        for _ in remaining:
+            t0 = time.perf_counter()
+            try:
+                response = await client.get(
+                    "/check-compliance", params={"url": next(urls)}
+                )
+                response.raise_for_status()
+                latencies.append(time.perf_counter() - t0)
+            except httpx.HTTPError:
+                errors += 1
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return summarize(latencies, errors, time.perf_counter() - t0)
+
+
+async def load(
+    base_url: str, pages: FixtureServer, levels: list[int], requests: int
+) -> list[dict]:
+    limits = httpx.Limits(max_connections=max(levels), max_keepalive_connections=None)
+    async with httpx.AsyncClient(
+        base_url=base_url, limits=limits, timeout=300
+    ) as client:
+        token = await client.post(
+            "/token", data={"username": USERNAME, "password": PASSWORD}
+        )
+        token.raise_for_status()
+        client.headers["Authorization"] = f"Bearer {token.json()['access_token']}"
+
+        counter = itertools.count()
+        names = itertools.cycle(sorted(pages.pages))
+        urls = (pages.url(next(names), f"r={i}") for i in counter)
+
+        results = []
+        print(
+            f"{'concurrency':>11} {'requests':>9} {'errors':>7} {'req/s':>8} "
+            f"{'p50 (ms)':>9} {'p95 (ms)':>9} {'p99 (ms)':>9}"
+        )
+        for concurrency in levels:
+            result = {"concurrency": concurrency, "requests": requests}
+            result.update(await run_level(client, urls, concurrency, requests))  # type: ignore
+            results.append(result)
+            print(
+                f"{concurrency:>11} {requests:>9} {result['error_rate']:>7.1%} "
+                f"{result['requests_per_second']:>8.1f} {result.get('p50_ms', 0):>9.1f} "
+                f"{result.get('p95_ms', 0):>9.1f} {result.get('p99_ms', 0):>9.1f}"
+            )
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16, 64])
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--llm-latency", type=float, default=0.3)
+    parser.add_argument("--jitter", type=float, default=0.2)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0)
+    parser.add_argument("--fallbacks", default="", help="e.g. anthropic:claude-3-5")
+    parser.add_argument("--cached", action="store_true")
+    parser.add_argument("--json", help="path of the json report")
+    args = parser.parse_args()
+
+    llm = FakeLLMServer(
+        latency=args.llm_latency,
+        jitter=args.jitter,
+        error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate,
+    )
+    with FixtureServer() as pages, llm:
+        configure(llm, cached=args.cached, fallbacks=args.fallbacks)
+        with ServiceThread() as service:
+            results = asyncio.run(
+                load(service.base_url, pages, args.concurrency, args.requests)
+            )
+    print(f"llm calls: {llm.calls}")
+
+    if args.json:
+        params = {k: v for k, v in vars(args).items() if k != "json"}
+        write_report(args.json, "load", results, **params)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""Micro-benchmarks of the steps of a compliance check, except the llm call:
+downloading and extracting a page (`extract_text_from_url`, against the local
+fixture server), formatting it (`reformat_extracted_text`), building the prompt
+and the request, and authenticating a request.
+
+Run it from the root of the repository:
+
+    python -m benchmarks.bench_micro --repeat 200 --json micro.json
+
+The pages are the html fixtures plus a large generated page (`--large-mb`).
+"""
+
+import argparse
+import os
+import statistics
+import time
+from datetime import timedelta
+from typing import Callable
+
+os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+os.environ.setdefault("SECRET_KEY", "0" * 64)
+os.environ.setdefault("ALGORITHM", "HS256")
+
+from seiright.app.security import create_access_token  # noqa: E402
+from seiright.app.utils import UserStore  # noqa: E402
+from seiright.core._types import LLMProvider  # noqa: E402
+from seiright.core.assemble import ComplianceChecker  # noqa: E402
+from seiright.core.llms import OpenAILLM  # noqa: E402
+from seiright.core.web_crawler import (  # noqa: E402
+    extract_text_from_url,
+    reformat_extracted_text,
+)
+
+from .bench_auth import USERNAME, current_auth  # noqa: E402
+from .bench_extraction import generate_page  # noqa: E402
+from .report import write_report  # noqa: E402
+from .servers import FixtureServer  # noqa: E402
+
+
+def measure(call: Callable[[], object], repeat: int) -> dict:
+    call()
+    timings = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        call()
+        timings.append(time.perf_counter() - t0)
+    return {
+        "calls": repeat,
+        "mean_us": statistics.fmean(timings) * 1e6,
+        "min_us": min(timings) * 1e6,
+    }
+
+
+def page_cases(
+    server: FixtureServer, checker: ComplianceChecker, name: str
+) -> dict[str, Callable[[], object]]:
+    url = server.url(name)
+    text, title = extract_text_from_url(url)
+    page = reformat_extracted_text(text, title)
+    llm = checker.llm
+
+    def prompt() -> object:
+        user_prompt = checker.create_user_prompt(page)
+        llm.estimate_tokens(user_prompt)  # type: ignore
+        return llm.request_kwargs(user_prompt)  # type: ignore
+
+    return {
+        "extract_text_from_url": lambda: extract_text_from_url(url),
+        "reformat_extracted_text": lambda: reformat_extracted_text(text, title),
+        "prompt": prompt,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--large-mb", type=float, default=1.0)
+    parser.add_argument("--json", help="path of the json report")
+    args = parser.parse_args()
+
+    checker = ComplianceChecker(
+        llm_provider=LLMProvider.OPENAI, model="gpt-4o", llm=OpenAILLM("gpt-4o")
+    )
+    token = create_access_token({"sub": USERNAME}, timedelta(minutes=30))
+    auth = current_auth(UserStore())
+
+    results = []
+    print(f"{'case':<26} {'page':<14} {'calls':>7} {'mean (us)':>12} {'min (us)':>12}")
+
+    def run(case: str, page: str, call: Callable[[], object], repeat: int) -> None:
+        result = {"case": case, "page": page, **measure(call, repeat)}
+        results.append(result)
+        print(
+            f"{case:<26} {page:<14} {repeat:>7} {result['mean_us']:>12.1f} "
+            f"{result['min_us']:>12.1f}"
+        )
+
+    large = {"large.html": generate_page(args.large_mb)}
+    with FixtureServer(extra_pages=large) as server:
+        for name in sorted(server.pages):
+            # the large page is 100x the size of the fixtures
+            repeat = max(1, args.repeat // 20) if name in large else args.repeat
+            for case, call in page_cases(server, checker, name).items():
+                run(case, name, call, repeat)
+    run("auth", "-", lambda: auth(token), args.repeat * 10)
+
+    if args.json:
+        write_report(
+            args.json, "micro", results, repeat=args.repeat, large_mb=args.large_mb
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""Benchmark of the near duplicate index: lookups of new pages and of near
+duplicates of indexed pages, with hundreds of thousands of pages indexed.
+
+Run it from the root of the repository:
+
+    python -m benchmarks.bench_neardup --pages 200000 --json neardup.json
+
+The pages are random texts drawn from a small vocabulary, a near duplicate is an
+indexed page with a few words replaced.
+"""
+
+import argparse
+import random
+import time
+
+import numpy as np
+
+from seiright.core.neardup import NearDuplicateIndex
+
+from .report import write_report
+
+VOCABULARY = [f"w{i}" for i in range(5000)]
+
+
+def random_text(rng: random.Random, words: int) -> list[str]:
+    return rng.choices(VOCABULARY, k=words)
+
+
+def mutate(rng: random.Random, words: list[str], changes: int) -> list[str]:
+    words = list(words)
+    for i in rng.sample(range(len(words)), changes):
+        words[i] = rng.choice(VOCABULARY)
+    return words
+
+
+def lookups(
+    index: NearDuplicateIndex, signatures: list[np.ndarray]
+) -> tuple[np.ndarray, int]:
+    durations, found = [], 0
+    for signature in signatures:
+        t0 = time.perf_counter()
+        match = index.query(signature)
+        durations.append(time.perf_counter() - t0)
+        found += match is not None
+    return np.array(durations) * 1e6, found
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pages", type=int, default=200_000)
+    parser.add_argument("--words", type=int, default=400)
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("--changes", type=int, default=2)
+    parser.add_argument("--threshold", type=float, default=0.95)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="path of the json report")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    index = NearDuplicateIndex(threshold=args.threshold)
+    kept: list[list[str]] = []
+    signature_seconds = 0.0
+    t0 = time.perf_counter()
+    for i in range(args.pages):
+        words = random_text(rng, args.words)
+        if i < args.queries:
+            kept.append(words)
+        t1 = time.perf_counter()
+        signature = index.signature(" ".join(words))
+        signature_seconds += time.perf_counter() - t1
+        index.add(f"https://bank.test/{i}", signature, key=str(i))  # type: ignore
+    build_seconds = time.perf_counter() - t0
+
+    cases = {
+        "new page": [
+            index.signature(" ".join(random_text(rng, args.words)))
+            for _ in range(args.queries)
+        ],
+        "near duplicate": [
+            index.signature(" ".join(mutate(rng, words, args.changes)))
+            for words in kept
+        ],
+    }
+    results = [
+        {
+            "case": "index",
+            "build_seconds": build_seconds,
+            "signature_us": signature_seconds / args.pages * 1e6,
+        }
+    ]
+    print(f"indexed {len(index)} pages in {build_seconds:.1f}s")
+    print(f"signature of a page: {results[0]['signature_us']:.1f}us")
+    print(f"{'lookup':<16} {'mean us':>9} {'p99 us':>9} {'found':>7}")
+    for name, signatures in cases.items():
+        durations, found = lookups(index, signatures)  # type: ignore
+        results.append(
+            {
+                "case": name,
+                "mean_us": float(durations.mean()),
+                "p99_us": float(np.percentile(durations, 99)),
+                "found": found / len(signatures),
+            }
+        )
+        print(
+            f"{name:<16} {durations.mean():>9.1f} "
+            f"{np.percentile(durations, 99):>9.1f} {found / len(signatures):>7.1%}"
+        )
+
+    if args.json:
+        write_report(
+            args.json,
+            "neardup",
+            results,
+            **{k: v for k, v in vars(args).items() if k != "json"},
+        )
+
+
+if __name__ == "__main__":
+    main()
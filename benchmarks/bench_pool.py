@@ -0,0 +1,138 @@
+"""Benchmark of the extraction pool: latency of small pages while a few huge pages
+are parsed and formatted, in process (on the event loop) and in the pool, and
+throughput of the pool over huge pages with an increasing number of workers.
+
+Run it from the root of the repository:
+
+    python -m benchmarks.bench_pool --workers 1 2 4 --json pool.json
+
+A page goes through the cpu bound stages of a check: `aextract` (html parsing)
+then `arender` (rendering of the text sent to the llm). Throughput only scales up to the number of
+cores of the machine.
+"""
+
+import argparse
+import asyncio
+import statistics
+import sys
+import time
+
+from seiright.core._types import ExtractorConfig
+from seiright.core.workers import ExtractionPool
+
+from .bench_extraction import generate_page
+from .report import write_report
+
+CONFIG = ExtractorConfig()
+
+
+async def process(pool: ExtractionPool, body: bytes) -> float:
+    started = time.perf_counter()
+    page, _ = await pool.aextract(body, "utf-8", CONFIG)
+    await pool.arender(page)
+    return time.perf_counter() - started
+
+
+async def latency_under_load(
+    pool: ExtractionPool,
+    huge: bytes,
+    huge_pages: int,
+    small: bytes,
+    small_pages: int,
+    interval: float,
+) -> dict:
+    """small pages arrive every `interval` seconds while the huge pages are being
+    processed. The latency of a small page counts from its arrival, a blocked
+    event loop delays the start of its processing"""
+    await process(pool, small)
+
+    async def small_page(arrival: float) -> float:
+        await process(pool, small)
+        return time.perf_counter() - arrival
+
+    started = time.perf_counter()
+    huge_tasks = [asyncio.create_task(process(pool, huge)) for _ in range(huge_pages)]
+    small_tasks = []
+    for i in range(small_pages):
+        arrival = started + i * interval
+        await asyncio.sleep(max(0, arrival - time.perf_counter()))
+        small_tasks.append(asyncio.create_task(small_page(arrival)))
+    latencies = await asyncio.gather(*small_tasks)
+    await asyncio.gather(*huge_tasks)
+    q = statistics.quantiles(latencies, n=100, method="inclusive")
+    return {
+        "small_p50_ms": q[49] * 1e3,
+        "small_p99_ms": q[98] * 1e3,
+        "small_max_ms": max(latencies) * 1e3,
+        "total_seconds": time.perf_counter() - started,
+    }
+
+
+async def throughput(pool: ExtractionPool, huge: bytes, pages: int) -> dict:
+    started = time.perf_counter()
+    await asyncio.gather(*(process(pool, huge) for _ in range(pages)))
+    return {"pages_per_second": pages / (time.perf_counter() - started)}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--huge-mb", type=float, default=5)
+    parser.add_argument("--huge-pages", type=int, default=4)
+    parser.add_argument("--small-kb", type=float, default=20)
+    parser.add_argument("--small-pages", type=int, default=100)
+    parser.add_argument("--interval-ms", type=float, default=20)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--json", help="path of the json report")
+    args = parser.parse_args()
+
+    huge = generate_page(args.huge_mb, seed=1)
+    small = generate_page(args.small_kb / 1024, seed=2)
+    results = []
+
+    print(f"{'latency under load':<24} {'p50 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+    modes = {
+        # pages are never sent to the workers, they are processed on the event loop
+        "in process": ExtractionPool(min_bytes=sys.maxsize, min_chars=sys.maxsize),
+        "pool": ExtractionPool(workers=max(args.workers)),
+    }
+    for name, pool in modes.items():
+        if name == "pool":
+            pool.start()
+        result = asyncio.run(
+            latency_under_load(
+                pool,
+                huge,
+                args.huge_pages,
+                small,
+                args.small_pages,
+                args.interval_ms / 1e3,
+            )
+        )
+        pool.close()
+        results.append({"case": f"latency ({name})", **result})
+        print(
+            f"{name:<24} {result['small_p50_ms']:>8.1f} "
+            f"{result['small_p99_ms']:>8.1f} {result['small_max_ms']:>8.1f}"
+        )
+
+    print(f"\n{'throughput':<24} {'pages/s':>8}")
+    pages = max(args.workers) * 2
+    for workers in args.workers:
+        pool = ExtractionPool(workers=workers, min_bytes=0, min_chars=0)
+        pool.start()
+        result = asyncio.run(throughput(pool, huge, pages))
+        pool.close()
+        results.append({"case": "throughput", "workers": workers, **result})
+        print(f"{f'{workers} workers':<24} {result['pages_per_second']:>8.1f}")
+
+    if args.json:
+        write_report(
+            args.json,
+            "pool",
+            results,
+            **{k: v for k, v in vars(args).items() if k != "json"},
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""Micro-benchmark of the per user quotas: cost of the quota check of a request with
+every backend, and of a request of a user without limits.
+
+Run it from the root of the repository:
+
+    python -m benchmarks.bench_quotas --requests 20000 --json quotas.json
+
+The limits are high enough for every request to be granted, so that each check
+takes from the buckets (and, with sqlite, writes them back).
+"""
+
+import argparse
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable
+
+from seiright.app.api_models import User, UserQuota
+from seiright.app.quotas import MemoryQuotaBackend, SQLiteQuotaBackend, UserQuotas
+
+from .report import write_report
+
+USERS = 100
+TOKENS_PER_PAGE = 4000
+
+
+def measure(call: Callable[[int], object], repeat: int) -> dict:
+    call(0)
+    t0 = time.perf_counter()
+    for i in range(repeat):
+        call(i)
+    elapsed = time.perf_counter() - t0
+    return {"requests": repeat, "us_per_request": elapsed / repeat * 1e6}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--json", help="path of the json report")
+    args = parser.parse_args()
+
+    quota = UserQuota(requests_per_minute=1e9, tokens_per_minute=1e12)
+    users = [User(username=f"user-{i}", quota=quota) for i in range(USERS)]
+    unlimited = [User(username=f"user-{i}") for i in range(USERS)]
+    with tempfile.TemporaryDirectory() as tmp:
+        cases = {
+            "unlimited": (UserQuotas(), unlimited),
+            "memory": (UserQuotas(MemoryQuotaBackend()), users),
+            "sqlite (memory)": (UserQuotas(SQLiteQuotaBackend()), users),
+            "sqlite (file)": (
+                UserQuotas(SQLiteQuotaBackend(Path(tmp) / "quotas.db")),
+                users,
+            ),
+        }
+
+        results = []
+        print(f"{'backend':<20} {'requests':>9} {'us/request':>12}")
+        for name, (user_quotas, case_users) in cases.items():
+
+            def check(i: int) -> None:
+                user_quotas.check(case_users[i % USERS], tokens=TOKENS_PER_PAGE)
+
+            result = {"case": name, **measure(check, args.requests)}
+            user_quotas.close()
+            results.append(result)
+            print(f"{name:<20} {args.requests:>9} {result['us_per_request']:>12.1f}")
+
+    if args.json:
+        write_report(args.json, "quotas", results, requests=args.requests)
+
+
+if __name__ == "__main__":
+    main()
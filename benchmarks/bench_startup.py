@@ -0,0 +1,128 @@
+"""Cold start benchmark: time to import the service and time until `/ready`
+answers, in fresh processes, with a stubbed secrets backend so that it runs
+offline.
+
+Run it from the root of the repository:
+
+    python -m benchmarks.bench_startup --runs 5 --secrets-latency 0.2 --json startup.json
+
+The `eager sdk imports` case imports the provider sdks and boto3 before the
+service, as it did before they were imported on first use.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+from .report import write_report
+
+CASES = {"lazy": [], "eager sdk imports": ["--eager"]}
+
+
+def child(eager: bool, secrets_latency: float) -> None:
+    """runs in the measured process: imports the service, serves it and polls
+    `/ready`, then prints the timings"""
+    t0 = time.perf_counter()
+    if eager:
+        import anthropic  # noqa: F401
+        import boto3  # noqa: F401
+        import openai  # noqa: F401
+
+    from seiright.utils.utils import secret_cache
+
+    from .servers import StubSecretsBackend
+
+    secret_cache.backend = StubSecretsBackend(latency=secrets_latency)
+    import seiright.app.main  # noqa: F401
+
+    imported = time.perf_counter()
+
+    import httpx
+
+    from .bench_load import ServiceThread
+
+    with ServiceThread() as service:
+        started = time.perf_counter()
+        while httpx.get(f"{service.base_url}/ready").status_code != 200:
+            time.sleep(0.005)
+        ready = time.perf_counter()
+    print(
+        json.dumps(
+            {
+                "import_ms": (imported - t0) * 1e3,
+                "started_ms": (started - t0) * 1e3,
+                "ready_ms": (ready - t0) * 1e3,
+            }
+        )
+    )
+
+
+def run(args: list[str]) -> dict:
+    env = {
+        k: v
+        for k, v in os.environ.items()
+        if k not in ("OPENAI_API_KEY", "ANTHROPIC_API_KEY")
+    }
+    env.setdefault("SECRET_KEY", "0" * 64)
+    env.setdefault("ALGORITHM", "HS256")
+    t0 = time.perf_counter()
+    output = subprocess.run(
+        [sys.executable, "-m", "benchmarks.bench_startup", "--child", *args],
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+    timings = json.loads(output.strip().splitlines()[-1])
+    timings["process_ms"] = (time.perf_counter() - t0) * 1e3
+    return timings
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--secrets-latency", type=float, default=0.2)
+    parser.add_argument("--json", help="path of the json report")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--eager", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        child(args.eager, args.secrets_latency)
+        return
+
+    results = []
+    print(f"{'case':<20} {'import ms':>10} {'ready ms':>10} {'process ms':>11}")
+    for name, case_args in CASES.items():
+        runs = [
+            run([*case_args, "--secrets-latency", str(args.secrets_latency)])
+            for _ in range(args.runs)
+        ]
+        result = {
+            "case": name,
+            **{
+                metric: statistics.median(r[metric] for r in runs)
+                for metric in ("import_ms", "started_ms", "ready_ms", "process_ms")
+            },
+        }
+        results.append(result)
+        print(
+            f"{name:<20} {result['import_ms']:>10.0f} {result['ready_ms']:>10.0f} "
+            f"{result['process_ms']:>11.0f}"
+        )
+
+    if args.json:
+        write_report(
+            args.json,
+            "startup",
+            results,
+            runs=args.runs,
+            secrets_latency=args.secrets_latency,
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+"""JSON reports of the benchmarks, and their comparison.
+
+Every benchmark writes `{"benchmark": ..., "environment": ..., "results": [...]}`
+with `--json`. A result is identified by its non metric fields (case, page size,
+concurrency...), its metrics are recognised by their suffix. Comparing the
+reports of two runs flags the metrics which got worse by more than a threshold:
+
+    python -m benchmarks.bench_load --json before.json
+    ... change ...
+    python -m benchmarks.bench_load --json after.json
+    python -m benchmarks.report before.json after.json --threshold 0.1
+
+It exits with status 1 if a metric regressed, so it can gate a deployment.
+"""
+
+import argparse
+import json
+import platform
+import subprocess
+import sys
+import time
+from typing import Any
+
+# metric suffixes, and whether lower is better
+METRICS = {
+    "seconds": True,
+    "_ms": True,
+    "_us": True,
+    "us_per_request": True,
+    "peak_mb": True,
+    "held_mb": True,
+    "error_rate": True,
+    "per_second": False,
+}
+
+
+def _git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def environment() -> dict[str, Any]:
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "processor": platform.processor() or platform.machine(),
+        "commit": _git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+    }
+
+
+def write_report(path: str, benchmark: str, results: list[dict], **params) -> None:
+    """writes the results of a benchmark along with its parameters and the
+    environment it ran in"""
+    report = {
+        "benchmark": benchmark,
+        "environment": environment(),
+        "params": params,
+        "results": results,
+    }
+    with open(path, "w") as f:
+        json.dump(report, f, indent=2)
+
+
+def lower_is_better(field: str) -> bool | None:
+    """`None` if the field isn't a metric"""
+    for suffix, lower in METRICS.items():
+        if field.endswith(suffix):
+            return lower
+    return None
+
+
+def _key(result: dict) -> tuple:
+    return tuple(
+        sorted((k, v) for k, v in result.items() if lower_is_better(k) is None)
+    )
+
+
+def compare_reports(before: dict, after: dict, threshold: float = 0.1) -> list[dict]:
+    """relative change of every metric present in both reports
+
+    Returns:
+        one row per metric, with `regression` set when it got worse by more than
+        `threshold` (a fraction)
+    """
+    previous = {_key(r): r for r in before["results"]}
+    rows = []
+    for result in after["results"]:
+        old = previous.get(_key(result))
+        if old is None:
+            continue
+        for field, value in result.items():
+            lower = lower_is_better(field)
+            if lower is None or not old.get(field):
+                continue
+            change = (value - old[field]) / old[field]
+            worse = change if lower else -change
+            rows.append(
+                {
+                    "result": dict(_key(result)),
+                    "metric": field,
+                    "before": old[field],
+                    "after": value,
+                    "change": change,
+                    "regression": worse > threshold,
+                }
+            )
+    return rows
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("before", help="report of the reference run")
+    parser.add_argument("after", help="report of the new run")
+    parser.add_argument("--threshold", type=float, default=0.1)
+    args = parser.parse_args()
+
+    with open(args.before) as f:
+        before = json.load(f)
+    with open(args.after) as f:
+        after = json.load(f)
+    if before["benchmark"] != after["benchmark"]:
+        sys.exit(f"{before['benchmark']} and {after['benchmark']} aren't comparable")
+
+    rows = compare_reports(before, after, threshold=args.threshold)
+    for row in rows:
+        name = ", ".join(f"{k}={v}" for k, v in row["result"].items())
+        flag = "  REGRESSION" if row["regression"] else ""
+        print(
+            f"{name:<48} {row['metric']:<20} {row['before']:>12.3f} "
+            f"{row['after']:>12.3f} {row['change']:>+8.1%}{flag}"
+        )
+    if any(row["regression"] for row in rows):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
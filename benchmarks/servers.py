@@ -0,0 +1,296 @@
+"""Local stand-ins for the services a compliance check talks to, so that the
+benchmarks run offline:
+
+- `FixtureServer` serves saved html pages (`benchmarks/fixtures`), the query
+  string is ignored so that every request can use a distinct url.
+- `FakeLLMServer` answers the OpenAI chat completions and Anthropic messages apis
+  with a verdict, after a configurable latency, and injects server errors and
+  rate limits at configurable rates.
+- `StubSecretsBackend` answers the secrets of the service after a configurable
+  latency, in place of AWS Secrets Manager.
+
+Both run in a daemon thread and are used as context managers:
+
+    with FixtureServer() as pages, FakeLLMServer(latency=0.5) as llm:
+        os.environ["OPENAI_BASE_URL"] = llm.openai_base_url
+        ...
+        checker.chat(pages.url("home.html"))
+"""
+
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any
+from urllib.parse import urlsplit
+
+FIXTURES_DIR = Path(__file__).parent / "fixtures"
+
+# claims the fake llm flags as non compliant
+NON_COMPLIANT_MARKERS = ("guaranteed", "risk free", "cannot lose")
+
+
+class _Server:
+    handler: type[BaseHTTPRequestHandler]
+
+    def __init__(self):
+        self._httpd: ThreadingHTTPServer | None = None
+        self._thread: threading.Thread | None = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._httpd.server_address[:2]  # type: ignore
+        return f"http://{host}:{port}"
+
+    def start(self) -> None:
+        self._httpd = ThreadingHTTPServer(("127.0.0.1", 0), self.handler)
+        self._httpd.daemon_threads = True
+        self._httpd.request_queue_size = 1024
+        self._httpd.owner = self  # type: ignore
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        if self._httpd is not None:
+            self._httpd.shutdown()
+            self._httpd.server_close()
+            self._httpd = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format: str, *args: Any) -> None:
+        pass
+
+    def handle(self) -> None:
+        # clients hang up early, e.g. the extractor once it has enough text
+        try:
+            super().handle()
+        except ConnectionError:
+            pass
+
+    def send_body(
+        self, status: int, body: bytes, content_type: str, headers: dict | None = None
+    ) -> None:
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class _FixtureHandler(_Handler):
+    def do_GET(self) -> None:
+        server: FixtureServer = self.server.owner  # type: ignore
+        name = urlsplit(self.path).path.lstrip("/")
+        page = server.pages.get(name)
+        if page is None:
+            self.send_body(404, b"not found", "text/plain")
+            return
+        if server.latency:
+            time.sleep(server.latency)
+        self.send_body(200, page, "text/html; charset=utf-8")
+
+
+class FixtureServer(_Server):
+    """serves the html fixtures, and `extra_pages` (name to html)
+
+    Args:
+        directory: directory of the `.html` fixtures
+        extra_pages: more pages, e.g. large generated ones
+        latency: seconds waited before answering a request
+    """
+
+    handler = _FixtureHandler
+
+    def __init__(
+        self,
+        directory: Path = FIXTURES_DIR,
+        extra_pages: dict[str, bytes] | None = None,
+        latency: float = 0.0,
+    ):
+        super().__init__()
+        self.pages = {path.name: path.read_bytes() for path in directory.glob("*.html")}
+        self.pages.update(extra_pages or {})
+        self.latency = latency
+
+    def url(self, name: str, query: str = "") -> str:
+        return f"{self.base_url}/{name}" + (f"?{query}" if query else "")
+
+
+class _LLMHandler(_Handler):
+    def do_POST(self) -> None:
+        server: FakeLLMServer = self.server.owner  # type: ignore
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        path = urlsplit(self.path).path
+        if path.endswith("/chat/completions"):
+            respond = server.openai_response
+        elif path.endswith("/messages"):
+            respond = server.anthropic_response
+        else:
+            self.send_body(404, b"{}", "application/json")
+            return
+
+        time.sleep(server.delay())
+        failure = server.failure()
+        if failure is not None:
+            status, headers = failure
+            error = {"type": "error", "error": {"type": "injected", "message": "boom"}}
+            self.send_body(
+                status, json.dumps(error).encode(), "application/json", headers
+            )
+            return
+        request = json.loads(body)
+        response = respond(request, prompt_tokens=len(body) // 4)
+        self.send_body(
+            200, json.dumps(response).encode(), "application/json", server.headers
+        )
+
+
+class FakeLLMServer(_Server):
+    """OpenAI and Anthropic compatible stand-in. The verdict is non compliant when
+    the page contains one of `NON_COMPLIANT_MARKERS`
+
+    Args:
+        latency: seconds waited before answering a call
+        jitter: extra seconds, drawn uniformly in `[0, jitter]`
+        error_rate: fraction of the calls answered with a 500
+        rate_limit_rate: fraction of the calls answered with a 429
+        retry_after: `Retry-After` of the 429s
+        seed: seed of the random draws
+    """
+
+    handler = _LLMHandler
+    # large enough for the client side rate limiting to stay out of the way
+    headers = {
+        "x-ratelimit-limit-requests": "100000",
+        "x-ratelimit-remaining-requests": "100000",
+        "x-ratelimit-limit-tokens": "100000000",
+        "x-ratelimit-remaining-tokens": "100000000",
+    }
+
+    def __init__(
+        self,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        error_rate: float = 0.0,
+        rate_limit_rate: float = 0.0,
+        retry_after: float = 0.1,
+        seed: int = 0,
+    ):
+        super().__init__()
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after = retry_after
+        self.calls = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    @property
+    def openai_base_url(self) -> str:
+        return f"{self.base_url}/v1"
+
+    @property
+    def anthropic_base_url(self) -> str:
+        return self.base_url
+
+    def delay(self) -> float:
+        with self._lock:
+            self.calls += 1
+            return self.latency + self._random.uniform(0, self.jitter)
+
+    def failure(self) -> tuple[int, dict[str, str]] | None:
+        """status and headers of an injected failure, if the call fails"""
+        with self._lock:
+            draw = self._random.random()
+        if draw < self.error_rate:
+            return 500, {}
+        if draw < self.error_rate + self.rate_limit_rate:
+            return 429, {"retry-after": str(self.retry_after)}
+        return None
+
+    @staticmethod
+    def verdict(request: dict) -> dict:
+        text = json.dumps(request["messages"][-1]["content"]).lower()
+        flagged = [m for m in NON_COMPLIANT_MARKERS if m in text]
+        return {
+            "is_compliant": not flagged,
+            "reasoning": f"flagged claims: {', '.join(flagged)}" if flagged else "ok",
+            "confidence_score": 0.9,
+        }
+
+    def openai_response(self, request: dict, prompt_tokens: int) -> dict:
+        return {
+            "id": "chatcmpl-fake",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": request["model"],
+            "choices": [
+                {
+                    "index": 0,
+                    "message": {
+                        "role": "assistant",
+                        "content": json.dumps(self.verdict(request)),
+                    },
+                    "finish_reason": "stop",
+                }
+            ],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": 40,
+                "total_tokens": prompt_tokens + 40,
+                "prompt_tokens_details": {"cached_tokens": 0},
+            },
+        }
+
+    def anthropic_response(self, request: dict, prompt_tokens: int) -> dict:
+        return {
+            "id": "msg_fake",
+            "type": "message",
+            "role": "assistant",
+            "model": request["model"],
+            "content": [
+                {
+                    "type": "tool_use",
+                    "id": "toolu_fake",
+                    "name": "compliance_response",
+                    "input": self.verdict(request),
+                }
+            ],
+            "stop_reason": "tool_use",
+            "stop_sequence": None,
+            "usage": {
+                "input_tokens": prompt_tokens,
+                "output_tokens": 40,
+                "cache_read_input_tokens": 0,
+                "cache_creation_input_tokens": 0,
+            },
+        }
+
+
+class StubSecretsBackend:
+    """secrets backend (`SecretCache`) answering `<name>-stub` after `latency`
+    seconds"""
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.fetches = 0
+
+    def fetch(self, name: str) -> str:
+        time.sleep(self.latency)
+        self.fetches += 1
+        return f"{name}-stub"
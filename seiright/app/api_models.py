@@ -1,6 +1,13 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field, HttpUrl
 
-from ..core._types import LLMProvider
+from ..core._types import (
+    EnsembleVerdict,
+    Job,
+    JobStatus,
+    LLMProvider,
+    LLMResponse,
+    SiteComplianceReport,
+)
 
 
 class Token(BaseModel):
@@ -12,10 +19,18 @@ class TokenData(BaseModel):
     username: str | None = None
 
 
+class UserQuota(BaseModel):
+    """limits of a user, `None` for the default of the service"""
+
+    requests_per_minute: float | None = Field(default=None, gt=0)
+    tokens_per_minute: float | None = Field(default=None, gt=0)
+
+
 class User(BaseModel):
     username: str
     display_name: str | None = None
     email: str | None = None
+    quota: UserQuota | None = None
 
 
 class UserInDB(User):
@@ -29,6 +44,77 @@ class CheckComplianceResponse(BaseModel):
     reason: str
     user: str
     url: str
+    reused_from: str | None = None
+
+
+class BatchCheckComplianceRequest(BaseModel):
+    urls: list[str] = Field(min_length=1)
+
+
+class SiteCheckComplianceRequest(BaseModel):
+    url: str
+    max_pages: int = Field(default=100, gt=0)
+    max_depth: int = Field(default=3, ge=0)
+
+
+class SiteCheckComplianceResponse(SiteComplianceReport):
+    user: str
+
+
+class EnsembleComplianceResponse(EnsembleVerdict):
+    user: str
+    url: str
+
+
+class CheckComplianceError(BaseModel):
+    error: str
+    user: str
+    url: str
+
+
+class JobSubmitRequest(BaseModel):
+    url: str
+    webhook_url: HttpUrl | None = None
+
+
+class JobResponse(BaseModel):
+    id: str
+    status: JobStatus
+    url: str
+    user: str
+    created_at: float
+    updated_at: float
+    result: CheckComplianceResponse | None = None
+    error: str | None = None
+
+
+def compliance_response(
+    llm_response: LLMResponse, username: str, url: str
+) -> CheckComplianceResponse:
+    return CheckComplianceResponse(
+        is_compliant=llm_response.is_compliant,
+        confidence_score=llm_response.confidence_score,
+        reason=llm_response.reasoning,
+        user=username,
+        url=url,
+        llm_provider=llm_response.llm_provider.value,
+        reused_from=llm_response.reused_from,
+    )
+
+
+def job_response(job: Job) -> JobResponse:
+    return JobResponse(
+        id=job.id,
+        status=job.status,
+        url=job.url,
+        user=job.user,
+        created_at=job.created_at,
+        updated_at=job.updated_at,
+        result=(
+            compliance_response(job.result, job.user, job.url) if job.result else None
+        ),
+        error=job.error,
+    )
 
 
 def get_user(db, username: str):
@@ -1,35 +1,155 @@
+import asyncio
 import logging
 import os
+from contextlib import asynccontextmanager
 from datetime import timedelta
 from typing import Annotated, Dict
 
 from fastapi import Depends, FastAPI, HTTPException, status
+from fastapi.responses import Response, StreamingResponse
+from fastapi.concurrency import run_in_threadpool
 from fastapi.security import OAuth2PasswordRequestForm
-from jose import JWTError, jwt
+from jose import JWTError
 
-from ..core._types import LLMProvider
-from ..core.assemble import ComplianceChecker
-from ..utils.utils import secret
-from .api_models import CheckComplianceResponse, Token, TokenData, User, get_user
+from ..core import factory
+from ..core._types import BoilerplateStats, CacheStats, RouteStats
+from ..core.jobs import (
+    JobQueue,
+    JobStore,
+    QueueFullError,
+    UnsafeWebhookError,
+    acheck_webhook_url,
+)
+from ..core.metrics import CONTENT_TYPE, REGISTRY, gauge
+from ..core.ratelimit import BATCH, llm_scheduler, priority
+from ..core.site_crawler import SiteCrawler
+from ..core.web_crawler import aclose_http_client
+from ..utils.utils import secret_cache
+from .api_models import (
+    BatchCheckComplianceRequest,
+    CheckComplianceError,
+    CheckComplianceResponse,
+    EnsembleComplianceResponse,
+    JobResponse,
+    JobSubmitRequest,
+    SiteCheckComplianceRequest,
+    SiteCheckComplianceResponse,
+    Token,
+    TokenData,
+    User,
+    compliance_response,
+    get_user,
+    job_response,
+)
+from .quotas import MemoryQuotaBackend, SQLiteQuotaBackend, UserQuotas
 from .security import (
     access_token_expire_time,
-    algorithm,
     authenticate_user,
     create_access_token,
     oauth2_scheme,
-    secret_key,
+    verify_token,
 )
-from .utils import read_db
+from .utils import UserStore, get_env_var
 
-app = FastAPI()
-logging.basicConfig(level=logging.INFO)
-compliance_checker = ComplianceChecker(llm_provider=LLMProvider.OPENAI, model="gpt4o")
-openai_api_key = secret(secret_string="openai-api-key")
 
-# NOTE: Need to create an enviornment variable because LLM expects this key
-# otherwise it throws an error
-# TODO: Think of better way to pass around api key
-os.environ["OPENAI_API_KEY"] = openai_api_key
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # the secrets load in the background, /ready reports when they are loaded
+    secrets_task = asyncio.create_task(secret_cache.run(required_secrets))
+    if extraction_pool is not None:
+        await asyncio.to_thread(extraction_pool.start)
+    job_queue.start()
+    yield
+    secrets_task.cancel()
+    await job_queue.aclose()
+    await compliance_checker.aclose()
+    if ensemble_checker is not None:
+        await ensemble_checker.aclose()
+    await aclose_http_client()
+    factory.close_checker(compliance_checker)
+    job_store.close()
+    user_quotas.close()
+
+
+app = FastAPI(lifespan=lifespan)
+logging.basicConfig(level=logging.INFO)
+compliance_checker = factory.build_checker()
+verdict_cache = compliance_checker.verdict_cache
+page_cache = compliance_checker.page_cache
+extractor_config = compliance_checker.extractor_config
+boilerplate_filter = compliance_checker.boilerplate
+extraction_pool = compliance_checker.extraction_pool
+llm_router = compliance_checker.llm
+ensemble_checker = factory.build_ensemble(compliance_checker)
+ensemble_members = factory.ensemble_members()
+user_store = UserStore()
+# with `QUOTA_DB` the budgets of the users are shared by the workers of the service
+user_quotas = UserQuotas(
+    backend=(
+        SQLiteQuotaBackend(os.environ["QUOTA_DB"])
+        if os.getenv("QUOTA_DB")
+        else MemoryQuotaBackend()
+    ),
+    requests_per_minute=float(get_env_var("USER_REQUESTS_PER_MINUTE", default_value=0))
+    or None,
+    tokens_per_minute=float(get_env_var("USER_TOKENS_PER_MINUTE", default_value=0))
+    or None,
+)
+# estimated llm tokens of a page, taken from the quota of the user before a check
+quota_tokens_per_page = int(get_env_var("QUOTA_TOKENS_PER_PAGE", default_value=4000))
+# api keys set in the environment (e.g. local runs and benchmarks) take precedence
+required_secrets = sorted(
+    {
+        f"{provider}-api-key"
+        for provider, _ in factory.router_members() + ensemble_members
+        if not os.getenv(f"{provider.upper()}_API_KEY")
+    }
+)
+secret_cache.ttl = float(get_env_var("SECRETS_TTL", default_value=60 * 60))
+job_store = JobStore(db_path=get_env_var("JOB_DB", default_value=":memory:"))
+job_queue = JobQueue(
+    compliance_checker,
+    job_store,
+    workers=int(get_env_var("JOB_WORKERS", default_value=4)),
+    max_queued=int(get_env_var("JOB_MAX_QUEUED", default_value=100)),
+    retention=float(get_env_var("JOB_RETENTION", default_value=24 * 60 * 60)),
+    webhook_payload=lambda job: job_response(job).model_dump(mode="json"),
+)
+gauge(
+    "seiright_verdict_cache_entries",
+    "Number of verdicts in the memory tier of the verdict cache",
+    function=lambda: verdict_cache.stats().size,
+)
+gauge(
+    "seiright_verdict_cache_lookups",
+    "Lookups of the verdict cache since the start, by result",
+    ("result",),
+    function=lambda: {
+        ("hit",): verdict_cache.stats().hits,
+        ("miss",): verdict_cache.stats().misses,
+    },
+)
+gauge(
+    "seiright_job_queue_depth",
+    "Number of jobs waiting for a worker",
+    function=lambda: job_queue.depth,
+)
+gauge(
+    "seiright_llm_waiting_calls",
+    "Number of llm calls waiting for rate limit budget, by model",
+    ("model",),
+    function=lambda: {(k,): v for k, v in llm_scheduler.waiting().items()},
+)
+gauge(
+    "seiright_inflight_checks",
+    "Number of distinct page checks in flight",
+    function=lambda: compliance_checker.inflight.in_flight,
+)
+gauge(
+    "seiright_coalesced_checks",
+    "Number of checks served by a check already in flight, since the start",
+    function=lambda: compliance_checker.inflight.coalesced,
+)
 
 
 async def get_current_user(token: Annotated[str, Depends(oauth2_scheme())]) -> User:
@@ -47,15 +167,13 @@ async def get_current_user(token: Annotated[str, Depends(oauth2_scheme())]) -> U
         headers={"WWW-Authenticate": "Bearer"},
     )
     try:
-        payload = jwt.decode(token, secret_key(), algorithms=[algorithm()])
-        username: str | None = payload.get("sub")  # type: ignore
+        username = verify_token(token)
         if username is None:
             raise credentials_exception
         token_data = TokenData(username=username)
     except JWTError:
         raise credentials_exception
-    db = read_db()
-    user = get_user(db, username=token_data.username)  # type: ignore
+    user = get_user(user_store.users(), username=token_data.username)  # type: ignore
     if user is None:
         raise credentials_exception
     return user
@@ -71,23 +189,286 @@ async def check_compliance(
         current_user: user information required for authentication
         url: url to read and check compliance for
 
+    Raises:
+        HTTPException: `429` (with `Retry-After`) if the user is out of quota
+
     Returns:
         A Dictionary with user information and compliance information
     """
-    compliance_check = compliance_checker.chat(url)
-    return CheckComplianceResponse(
-        is_compliant=compliance_check.is_compliant,
-        confidence_score=compliance_check.confidence_score,
-        reason=compliance_check.reasoning,
-        user=current_user.username,
-        url=url,
-        llm_provider=compliance_check.llm_provider.value,
+    await user_quotas.acheck(current_user, tokens=quota_tokens_per_page)
+    compliance_check = await compliance_checker.achat(url)
+    return compliance_response(compliance_check, current_user.username, url)
+
+
+@app.get("/check-compliance/ensemble")
+async def check_compliance_ensemble(
+    current_user: Annotated[User, Depends(get_current_user)],
+    url: str,
+    compare: bool = False,
+) -> EnsembleComplianceResponse:
+    """Checks the page with every model of the ensemble (`ENSEMBLE_MODELS`)
+    concurrently. Returns as soon as a quorum of models agree, unless `compare` is
+    set, in which case every model is awaited
+
+    Args:
+        current_user: user information required for authentication
+        url: url to read and check compliance for
+        compare: whether to wait for the verdict of every model
+
+    Raises:
+        HTTPException: Raises an exception if no ensemble is configured
+        HTTPException: `429` (with `Retry-After`) if the user is out of quota
+
+    Returns:
+        verdict of the ensemble along with the verdict, latency and confidence of
+        every model
+    """
+    if ensemble_checker is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Ensemble mode is not configured, set ENSEMBLE_MODELS",
+        )
+    await user_quotas.acheck(
+        current_user, tokens=quota_tokens_per_page * len(ensemble_members)
+    )
+    verdict = await ensemble_checker.achat(url, compare=compare)
+    return EnsembleComplianceResponse(
+        **verdict.model_dump(), user=current_user.username, url=url
+    )
+
+
+@app.post("/check-compliance/batch")
+async def check_compliance_batch(
+    current_user: Annotated[User, Depends(get_current_user)],
+    batch: BatchCheckComplianceRequest,
+) -> StreamingResponse:
+    """Checks a batch of pages concurrently. Results are streamed back as
+    newline delimited json in the order they finish, a failing url produces an
+    error line without aborting the rest of the batch.
+
+    Args:
+        current_user: user information required for authentication
+        batch: urls to read and check compliance for
+
+    Raises:
+        HTTPException: Raises an exception if the batch is larger than `BATCH_MAX_URLS`
+        HTTPException: `429` (with `Retry-After`) if the user is out of quota
+
+    Returns:
+        A stream of `CheckComplianceResponse` (or `CheckComplianceError`) lines
+    """
+    max_urls = int(get_env_var("BATCH_MAX_URLS", default_value=500))
+    if len(batch.urls) > max_urls:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"A batch can have at most {max_urls} urls",
+        )
+    await user_quotas.acheck(
+        current_user, tokens=quota_tokens_per_page * len(batch.urls)
     )
 
+    async def results():
+        # batch checks give way to interactive ones when the llm budget is short
+        with priority(BATCH):
+            async for url, result in compliance_checker.achat_many(
+                batch.urls,
+                max_fetches=int(get_env_var("BATCH_MAX_FETCHES", default_value=8)),
+                max_llm_calls=int(get_env_var("BATCH_MAX_LLM_CALLS", default_value=4)),
+            ):
+                if isinstance(result, Exception):
+                    line = CheckComplianceError(
+                        error=f"{type(result).__name__}: {result}",
+                        user=current_user.username,
+                        url=url,
+                    )
+                else:
+                    line = compliance_response(result, current_user.username, url)
+                yield line.model_dump_json() + "\n"
+
+    return StreamingResponse(results(), media_type="application/x-ndjson")
+
+
+@app.post("/check-compliance/site")
+async def check_compliance_site(
+    current_user: Annotated[User, Depends(get_current_user)],
+    site: SiteCheckComplianceRequest,
+) -> SiteCheckComplianceResponse:
+    """Crawls a whole site, starting from the given url, and checks every page of it.
+    Pages are discovered from the sitemap and same origin links.
+
+    Args:
+        current_user: user information required for authentication
+        site: root url of the site and crawl limits
+
+    Raises:
+        HTTPException: Raises an exception if `max_pages` is larger than `SITE_MAX_PAGES`
+        HTTPException: `429` (with `Retry-After`) if the user is out of quota
+
+    Returns:
+        verdict of every page and a site level summary
+    """
+    max_pages = int(get_env_var("SITE_MAX_PAGES", default_value=500))
+    if site.max_pages > max_pages:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=f"A site crawl can have at most {max_pages} pages",
+        )
+    await user_quotas.acheck(
+        current_user, tokens=quota_tokens_per_page * site.max_pages
+    )
+    crawler = SiteCrawler(
+        max_pages=site.max_pages,
+        max_depth=site.max_depth,
+        concurrency=int(get_env_var("SITE_MAX_FETCHES", default_value=16)),
+        per_host_delay=float(get_env_var("SITE_PER_HOST_DELAY", default_value=0)),
+        extractor_config=extractor_config,
+    )
+    with priority(BATCH):
+        report = await compliance_checker.acheck_site(
+            site.url,
+            crawler=crawler,
+            max_llm_calls=int(get_env_var("BATCH_MAX_LLM_CALLS", default_value=4)),
+        )
+    return SiteCheckComplianceResponse(
+        **report.model_dump(), user=current_user.username
+    )
+
+
+@app.post("/check-compliance/jobs", status_code=status.HTTP_202_ACCEPTED)
+async def submit_compliance_job(
+    current_user: Annotated[User, Depends(get_current_user)],
+    job: JobSubmitRequest,
+) -> JobResponse:
+    """Queues a compliance check and returns straight away. The job is run by a
+    pool of workers, poll `/check-compliance/jobs/{job_id}` for its result or pass
+    a `webhook_url` the finished job is posted to.
+
+    Args:
+        current_user: user information required for authentication
+        job: url to check and optional webhook
+
+    Raises:
+        HTTPException: Raises an exception if the webhook isn't a public host
+        HTTPException: Raises an exception if the queue is full
+        HTTPException: `429` (with `Retry-After`) if the user is out of quota
+
+    Returns:
+        the queued job
+    """
+    webhook_url = str(job.webhook_url) if job.webhook_url is not None else None
+    if webhook_url is not None:
+        try:
+            await acheck_webhook_url(webhook_url)
+        except UnsafeWebhookError as e:
+            raise HTTPException(
+                status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=str(e)
+            )
+    await user_quotas.acheck(current_user, tokens=quota_tokens_per_page)
+    try:
+        queued = await job_queue.asubmit(
+            job.url, user=current_user.username, webhook_url=webhook_url
+        )
+    except QueueFullError as e:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=f"Job queue is full: {e}",
+        )
+    return job_response(queued)
+
+
+@app.get("/check-compliance/jobs/{job_id}")
+async def get_compliance_job(
+    current_user: Annotated[User, Depends(get_current_user)],
+    job_id: str,
+) -> JobResponse:
+    """Returns the status of a job, along with its result once it finished
+
+    Args:
+        current_user: user information required for authentication
+        job_id: id returned when the job was submitted
+
+    Raises:
+        HTTPException: Raises an exception if the user has no such job
+
+    Returns:
+        the job
+    """
+    job = await job_queue.aget(job_id)
+    if job is None or job.user != current_user.username:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Job not found"
+        )
+    return job_response(job)
+
+
+@app.get("/ready")
+async def ready() -> Dict:
+    """readiness probe: `503` until the secrets of the service are loaded"""
+    if required_secrets and not secret_cache.loaded:
+        detail = "loading secrets"
+        if secret_cache.error is not None:
+            detail += f": {secret_cache.error!r}"
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=detail
+        )
+    return {"status": "ready"}
+
+
+@app.get("/metrics")
+async def metrics() -> Response:
+    """metrics in the Prometheus text format: per stage latency histograms, token
+    counters, page sizes and cache and queue gauges"""
+    return Response(REGISTRY.render(), media_type=CONTENT_TYPE)
+
+
+@app.get("/cache/stats")
+async def cache_stats(
+    current_user: Annotated[User, Depends(get_current_user)],
+) -> CacheStats:
+    """hit/miss counts of the verdict cache
+
+    Args:
+        current_user: user information required for authentication
+
+    Returns:
+        verdict cache statistics
+    """
+    return verdict_cache.stats()
+
+
+@app.get("/boilerplate/stats")
+async def boilerplate_stats(
+    current_user: Annotated[User, Depends(get_current_user)],
+) -> list[BoilerplateStats]:
+    """pages seen, boilerplate blocks found and tokens saved for every domain
+
+    Args:
+        current_user: user information required for authentication
+
+    Returns:
+        boilerplate statistics of every domain, empty when stripping is disabled
+    """
+    return boilerplate_filter.stats() if boilerplate_filter is not None else []
+
+
+@app.get("/llm/routes")
+async def llm_routes(
+    current_user: Annotated[User, Depends(get_current_user)],
+) -> list[RouteStats]:
+    """latency, error rate and circuit state of every llm the checks are routed to
+
+    Args:
+        current_user: user information required for authentication
+
+    Returns:
+        statistics of every route, in order of preference
+    """
+    return llm_router.stats()
+
 
 @app.post("/token", response_model=Token)
 async def login_for_access_token(
-    form_data: Annotated[OAuth2PasswordRequestForm, Depends()]
+    form_data: Annotated[OAuth2PasswordRequestForm, Depends()],
 ) -> Dict:
     """authenticates the user and returns a token
 
@@ -100,8 +481,10 @@ async def login_for_access_token(
     Returns:
         token and token type
     """
-    db = read_db()
-    user = authenticate_user(db, form_data.username, form_data.password)
+    # bcrypt is deliberately slow, keep it off the event loop
+    user = await run_in_threadpool(
+        authenticate_user, user_store.users(), form_data.username, form_data.password
+    )
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
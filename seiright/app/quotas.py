@@ -0,0 +1,244 @@
+"""Per user quotas of the api.
+
+Every user has a requests per minute and an (estimated) llm tokens per minute
+token bucket. A check takes one request and the estimated tokens of the pages it
+will send to the llm before it starts; a user short of either budget gets a `429`
+with the seconds until the budget is back in `Retry-After`. A request costing
+more than a whole bucket (e.g. a large site crawl) waits for a full bucket and
+leaves it in debt, the following requests wait for the debt to be paid back.
+
+The limits of a user are read from the `quota` of its entry in the user store
+(`{"requests_per_minute": ..., "tokens_per_minute": ...}`), the limits of the
+service apply to the users without one.
+
+The buckets are kept by a `QuotaBackend`. `MemoryQuotaBackend` keeps them in the
+process, every worker of the service then has its own budget. `SQLiteQuotaBackend`
+keeps them in a sqlite file, shared by the workers of a host. A backend for a
+shared store (e.g. redis) implements the same protocol.
+"""
+
+import math
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Protocol
+
+from fastapi import HTTPException, status
+from fastapi.concurrency import run_in_threadpool
+
+from ..core.metrics import counter
+from ..core.ratelimit import TokenBucket
+from .api_models import User
+
+REJECTED = counter(
+    "seiright_quota_rejected_total",
+    "Requests rejected because the user ran out of quota",
+)
+
+
+def _take(
+    requests: TokenBucket, tokens: TokenBucket, amount: float, now: float
+) -> float:
+    # both buckets or none, a rejected request doesn't cost anything
+    wait = max(requests.wait(1, now), tokens.wait(amount, now))
+    if wait == 0:
+        requests.consume(1)
+        tokens.consume(amount)
+    return wait
+
+
+def _level(bucket: TokenBucket) -> float | None:
+    return None if bucket.per_minute is None else bucket.level
+
+
+class QuotaBackend(Protocol):
+    def acquire(
+        self,
+        user: str,
+        requests_per_minute: float | None,
+        tokens_per_minute: float | None,
+        tokens: float,
+    ) -> float:
+        """takes a request and `tokens` tokens from the buckets of `user` when
+        both have them, `None` limits are unlimited
+
+        Returns:
+            0 when they were taken, the seconds until they are available otherwise
+        """
+        ...
+
+    def close(self) -> None: ...
+
+
+class MemoryQuotaBackend:
+    """buckets of the users in a dictionary, local to the process"""
+
+    def __init__(self):
+        self._buckets: dict[str, tuple[TokenBucket, TokenBucket]] = {}
+        self._lock = threading.Lock()
+
+    def acquire(
+        self,
+        user: str,
+        requests_per_minute: float | None,
+        tokens_per_minute: float | None,
+        tokens: float,
+    ) -> float:
+        now = time.monotonic()
+        with self._lock:
+            buckets = self._buckets.get(user)
+            if buckets is None:
+                buckets = TokenBucket(requests_per_minute), TokenBucket(
+                    tokens_per_minute
+                )
+                self._buckets[user] = buckets
+            requests, budget = buckets
+            # the limits of a user change when the user store is reloaded
+            if requests.per_minute != requests_per_minute:
+                requests.set_limit(requests_per_minute, now)
+            if budget.per_minute != tokens_per_minute:
+                budget.set_limit(tokens_per_minute, now)
+            return _take(requests, budget, tokens, now)
+
+    def close(self) -> None:
+        pass
+
+
+class SQLiteQuotaBackend:
+    """buckets of the users in a sqlite file, shared by the processes using it
+
+    The buckets of a user are read and written back in one write transaction, so
+    that concurrent processes never take the same budget twice. Refills use the
+    wall clock, the same for every process.
+
+    Args:
+        db_path: path of the sqlite file, `":memory:"` for a store local to the
+            process
+        timeout: seconds to wait for another process holding the lock
+    """
+
+    def __init__(self, db_path: str | Path = ":memory:", timeout: float = 5.0):
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(
+            str(db_path), timeout=timeout, isolation_level=None, check_same_thread=False
+        )
+        if str(db_path) != ":memory:":
+            self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS quotas ("
+            "user TEXT PRIMARY KEY, requests REAL, tokens REAL, "
+            "updated REAL NOT NULL)"
+        )
+
+    def acquire(
+        self,
+        user: str,
+        requests_per_minute: float | None,
+        tokens_per_minute: float | None,
+        tokens: float,
+    ) -> float:
+        now = time.time()
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._db.execute(
+                    "SELECT requests, tokens, updated FROM quotas WHERE user = ?",
+                    (user,),
+                ).fetchone()
+                # the level of an unlimited bucket is NULL, it is full once limited
+                level_requests, level_tokens, updated = row or (None, None, now)
+                requests = TokenBucket(requests_per_minute, level_requests, updated)
+                budget = TokenBucket(tokens_per_minute, level_tokens, updated)
+                wait = _take(requests, budget, tokens, now)
+                if wait == 0:
+                    self._db.execute(
+                        "INSERT OR REPLACE INTO quotas (user, requests, tokens, updated) "
+                        "VALUES (?, ?, ?, ?)",
+                        (user, _level(requests), _level(budget), now),
+                    )
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+        return wait
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+
+class UserQuotas:
+    """Requests and llm tokens budgets of the users of the api
+
+    Args:
+        backend: store of the buckets, defaults to `MemoryQuotaBackend`
+        requests_per_minute: requests a minute of the users without a quota of
+            their own, `None` for unlimited
+        tokens_per_minute: estimated llm tokens a minute of the users without a
+            quota of their own, `None` for unlimited
+
+    Usage:
+        quotas = UserQuotas(requests_per_minute=60, tokens_per_minute=100_000)
+        quotas.check(current_user, tokens=4000)  # HTTPException(429) when over it
+        await quotas.acheck(current_user, tokens=4000)  # in an endpoint
+    """
+
+    def __init__(
+        self,
+        backend: QuotaBackend | None = None,
+        requests_per_minute: float | None = None,
+        tokens_per_minute: float | None = None,
+    ):
+        self.backend = backend if backend is not None else MemoryQuotaBackend()
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+
+    def limits(self, user: User) -> tuple[float | None, float | None]:
+        """requests and tokens per minute of `user`"""
+        quota = user.quota
+        if quota is None:
+            return self.requests_per_minute, self.tokens_per_minute
+        return (
+            quota.requests_per_minute or self.requests_per_minute,
+            quota.tokens_per_minute or self.tokens_per_minute,
+        )
+
+    def acquire(self, user: User, tokens: float = 0) -> float:
+        """takes a request and `tokens` tokens from the budget of `user`
+
+        Returns:
+            0 when they were taken, the seconds until they are available otherwise
+        """
+        requests_per_minute, tokens_per_minute = self.limits(user)
+        if requests_per_minute is None and tokens_per_minute is None:
+            return 0.0
+        return self.backend.acquire(
+            user.username, requests_per_minute, tokens_per_minute, tokens
+        )
+
+    def check(self, user: User, tokens: float = 0) -> None:
+        """`acquire`, for an endpoint
+
+        Raises:
+            HTTPException: `429` with a `Retry-After` header when `user` is out of
+                budget
+        """
+        wait = self.acquire(user, tokens)
+        if wait > 0:
+            REJECTED.inc()
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail=f"Quota exceeded, retry in {wait:.1f} seconds",
+                headers={"Retry-After": str(max(1, math.ceil(wait)))},
+            )
+
+    async def acheck(self, user: User, tokens: float = 0) -> None:
+        """`check` in the threadpool, a sqlite backend can wait for the lock of
+        another process"""
+        if self.limits(user) == (None, None):
+            return
+        await run_in_threadpool(self.check, user, tokens)
+
+    def close(self) -> None:
+        self.backend.close()
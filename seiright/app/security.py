@@ -3,7 +3,11 @@ This module has util functions for handling authentication and security
 
 """
 
+import threading
+from collections import OrderedDict
 from datetime import datetime, timedelta
+from functools import lru_cache
+from time import time
 
 from fastapi.security import OAuth2PasswordBearer
 from jose import jwt
@@ -41,10 +45,12 @@ def access_token_expire_time() -> int:
     return int(time)
 
 
+@lru_cache(maxsize=1)
 def pwd_context() -> CryptContext:
     return CryptContext(schemes=["bcrypt"], deprecated="auto")
 
 
+@lru_cache(maxsize=1)
 def oauth2_scheme() -> OAuth2PasswordBearer:
     return OAuth2PasswordBearer(tokenUrl="token")
 
@@ -75,3 +81,72 @@ def create_access_token(data: dict, expires_delta: timedelta | None = None):
     to_encode.update({"exp": expire})
     encoded_jwt = jwt.encode(to_encode, secret_key(), algorithm=algorithm())
     return encoded_jwt
+
+
+class TokenCache:
+    """Bounded LRU cache of tokens whose signature was already verified, mapping a
+    token to its subject until the token expires. A hit skips decoding and
+    verifying the token.
+
+    Args:
+        maxsize: maximum number of tokens kept
+    """
+
+    def __init__(self, maxsize: int = 10_000):
+        self.maxsize = maxsize
+        self._tokens: OrderedDict[str, tuple[str, float]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, token: str) -> str | None:
+        with self._lock:
+            entry = self._tokens.get(token)
+            if entry is None:
+                return None
+            username, expires_at = entry
+            if expires_at <= time():
+                del self._tokens[token]
+                return None
+            self._tokens.move_to_end(token)
+            return username
+
+    def set(self, token: str, username: str, expires_at: float) -> None:
+        with self._lock:
+            self._tokens[token] = (username, expires_at)
+            self._tokens.move_to_end(token)
+            while len(self._tokens) > self.maxsize:
+                self._tokens.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._tokens.clear()
+
+    def __len__(self) -> int:
+        return len(self._tokens)
+
+
+token_cache = TokenCache()
+
+
+def verify_token(token: str, cache: TokenCache | None = token_cache) -> str | None:
+    """verifies the token and returns its subject
+
+    Args:
+        token: jwt token
+        cache: cache of verified tokens, `None` to always verify the token
+
+    Raises:
+        JWTError: Raises an error if the token is invalid or expired
+
+    Returns:
+        username the token was issued to, `None` if the token has no subject
+    """
+    if cache is not None:
+        username = cache.get(token)
+        if username is not None:
+            return username
+    payload = jwt.decode(token, secret_key(), algorithms=[algorithm()])
+    username = payload.get("sub")
+    expires_at = payload.get("exp")
+    if cache is not None and username is not None and expires_at is not None:
+        cache.set(token, username, float(expires_at))
+    return username
@@ -1,9 +1,14 @@
 import json
+import logging
 import os
+import threading
 import warnings
 from pathlib import Path
+from time import monotonic
 from typing import Any, Dict
 
+logger = logging.getLogger(__name__)
+
 
 def get_env_var(
     env_var: str, default_value: Any = None, raise_error: bool = True
@@ -50,3 +55,62 @@ def read_db(file_name: str = "db.json") -> Dict[str, str]:
     with open(path, "r") as file:
         data = json.loads(file.read())
     return data
+
+
+class UserStore:
+    """In memory copy of the user database, so that authenticating a request
+    doesn't read and parse the database file.
+
+    The file is checked for changes (a `stat`) at most every `check_interval`
+    seconds and reloaded when its modification time or size changed. A file which
+    fails to load is logged and the previous users are kept.
+
+    Args:
+        file_name: name of the json file, relative to this package
+        check_interval: minimum number of seconds between two checks for changes,
+            `None` disables reloading
+    """
+
+    def __init__(self, file_name: str = "db.json", check_interval: float | None = 1.0):
+        self.path = Path(__file__).parent.joinpath(file_name)
+        self.check_interval = check_interval
+        self._reload_lock = threading.Lock()
+        self._signature_seen = self._signature()
+        self._users: Dict[str, Any] = read_db(file_name)
+        self._checked_at = monotonic()
+
+    def _signature(self) -> tuple[int, int]:
+        stat = self.path.stat()
+        return stat.st_mtime_ns, stat.st_size
+
+    def users(self) -> Dict[str, Any]:
+        """current users, keyed by username"""
+        if self.check_interval is not None:
+            now = monotonic()
+            if now - self._checked_at >= self.check_interval:
+                self._checked_at = now
+                self.reload_if_changed()
+        return self._users
+
+    def reload_if_changed(self) -> bool:
+        """reloads the database file if it changed on disk
+
+        Returns:
+            whether the users were reloaded
+        """
+        if not self._reload_lock.acquire(blocking=False):
+            return False
+        try:
+            signature = self._signature()
+            if signature == self._signature_seen:
+                return False
+            self._signature_seen = signature
+            with open(self.path, "r") as file:
+                self._users = json.loads(file.read())
+            logger.info(f"reloaded {len(self._users)} users from {self.path.name}")
+            return True
+        except Exception:
+            logger.exception("unable to reload the users, keeping the current ones")
+            return False
+        finally:
+            self._reload_lock.release()
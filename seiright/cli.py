@@ -0,0 +1,110 @@
+"""Command line interface of seiright.
+
+    seiright check urls.csv --output verdicts.jsonl --max-fetches 32 --max-llm-calls 8
+
+`check` runs a bulk check of the urls of a file (`seiright/core/bulk.py`), e.g. a
+nightly audit of a portfolio, without going through the api. Running the same
+command again after an interruption resumes it. The checker is built by
+`seiright/core/factory.py` from the same environment variables as the service.
+"""
+
+import argparse
+import asyncio
+import logging
+import sys
+
+from .core._types import BulkSummary, LLMProvider
+from .core.bulk import open_writer, read_urls, run_bulk
+from .core.factory import DEFAULT_MODEL, DEFAULT_PROVIDER, build_checker, close_checker
+from .core.web_crawler import aclose_http_client
+
+logger = logging.getLogger(__name__)
+
+
+async def check(args: argparse.Namespace) -> BulkSummary:
+    urls = read_urls(args.input, column=args.column)
+    writer = open_writer(args.output, format=args.format, batch_size=args.batch_size)
+    checker = build_checker(LLMProvider(args.provider), args.model)
+    if checker.extraction_pool is not None:
+        await asyncio.to_thread(checker.extraction_pool.start)
+    try:
+        return await run_bulk(
+            checker,
+            urls,
+            writer,
+            max_fetches=args.max_fetches,
+            max_llm_calls=args.max_llm_calls,
+            retry_failed=args.retry_failed,
+        )
+    finally:
+        writer.close()
+        await checker.aclose()
+        await aclose_http_client()
+        close_checker(checker)
+
+
+def parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="seiright", description=__doc__.splitlines()[0]
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    check_parser = commands.add_parser(
+        "check",
+        help="checks the urls of a file",
+        description="Checks the urls of a file and writes their verdicts as they "
+        "finish. Running it again with the same output skips the urls already in it.",
+    )
+    check_parser.add_argument(
+        "input", help="text (one url per line), .csv or .parquet file of urls"
+    )
+    check_parser.add_argument(
+        "-o", "--output", required=True, help="output .jsonl file or .parquet directory"
+    )
+    check_parser.add_argument(
+        "--format", choices=["jsonl", "parquet"], help="defaults to the output suffix"
+    )
+    check_parser.add_argument(
+        "--column", help="column of the urls, defaults to `url` or the first column"
+    )
+    check_parser.add_argument(
+        "--provider", default=DEFAULT_PROVIDER.value, choices=list(LLMProvider)
+    )
+    check_parser.add_argument("--model", default=DEFAULT_MODEL)
+    check_parser.add_argument(
+        "--max-fetches", type=int, default=16, help="pages crawled at the same time"
+    )
+    check_parser.add_argument(
+        "--max-llm-calls", type=int, default=8, help="llm calls at the same time"
+    )
+    check_parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=1000,
+        help="verdicts per parquet part (and at most between two flushes)",
+    )
+    check_parser.add_argument(
+        "--retry-failed",
+        action="store_true",
+        help="check again the urls which failed in a previous run",
+    )
+    check_parser.set_defaults(func=check)
+    return parser
+
+
+def main(argv: list[str] | None = None) -> int:
+    args = parser().parse_args(argv)
+    logging.basicConfig(
+        level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+    )
+    try:
+        summary = asyncio.run(args.func(args))
+    except KeyboardInterrupt:
+        logger.warning("interrupted, run the same command again to resume")
+        return 130
+    print(summary.model_dump_json())
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
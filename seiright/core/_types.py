@@ -1,7 +1,9 @@
 from enum import StrEnum
 from typing import Literal
 
-from pydantic import BaseModel
+from pydantic import BaseModel, ConfigDict
+
+from .blocks import ExtractedPage
 
 # type LLMProvider = Literal["openai", "anthropic", "google", "azure", "other"]
 
@@ -29,15 +31,24 @@ class LLMResponse(BaseModel):
     reasoning: str
     input_msg: str
     confidence_score: float
+    cached_tokens: int = 0
+    uncached_tokens: int = 0
+    completion_tokens: int = 0
+    # set when the verdict was reused from a near duplicate page
+    reused_from: str | None = None
+    similarity: float | None = None
 
 
 class PromptContent(BaseModel):
     type: str
     text: str
+    cache_control: dict[str, str] | None = None
 
 
 type PromptRoles = Literal["user", "assistant", "system"]
 
+type ReductionRule = Literal["any_non_compliant", "confidence_weighted"]
+
 
 class PromptMessages(BaseModel):
     role: PromptRoles
@@ -46,3 +57,146 @@ class PromptMessages(BaseModel):
 
 class Prompt(BaseModel):
     messages: list[PromptMessages]
+
+
+class CacheStats(BaseModel):
+    hits: int
+    misses: int
+    memory_hits: int
+    disk_hits: int
+    size: int
+
+
+class CachedPage(BaseModel):
+    url: str
+    etag: str | None
+    last_modified: str | None
+    text: str
+    title: str | None
+    fetched_at: float
+
+
+class CrawledPage(BaseModel):
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    url: str
+    depth: int
+    page: ExtractedPage | None = None
+    title: str | None = None
+    error: str | None = None
+
+
+class PageVerdict(BaseModel):
+    url: str
+    is_compliant: bool | None = None
+    confidence_score: float | None = None
+    reasoning: str | None = None
+    error: str | None = None
+
+
+class SiteComplianceSummary(BaseModel):
+    is_compliant: bool
+    pages_checked: int
+    compliant_pages: int
+    non_compliant_pages: int
+    failed_pages: int
+    mean_confidence_score: float | None
+    non_compliant_urls: list[str]
+
+
+class SiteComplianceReport(BaseModel):
+    root_url: str
+    llm_provider: LLMProvider
+    model: str
+    pages: list[PageVerdict]
+    summary: SiteComplianceSummary
+
+
+class BulkSummary(BaseModel):
+    urls: int
+    skipped: int = 0
+    checked: int = 0
+    failed: int = 0
+    seconds: float = 0.0
+
+
+class ExtractorConfig(BaseModel):
+    backend: Literal["html.parser", "lxml"] = "html.parser"
+    max_bytes: int = 5 * 1024 * 1024
+    max_text_chars: int = 500_000
+    chunk_size: int = 64 * 1024
+    # seconds of parsing after which the extraction stops, like the size limits
+    max_parse_seconds: float | None = None
+
+
+class JobStatus(StrEnum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
+
+
+class Job(BaseModel):
+    id: str
+    url: str
+    user: str
+    status: JobStatus = JobStatus.QUEUED
+    webhook_url: str | None = None
+    result: LLMResponse | None = None
+    error: str | None = None
+    created_at: float
+    updated_at: float
+
+
+class MemberVerdict(BaseModel):
+    llm_provider: LLMProvider
+    model: str
+    status: Literal["succeeded", "failed", "cancelled"] = "cancelled"
+    is_compliant: bool | None = None
+    confidence_score: float | None = None
+    reasoning: str | None = None
+    latency: float | None = None
+    error: str | None = None
+
+
+class EnsembleVerdict(BaseModel):
+    is_compliant: bool | None
+    quorum: int
+    quorum_reached: bool
+    agreement: float
+    confidence_score: float | None
+    latency: float
+    members: list[MemberVerdict]
+
+
+class RouteStats(BaseModel):
+    llm_provider: LLMProvider
+    model: str
+    calls: int
+    p50: float | None
+    p95: float | None
+    error_rate: float
+    circuit: Literal["closed", "open", "half_open"]
+
+
+class BoilerplateStats(BaseModel):
+    domain: str
+    pages: int
+    blocks: int
+    boilerplate_blocks: int
+    tokens_seen: int
+    tokens_saved: int
+
+
+class BlockAssessment(BaseModel):
+    blocks: list[str]
+    tokens: int
+    response: LLMResponse
+
+
+class PageBlocks(BaseModel):
+    url: str
+    key: str
+    blocks: list[str]
+    assessments: list[BlockAssessment]
+    updated_at: float
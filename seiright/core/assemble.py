@@ -1,23 +1,135 @@
+import asyncio
+import itertools
 import logging
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from typing import AsyncIterator, Iterable
+
+import numpy as np
 
 from ..utils.utils import timer
-from ._types import LLMProvider, LLMResponse
-from .llms import get_llm
-from .web_crawler import extract_text_from_url, reformat_extracted_text
+from ._types import (
+    BlockAssessment,
+    CrawledPage,
+    ExtractorConfig,
+    LLMProvider,
+    LLMResponse,
+    PageVerdict,
+    ReductionRule,
+    SiteComplianceReport,
+    SiteComplianceSummary,
+)
+from .blocks import ExtractedPage
+from .boilerplate import BoilerplateFilter
+from .cache import VerdictCache, verdict_key
+from .chunking import chunk_text, count_tokens, reduce_verdicts
+from .incremental import BlockStore, RecheckPlan, plan_recheck
+from .llms import LLM, get_llm
+from .metrics import span
+from .neardup import REUSED, NearDuplicate, NearDuplicateIndex
+from .prompts import SeiPrompts
+from .router import LLMRouter
+from .singleflight import SingleFlight
+from .site_crawler import SiteCrawler
+from .urls import page_key, strip_tracking
+from .workers import ExtractionPool
+from .web_crawler import PageCache, aextract_page_from_url, extract_page_from_url
 
 logger = logging.getLogger(__name__)
 
 
+# slots of the page fetches and of the llm calls shared by the checks of a batch
+# (`achat_many`) or of a site (`acheck_site`), set in the task of every check
+fetch_slots: ContextVar[asyncio.Semaphore | None] = ContextVar(
+    "fetch_slots", default=None
+)
+llm_slots: ContextVar[asyncio.Semaphore | None] = ContextVar("llm_slots", default=None)
+
+
+@asynccontextmanager
+async def slot(slots: ContextVar[asyncio.Semaphore | None]) -> AsyncIterator[None]:
+    semaphore = slots.get()
+    if semaphore is None:
+        yield
+        return
+    async with semaphore:
+        yield
+
+
 class ComplianceChecker:
 
-    def __init__(self, llm_provider: LLMProvider, model: str):
+    def __init__(
+        self,
+        llm_provider: LLMProvider,
+        model: str,
+        verdict_cache: VerdictCache | None = None,
+        page_cache: PageCache | None = None,
+        extractor_config: ExtractorConfig | None = None,
+        max_chunk_tokens: int | None = None,
+        max_chunk_calls: int = 4,
+        reduction: ReductionRule = "any_non_compliant",
+        llm: LLM | LLMRouter | None = None,
+        boilerplate: BoilerplateFilter | None = None,
+        block_store: BlockStore | None = None,
+        block_tokens: int = 2000,
+        near_duplicates: NearDuplicateIndex | None = None,
+        extraction_pool: ExtractionPool | None = None,
+    ):
         self.llm_provider = llm_provider
         self.model = model
+        self.verdict_cache = verdict_cache
+        self.page_cache = page_cache
+        self.extractor_config = extractor_config
+        self.max_chunk_tokens = max_chunk_tokens
+        self.max_chunk_calls = max_chunk_calls
+        self.reduction = reduction
+        self.boilerplate = boilerplate
+        self.block_store = block_store
+        self.block_tokens = block_tokens
+        # verdicts of near duplicates are read from the verdict cache
+        self.near_duplicates = near_duplicates if verdict_cache is not None else None
+        self.extraction_pool = extraction_pool
+
+        self.llm = llm or get_llm(provider=self.llm_provider, model=self.model)
+        self.inflight = SingleFlight()
+
+    def strip_boilerplate(self, url: str, page: ExtractedPage) -> ExtractedPage:
+        if self.boilerplate is not None:
+            page = self.boilerplate.strip_page(url, page, model=self.model)
+        return page
+
+    def page_text(self, url: str, page: ExtractedPage) -> str:
+        """text of the page sent to the llm, without the boilerplate of its site"""
+        return self.strip_boilerplate(url, page).render_prompt()
 
-        self.llm = get_llm(provider=self.llm_provider, model=self.model)
+    async def apage_text(self, url: str, page: ExtractedPage) -> str:
+        """`page_text`, rendered in the extraction pool when there is one"""
+        if self.boilerplate is not None:
+            # token counts and sqlite writes, off the event loop
+            page = await asyncio.to_thread(self.strip_boilerplate, url, page)
+        if self.extraction_pool is None:
+            return page.render_prompt()
+        return await self.extraction_pool.arender(page)
 
     def webpage(self, url: str) -> str:
-        return reformat_extracted_text(*extract_text_from_url(url=url))
+        return self.page_text(
+            url,
+            extract_page_from_url(
+                url=url, page_cache=self.page_cache, config=self.extractor_config
+            ),
+        )
+
+    async def awebpage(self, url: str) -> str:
+        return await self.apage_text(
+            url,
+            await aextract_page_from_url(
+                url=url,
+                page_cache=self.page_cache,
+                config=self.extractor_config,
+                pool=self.extraction_pool,
+            ),
+        )
 
     def create_user_prompt(self, text: str) -> str:
         return f"""You are given the following text from the webpage of a website.
@@ -28,22 +140,393 @@ class ComplianceChecker:
         ```
         """
 
+    def cached_verdict(self, text: str) -> tuple[str | None, LLMResponse | None]:
+        if self.verdict_cache is None:
+            return None, None
+        key = verdict_key(text=text, llm_provider=self.llm_provider, model=self.model)
+        return key, self.verdict_cache.get(key)
+
+    async def acached_verdict(self, text: str) -> tuple[str | None, LLMResponse | None]:
+        if self.verdict_cache is None:
+            return None, None
+        key = verdict_key(text=text, llm_provider=self.llm_provider, model=self.model)
+        return key, await self.verdict_cache.aget(key)
+
+    def chunks(self, text: str) -> list[str]:
+        if self.max_chunk_tokens is None:
+            return [text]
+        return chunk_text(text, max_tokens=self.max_chunk_tokens, model=self.model)
+
+    def reduce(self, chunks: list[str], responses: list[LLMResponse]) -> LLMResponse:
+        weights = [float(count_tokens(chunk, self.model)) for chunk in chunks]
+        return reduce_verdicts(responses, weights=weights, rule=self.reduction)
+
+    def check_text(self, text: str) -> LLMResponse:
+        key, cached = self.cached_verdict(text)
+        if cached is not None:
+            return cached
+
+        def check(chunk: str) -> LLMResponse:
+            user_prompt = self.create_user_prompt(text=chunk)
+            logging.debug(f"{user_prompt=}")
+            return self.llm.chat(user_prompt=user_prompt)
+
+        chunks = self.chunks(text)
+        if len(chunks) == 1:
+            llm_response = check(text)
+        else:
+            with ThreadPoolExecutor(max_workers=self.max_chunk_calls) as executor:
+                llm_response = self.reduce(chunks, list(executor.map(check, chunks)))
+        if key is not None:
+            self.verdict_cache.set(key, llm_response)  # type: ignore
+        return llm_response
+
+    async def acheck_text(self, text: str) -> LLMResponse:
+        key, cached = await self.acached_verdict(text)
+        if cached is not None:
+            return cached
+
+        chunk_limiter = asyncio.Semaphore(self.max_chunk_calls)
+
+        async def check(chunk: str) -> LLMResponse:
+            user_prompt = self.create_user_prompt(text=chunk)
+            logging.debug(f"{user_prompt=}")
+            async with chunk_limiter, slot(llm_slots):
+                return await self.llm.achat(user_prompt=user_prompt)
+
+        chunks = self.chunks(text)
+        if len(chunks) == 1:
+            llm_response = await check(text)
+        else:
+            responses = await asyncio.gather(*(check(chunk) for chunk in chunks))
+            llm_response = self.reduce(chunks, list(responses))
+        if key is not None:
+            await self.verdict_cache.aset(key, llm_response)  # type: ignore
+        return llm_response
+
+    def block_key(self) -> str:
+        """assessments of blocks are reused for the same model and prompts only"""
+        return f"{self.llm_provider}:{self.model}:{SeiPrompts.version}"
+
+    def plan_recheck(self, url: str, text: str) -> RecheckPlan:
+        previous = self.block_store.get(url, self.block_key())  # type: ignore
+        return plan_recheck(text, previous, self.block_tokens, model=self.model)
+
+    async def aplan_recheck(self, url: str, text: str) -> RecheckPlan:
+        previous = await self.block_store.aget(url, self.block_key())  # type: ignore
+        return plan_recheck(text, previous, self.block_tokens, model=self.model)
+
+    def recheck_text(self, text: str, plan: RecheckPlan) -> str | None:
+        """text to send to the llm: the whole page on a first check, the changed
+        blocks and their neighbours on a re-check, `None` when nothing changed"""
+        if not plan.changed:
+            return None
+        return text if plan.whole_page else plan.recheck_text()
+
+    def block_assessments(
+        self, plan: RecheckPlan, response: LLMResponse | None
+    ) -> tuple[list[BlockAssessment], LLMResponse]:
+        """fresh and reused assessments of the blocks of a page, and the verdict
+        of the page reduced from them"""
+        fresh = [] if response is None else [plan.assessment(response)]
+        if plan.whole_page:
+            return fresh, response  # type: ignore
+        assessments = plan.in_page_order(plan.reused + fresh)
+        llm_response = reduce_verdicts(
+            [a.response for a in assessments],
+            weights=[float(a.tokens) for a in assessments],
+            rule=self.reduction,
+        )
+        return assessments, llm_response
+
+    def page_verdict(
+        self,
+        url: str,
+        key: str | None,
+        plan: RecheckPlan,
+        response: LLMResponse | None,
+    ) -> LLMResponse:
+        """verdict of a page from the assessments of its blocks, which are stored
+        for the next check"""
+        assessments, llm_response = self.block_assessments(plan, response)
+        self.block_store.set(url, self.block_key(), plan, assessments)  # type: ignore
+        if key is not None:
+            self.verdict_cache.set(key, llm_response)  # type: ignore
+        return llm_response
+
+    async def apage_verdict(
+        self,
+        url: str,
+        key: str | None,
+        plan: RecheckPlan,
+        response: LLMResponse | None,
+    ) -> LLMResponse:
+        assessments, llm_response = self.block_assessments(plan, response)
+        await self.block_store.aset(  # type: ignore
+            url, self.block_key(), plan, assessments
+        )
+        if key is not None:
+            await self.verdict_cache.aset(key, llm_response)  # type: ignore
+        return llm_response
+
+    def near_duplicate(
+        self, url: str, text: str
+    ) -> tuple[np.ndarray | None, LLMResponse | None]:
+        """verdict of an already checked page with nearly the same text, and the
+        signature of the text to index the page with once checked"""
+        if self.near_duplicates is None:
+            return None, None
+        signature = self.near_duplicates.signature(text)
+        if signature is None:
+            return None, None
+        match = self.near_duplicates.query(
+            signature, scope=self.block_key(), exclude=url
+        )
+        if match is None:
+            return signature, None
+        cached = self.verdict_cache.get(match.key)  # type: ignore
+        return signature, self.reuse(url, match, cached)
+
+    async def anear_duplicate(
+        self, url: str, text: str
+    ) -> tuple[np.ndarray | None, LLMResponse | None]:
+        if self.near_duplicates is None:
+            return None, None
+        signature = await self.near_duplicates.asignature(text)
+        if signature is None:
+            return None, None
+        match = await self.near_duplicates.aquery(
+            signature, scope=self.block_key(), exclude=url
+        )
+        if match is None:
+            return signature, None
+        cached = await self.verdict_cache.aget(match.key)  # type: ignore
+        return signature, self.reuse(url, match, cached)
+
+    def reuse(
+        self, url: str, match: NearDuplicate, response: LLMResponse | None
+    ) -> LLMResponse | None:
+        """the verdict of a near duplicate of the page, when it is still cached"""
+        if response is None:
+            return None
+        REUSED.inc()
+        logger.info(f"reusing the verdict of {match.page} for {url}")
+        return response.model_copy(
+            update={"reused_from": match.page, "similarity": match.similarity}
+        )
+
+    def index_page(self, url: str, text: str, signature: np.ndarray | None) -> None:
+        if signature is not None:
+            key = verdict_key(
+                text=text, llm_provider=self.llm_provider, model=self.model
+            )
+            self.near_duplicates.add(  # type: ignore
+                url, signature, key=key, scope=self.block_key()  # type: ignore
+            )
+
+    async def aindex_page(
+        self, url: str, text: str, signature: np.ndarray | None
+    ) -> None:
+        if signature is not None:
+            key = verdict_key(
+                text=text, llm_provider=self.llm_provider, model=self.model
+            )
+            await self.near_duplicates.aadd(  # type: ignore
+                url, signature, key=key, scope=self.block_key()  # type: ignore
+            )
+
+    def check_page(self, url: str, text: str) -> LLMResponse:
+        """checks the text of a page, unless a near duplicate of it was checked.
+        With a block store, a page checked before only has the blocks which changed
+        since (and their neighbours) sent to the llm"""
+        signature, reused = self.near_duplicate(url, text)
+        if reused is not None:
+            return reused
+        llm_response = self._check_page(url, text)
+        self.index_page(url, text, signature)
+        return llm_response
+
+    def _check_page(self, url: str, text: str) -> LLMResponse:
+        if self.block_store is None:
+            return self.check_text(text)
+        key, cached = self.cached_verdict(text)
+        if cached is not None:
+            return cached
+        plan = self.plan_recheck(url, text)
+        if not plan.sections:
+            return self.check_text(text)
+        recheck = self.recheck_text(text, plan)
+        response = None if recheck is None else self.check_text(recheck)
+        return self.page_verdict(url, key, plan, response)
+
+    async def acheck_page(self, url: str, text: str) -> LLMResponse:
+        signature, reused = await self.anear_duplicate(url, text)
+        if reused is not None:
+            return reused
+        llm_response = await self._acheck_page(url, text)
+        await self.aindex_page(url, text, signature)
+        return llm_response
+
+    async def _acheck_page(self, url: str, text: str) -> LLMResponse:
+        if self.block_store is None:
+            return await self.acheck_text(text)
+        key, cached = await self.acached_verdict(text)
+        if cached is not None:
+            return cached
+        plan = await self.aplan_recheck(url, text)
+        if not plan.sections:
+            return await self.acheck_text(text)
+        recheck = self.recheck_text(text, plan)
+        response = None if recheck is None else await self.acheck_text(recheck)
+        return await self.apage_verdict(url, key, plan, response)
+
+    def flight_key(self, url: str) -> tuple[str, str, str]:
+        return page_key(url), self.llm_provider, self.model
+
     @timer
     def chat(self, url: str) -> LLMResponse:
-        webcontent = self.webpage(url=url)
-        logging.debug(f"crawled web content: {webcontent}")
-        user_prompt = self.create_user_prompt(text=webcontent)
-        logging.debug(f"{user_prompt=}")
-        llm_response = self.llm.chat(user_prompt=user_prompt)
-        return llm_response
+        # concurrent checks of the same page share a single crawl and llm call
+        url = strip_tracking(url)
+        return self.inflight.do(self.flight_key(url), lambda: self._chat(url))
 
+    def _chat(self, url: str) -> LLMResponse:
+        with span("check"):
+            webcontent = self.webpage(url=url)
+            logging.debug(f"crawled web content: {webcontent}")
+            return self.check_page(url, webcontent)
 
-if __name__ == "__main__":
-    logging.basicConfig(
-        level=logging.DEBUG, format="%(asctime)s - %(levelname)s - %(message)s"
-    )
-    checker = ComplianceChecker(
-        llm_provider=LLMProvider.OPENAI, model="gpt-4o-2024-08-06"
+    @timer
+    async def achat(self, url: str) -> LLMResponse:
+        url = strip_tracking(url)
+        return await self.inflight.ado(self.flight_key(url), lambda: self._achat(url))
+
+    async def _achat(self, url: str) -> LLMResponse:
+        with span("check"):
+            async with slot(fetch_slots):
+                webcontent = await self.awebpage(url=url)
+            logging.debug(f"crawled web content: {webcontent}")
+            return await self.acheck_page(url, webcontent)
+
+    async def achat_many(
+        self, urls: Iterable[str], max_fetches: int = 8, max_llm_calls: int = 4
+    ) -> AsyncIterator[tuple[str, LLMResponse | Exception]]:
+        """checks several urls concurrently and yields the results in the order
+        they finish. A failing url yields its exception instead of aborting the
+        remaining ones. Every url is checked by `achat`, tracking variants of a
+        page are checked once.
+
+        Args:
+            urls: urls to check
+            max_fetches: maximum number of pages crawled at the same time
+            max_llm_calls: maximum number of llm calls in flight at the same time,
+                chunks of a page included
+
+        Yields:
+            tuple of the url and its llm response (or the exception raised)
+        """
+        fetch_limiter = asyncio.Semaphore(max_fetches)
+        llm_limiter = asyncio.Semaphore(max_llm_calls)
+
+        async def check(url: str) -> tuple[str, LLMResponse | Exception]:
+            # in the context of the task of this check only
+            fetch_slots.set(fetch_limiter)
+            llm_slots.set(llm_limiter)
+            try:
+                return url, await self.achat(url)
+            except Exception as e:
+                logger.warning(f"compliance check failed for {url}: {e!r}")
+                return url, e
+
+        # urls are taken from the iterable as slots free up, enough to keep both
+        # the fetches and the llm calls busy, not one task per url upfront
+        urls = iter(urls)
+        window = max_fetches + max_llm_calls
+        pending: set[asyncio.Task] = set()
+        try:
+            while True:
+                for url in itertools.islice(urls, window - len(pending)):
+                    pending.add(asyncio.create_task(check(url)))
+                if not pending:
+                    return
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    yield task.result()
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def acheck_site(
+        self,
+        root_url: str,
+        crawler: SiteCrawler | None = None,
+        max_llm_calls: int = 4,
+    ) -> SiteComplianceReport:
+        """crawls a whole site and checks every page of it. Pages are sent to the
+        llm as soon as they are crawled, while the rest of the site is still being
+        crawled.
+
+        Args:
+            root_url: url to start the crawl from
+            crawler: crawler to use, its limits cap the depth and number of pages
+            max_llm_calls: maximum number of llm calls in flight at the same time,
+                the pages are fetched and extracted meanwhile
+
+        Returns:
+            verdict of every page and a site level summary
+        """
+        crawler = crawler or SiteCrawler(extractor_config=self.extractor_config)
+        llm_limiter = asyncio.Semaphore(max_llm_calls)
+
+        async def check(page: CrawledPage) -> PageVerdict:
+            if page.error is not None:
+                return PageVerdict(url=page.url, error=page.error)
+            llm_slots.set(llm_limiter)
+            try:
+                text = await self.apage_text(page.url, page.page)  # type: ignore
+                response = await self.acheck_page(page.url, text)
+            except Exception as e:
+                logger.warning(f"compliance check failed for {page.url}: {e!r}")
+                return PageVerdict(url=page.url, error=repr(e))
+            return PageVerdict(
+                url=page.url,
+                is_compliant=response.is_compliant,
+                confidence_score=response.confidence_score,
+                reasoning=response.reasoning,
+            )
+
+        tasks = []
+        try:
+            async for page in crawler.crawl(root_url):
+                tasks.append(asyncio.create_task(check(page)))
+            verdicts = list(await asyncio.gather(*tasks))
+        finally:
+            for task in tasks:
+                task.cancel()
+
+        return SiteComplianceReport(
+            root_url=root_url,
+            llm_provider=self.llm_provider,
+            model=self.model,
+            pages=verdicts,
+            summary=summarize_site(verdicts),
+        )
+
+    async def aclose(self) -> None:
+        await self.llm.aclose()
+
+
+def summarize_site(verdicts: list[PageVerdict]) -> SiteComplianceSummary:
+    checked = [v for v in verdicts if v.error is None]
+    non_compliant = [v.url for v in checked if not v.is_compliant]
+    scores = [v.confidence_score for v in checked if v.confidence_score is not None]
+    return SiteComplianceSummary(
+        is_compliant=bool(checked) and not non_compliant,
+        pages_checked=len(checked),
+        compliant_pages=len(checked) - len(non_compliant),
+        non_compliant_pages=len(non_compliant),
+        failed_pages=len(verdicts) - len(checked),
+        mean_confidence_score=sum(scores) / len(scores) if scores else None,
+        non_compliant_urls=non_compliant,
     )
-    response = checker.chat(url="https://mercury.com")
-    print(response)
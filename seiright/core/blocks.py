@@ -0,0 +1,227 @@
+"""Structured text of a page.
+
+The text of a page is kept as a single buffer, its blocks separated by new lines,
+and per block arrays of its tag, offsets into the buffer, position in the source
+document and content hash. Holding a page costs a few bytes per block on top of
+its text (instead of a string and a tuple per block), subsets of its blocks (e.g.
+without the boilerplate) share the buffer, and pages cross process boundaries as
+one string and a few arrays.
+
+The text sent to the llm is rendered from the blocks when it is needed: headings
+are prefixed with `#` (one per level) and set apart by blank lines, and lines are
+wrapped at 80 characters under a title banner.
+"""
+
+import hashlib
+import re
+import textwrap
+from array import array
+from dataclasses import dataclass
+from typing import Iterable, Iterator
+
+from .metrics import span
+
+TAGS = ("p", "li", "h1", "h2", "h3", "h4", "h5", "h6")
+WRAP_WIDTH = 80
+
+_CODES = {tag: code for code, tag in enumerate(TAGS)}
+_HEADING = re.compile(r"(#{1,6}) (.*)")
+
+
+def content_hash(text: str) -> int:
+    """64 bits hash of the text of a block"""
+    digest = hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "big")
+
+
+def title_banner(title: str | None) -> str:
+    if not title:
+        return ""
+    x = f"Title: {title}"
+    return f"{x:=^100}\n"
+
+
+def wrap_line(line: str) -> str:
+    """wraps a line of text at `WRAP_WIDTH` characters, words are never broken"""
+    if len(line) <= WRAP_WIDTH:
+        return line
+    return textwrap.fill(
+        line, width=WRAP_WIDTH, break_long_words=False, replace_whitespace=False
+    )
+
+
+@dataclass(frozen=True, slots=True)
+class Block:
+    """a block of a page
+
+    Attributes:
+        tag: html tag of the block (`p`, `li`, `h1`...`h6`)
+        level: heading level, 0 for blocks which aren't headings
+        start: offset of the text of the block in the buffer of its page
+        end: offset of the end of the text of the block in the buffer
+        position: offset in the source document of the chunk the end of the block
+            was parsed in
+        hash: `content_hash` of the text of the block
+    """
+
+    tag: str
+    level: int
+    start: int
+    end: int
+    position: int
+    hash: int
+
+
+class ExtractedPage:
+    """Text blocks of a page, as offsets into a single text buffer
+
+    Usage:
+        page = ExtractedPage.from_blocks([("h1", "Savings", 0), ("p", "...", 0)])
+        for i, block in enumerate(page):
+            if block.level:
+                print(page.block_text(i))
+        prompt = page.render_prompt()
+    """
+
+    __slots__ = (
+        "buffer",
+        "title",
+        "_tags",
+        "_starts",
+        "_ends",
+        "_positions",
+        "_hashes",
+    )
+
+    def __init__(
+        self,
+        buffer: str,
+        title: str | None,
+        tags: array,
+        starts: array,
+        ends: array,
+        positions: array,
+        hashes: array,
+    ):
+        self.buffer = buffer
+        self.title = title
+        self._tags = tags
+        self._starts = starts
+        self._ends = ends
+        self._positions = positions
+        self._hashes = hashes
+
+    @classmethod
+    def from_blocks(
+        cls, blocks: Iterable[tuple[str, str, int]], title: str | None = None
+    ) -> "ExtractedPage":
+        """page of (tag, text, position) blocks, in document order"""
+        tags, starts, ends = array("B"), array("I"), array("I")
+        positions, hashes = array("I"), array("Q")
+        texts = []
+        offset = 0
+        for tag, text, position in blocks:
+            tags.append(_CODES[tag])
+            starts.append(offset)
+            offset += len(text)
+            ends.append(offset)
+            offset += 1
+            positions.append(position)
+            hashes.append(content_hash(text))
+            texts.append(text)
+        return cls("\n".join(texts), title, tags, starts, ends, positions, hashes)
+
+    @classmethod
+    def from_text(cls, text: str, title: str | None = None) -> "ExtractedPage":
+        """page of a text in the format of `render` (e.g. a cached page), every
+        non blank line is a block and the position of a block is its offset in
+        the text"""
+        blocks = []
+        offset = 0
+        for line in text.split("\n"):
+            if line.strip():
+                heading = _HEADING.fullmatch(line)
+                if heading is not None:
+                    blocks.append((f"h{len(heading[1])}", heading[2], offset))
+                else:
+                    blocks.append(("p", line, offset))
+            offset += len(line) + 1
+        return cls.from_blocks(blocks, title)
+
+    def __len__(self) -> int:
+        return len(self._tags)
+
+    def __getitem__(self, i: int) -> Block:
+        return Block(
+            tag=TAGS[self._tags[i]],
+            level=self.level(i),
+            start=self._starts[i],
+            end=self._ends[i],
+            position=self._positions[i],
+            hash=self._hashes[i],
+        )
+
+    def __iter__(self) -> Iterator[Block]:
+        return (self[i] for i in range(len(self)))
+
+    @property
+    def hashes(self) -> array:
+        """`content_hash` of every block"""
+        return self._hashes
+
+    def level(self, i: int) -> int:
+        """heading level of block `i`, 0 when it isn't a heading"""
+        code = self._tags[i]
+        return code - 1 if code > 1 else 0
+
+    def block_text(self, i: int) -> str:
+        return self.buffer[self._starts[i] : self._ends[i]]
+
+    def line(self, i: int) -> str:
+        """block `i` as a line of `render`"""
+        level = self.level(i)
+        text = self.block_text(i)
+        return f"{'#' * level} {text}" if level else text
+
+    def select(self, indices: Iterable[int]) -> "ExtractedPage":
+        """page of a subset of the blocks, sharing the buffer of this page"""
+        indices = list(indices)
+        return ExtractedPage(
+            self.buffer,
+            self.title,
+            array("B", (self._tags[i] for i in indices)),
+            array("I", (self._starts[i] for i in indices)),
+            array("I", (self._ends[i] for i in indices)),
+            array("I", (self._positions[i] for i in indices)),
+            array("Q", (self._hashes[i] for i in indices)),
+        )
+
+    def head(self, max_chars: int) -> "ExtractedPage":
+        """the first blocks of the page, up to the one reaching `max_chars`
+        characters of text"""
+        size = 0
+        for i in range(len(self)):
+            if size >= max_chars:
+                return self.select(range(i))
+            size += self._ends[i] - self._starts[i]
+        return self
+
+    def lines(self) -> Iterator[str]:
+        """lines of `render`"""
+        for i in range(len(self)):
+            if self.level(i):
+                yield ""
+                yield self.line(i)
+                yield ""
+            else:
+                yield self.block_text(i)
+
+    def render(self) -> str:
+        """text of the page, one block per line, headings prefixed with `#`"""
+        return "\n".join(self.lines())
+
+    def render_prompt(self) -> str:
+        """text of the page sent to the llm: the lines of `render`, wrapped, under
+        the title banner of the page"""
+        with span("reformat"):
+            return title_banner(self.title) + "\n".join(map(wrap_line, self.lines()))
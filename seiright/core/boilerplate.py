@@ -0,0 +1,391 @@
+"""Cross page boilerplate detection.
+
+Navigation menus, cookie banners and footers are repeated on every page of a site
+and end up in every prompt. The text blocks (lines) of the pages of a domain are
+fingerprinted with a SimHash of their word shingles, so that blocks differing by a
+few words share a fingerprint, and the number of pages every
+block appeared on is counted. Once enough pages of a domain were seen, blocks
+present on most of them are dropped before the page is sent to the llm.
+
+Disclosures are repeated on every page too (deposit insurance, APR and terms
+disclaimers, risk warnings) and are exactly what a compliance check must see:
+blocks which look like one are never dropped. Blocks with numbers (rates, fees)
+only match a block with the same fingerprint, so that blocks differing by a
+number aren't merged.
+
+The counts are persisted per domain (sqlite), at most `max_pages` pages of a
+domain are counted.
+"""
+
+import hashlib
+import re
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Hashable
+from urllib.parse import urlsplit
+
+import numpy as np
+
+from ._types import BoilerplateStats
+from .blocks import ExtractedPage
+from .chunking import count_tokens
+from .metrics import counter
+from .urls import canonicalize_url, page_key
+
+SHINGLE_SIZE = 3
+BANDS = 4  # the 64 bits fingerprints are indexed by 4 bands of 16 bits
+BAND_BITS = 64 // BANDS
+
+TOKENS_SAVED = counter(
+    "seiright_boilerplate_tokens_saved_total",
+    "Tokens of boilerplate removed from the pages before they were sent to the llm",
+)
+
+# years, e.g. of the copyright notices. Other numbers (rates, fees) are kept
+_YEARS = re.compile(r"\b(?:19|20)\d\d\b")
+_DIGITS = re.compile(r"\d")
+# words of the disclosures, blocks with one of them are never dropped
+_DISCLOSURE = re.compile(
+    r"\b(?:fdic|ncua|sipc|finra|nmls|apr|apy|insured|insurance|member|"
+    r"equal housing|disclos\w*|disclaim\w*|terms|conditions|risks?|"
+    r"fees?|rates?|interest|regulated|licensed?|securities|investments?|"
+    r"lender|loans?|credit|guarantee\w*|not a bank)\b",
+    re.IGNORECASE,
+)
+# simhashes of the blocks of pages, by content hash, kept at most
+MAX_SIMHASHES = 100_000
+
+
+def is_disclosure(text: str) -> bool:
+    """whether a block looks like a disclosure, which is never dropped"""
+    return _DISCLOSURE.search(text) is not None
+
+
+def has_number(text: str) -> bool:
+    """whether a block has a number other than a year"""
+    return _DIGITS.search(_YEARS.sub("", text)) is not None
+
+
+def normalize_block(text: str) -> str:
+    """lower cases the block, collapses its whitespace and the years"""
+    return _YEARS.sub("0000", " ".join(text.lower().split()))
+
+
+def simhash(text: str) -> int:
+    """64 bits SimHash of the word shingles of a (normalised) block"""
+    words = text.split() or [""]
+    shingles = [
+        " ".join(words[i : i + SHINGLE_SIZE])
+        for i in range(max(1, len(words) - SHINGLE_SIZE + 1))
+    ]
+    digests = b"".join(
+        hashlib.blake2b(s.encode("utf-8"), digest_size=8).digest() for s in shingles
+    )
+    bits = np.unpackbits(np.frombuffer(digests, dtype=np.uint8).reshape(-1, 8), axis=1)
+    votes = bits.sum(axis=0, dtype=np.int64) * 2 - len(shingles)
+    return int.from_bytes(np.packbits(votes > 0).tobytes(), "big")
+
+
+def domain_of(url: str) -> str:
+    host = urlsplit(canonicalize_url(url)).hostname or ""
+    return host.removeprefix("www.")
+
+
+def _bands(fingerprint: int) -> list[tuple[int, int]]:
+    mask = (1 << BAND_BITS) - 1
+    return [(b, (fingerprint >> (b * BAND_BITS)) & mask) for b in range(BANDS)]
+
+
+def _signed(fingerprint: int) -> int:
+    # sqlite integers are signed 64 bits
+    return fingerprint - (1 << 64) if fingerprint >= 1 << 63 else fingerprint
+
+
+class DomainProfile:
+    """pages seen on a domain and number of pages every block appeared on"""
+
+    def __init__(self, domain: str):
+        self.domain = domain
+        self.pages: set[str] = set()
+        self.counts: dict[int, int] = {}
+        self.tokens_seen = 0
+        self.tokens_saved = 0
+        self._bands: dict[tuple[int, int], set[int]] = {}
+
+    def add(self, fingerprint: int, count: int = 0) -> None:
+        self.counts[fingerprint] = count
+        for band in _bands(fingerprint):
+            self._bands.setdefault(band, set()).add(fingerprint)
+
+    def remove(self, fingerprint: int) -> None:
+        del self.counts[fingerprint]
+        for band in _bands(fingerprint):
+            self._bands[band].discard(fingerprint)
+
+    def match(self, fingerprint: int, max_distance: int) -> int | None:
+        """known fingerprint within `max_distance` bits of `fingerprint`. With at
+        most `BANDS - 1` differing bits, one of the bands is identical"""
+        if fingerprint in self.counts:
+            return fingerprint
+        for band in _bands(fingerprint):
+            for candidate in self._bands.get(band, ()):
+                if (candidate ^ fingerprint).bit_count() <= max_distance:
+                    return candidate
+        return None
+
+    def share(self, fingerprint: int | None) -> float:
+        if fingerprint is None or not self.pages:
+            return 0.0
+        return self.counts.get(fingerprint, 0) / len(self.pages)
+
+
+class BoilerplateFilter:
+    """Drops the blocks repeated across the pages of a domain
+
+    Args:
+        db_path: path of the sqlite file, `":memory:"` for a non persistent store
+        min_pages: number of pages of a domain seen before blocks are dropped
+        threshold: share of the pages of the domain a block must appear on to be
+            dropped
+        max_distance: maximum number of differing bits of the fingerprints of two
+            blocks considered the same (at most `BANDS - 1`)
+        max_blocks: maximum number of blocks tracked per domain, the rarest are
+            forgotten beyond it
+        max_pages: maximum number of pages counted per domain, the blocks of
+            further pages are matched against the counts but not counted
+
+    Usage:
+        boilerplate = BoilerplateFilter("boilerplate.db")
+        text = boilerplate.strip(url, text)
+        page = boilerplate.strip_page(url, page)
+    """
+
+    def __init__(
+        self,
+        db_path: str | Path = ":memory:",
+        min_pages: int = 5,
+        threshold: float = 0.6,
+        max_distance: int = 3,
+        max_blocks: int = 5000,
+        max_pages: int = 10_000,
+    ):
+        if max_distance >= BANDS:
+            raise ValueError(f"max_distance must be lower than {BANDS}")
+        self.min_pages = min_pages
+        self.threshold = threshold
+        self.max_distance = max_distance
+        self.max_blocks = max_blocks
+        self.max_pages = max_pages
+        self._profiles: dict[str, DomainProfile] = {}
+        # the same blocks come back on every page of a site
+        self._simhashes: dict[Hashable, int] = {}
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(str(db_path), check_same_thread=False)
+        self._db.executescript(
+            "CREATE TABLE IF NOT EXISTS boilerplate_pages ("
+            "domain TEXT NOT NULL, url TEXT NOT NULL, PRIMARY KEY (domain, url));"
+            "CREATE TABLE IF NOT EXISTS boilerplate_blocks ("
+            "domain TEXT NOT NULL, fingerprint INTEGER NOT NULL, "
+            "pages INTEGER NOT NULL, PRIMARY KEY (domain, fingerprint));"
+            "CREATE TABLE IF NOT EXISTS boilerplate_tokens ("
+            "domain TEXT PRIMARY KEY, seen INTEGER NOT NULL, saved INTEGER NOT NULL);"
+        )
+        self._db.commit()
+
+    def _profile(self, domain: str) -> DomainProfile:
+        profile = self._profiles.get(domain)
+        if profile is not None:
+            return profile
+        profile = DomainProfile(domain)
+        for (url,) in self._db.execute(
+            "SELECT url FROM boilerplate_pages WHERE domain = ?", (domain,)
+        ):
+            profile.pages.add(url)
+        for fingerprint, pages in self._db.execute(
+            "SELECT fingerprint, pages FROM boilerplate_blocks WHERE domain = ?",
+            (domain,),
+        ):
+            profile.add(fingerprint % (1 << 64), pages)
+        row = self._db.execute(
+            "SELECT seen, saved FROM boilerplate_tokens WHERE domain = ?", (domain,)
+        ).fetchone()
+        if row is not None:
+            profile.tokens_seen, profile.tokens_saved = row
+        self._profiles[domain] = profile
+        return profile
+
+    def _observe(self, profile: DomainProfile, url: str, blocks: set[int]) -> None:
+        """counts the blocks of a page not seen before"""
+        profile.pages.add(url)
+        for fingerprint in blocks:
+            profile.counts[fingerprint] += 1
+        forgotten = []
+        if len(profile.counts) > self.max_blocks:
+            by_count = sorted(profile.counts, key=profile.counts.__getitem__)
+            forgotten = by_count[: len(profile.counts) - self.max_blocks]
+            for fingerprint in forgotten:
+                profile.remove(fingerprint)
+        self._db.execute(
+            "INSERT OR IGNORE INTO boilerplate_pages (domain, url) VALUES (?, ?)",
+            (profile.domain, url),
+        )
+        self._db.executemany(
+            "INSERT OR REPLACE INTO boilerplate_blocks (domain, fingerprint, pages) "
+            "VALUES (?, ?, ?)",
+            [
+                (profile.domain, _signed(fp), profile.counts[fp])
+                for fp in blocks
+                if fp in profile.counts
+            ],
+        )
+        self._db.executemany(
+            "DELETE FROM boilerplate_blocks WHERE domain = ? AND fingerprint = ?",
+            [(profile.domain, _signed(fp)) for fp in forgotten],
+        )
+
+    def _simhash(self, line: str, key: Hashable | None) -> int:
+        if key is None:
+            return simhash(normalize_block(line))
+        fingerprint = self._simhashes.get(key)
+        if fingerprint is None:
+            if len(self._simhashes) >= MAX_SIMHASHES:
+                self._simhashes.clear()
+            fingerprint = self._simhashes[key] = simhash(normalize_block(line))
+        return fingerprint
+
+    def _fingerprints(
+        self,
+        profile: DomainProfile,
+        lines: list[str],
+        keys: list[Hashable] | None = None,
+        learn: bool = True,
+    ) -> list[int | None]:
+        fingerprints: list[int | None] = []
+        for i, line in enumerate(lines):
+            if not line.strip():
+                fingerprints.append(None)
+                continue
+            fingerprint = self._simhash(line, keys[i] if keys is not None else None)
+            max_distance = 0 if has_number(line) else self.max_distance
+            match = profile.match(fingerprint, max_distance)
+            if match is None and learn:
+                profile.add(fingerprint)
+                match = fingerprint
+            fingerprints.append(match)
+        return fingerprints
+
+    def _dropped(
+        self, profile: DomainProfile, lines: list[str], fingerprints: list[int | None]
+    ) -> list[bool]:
+        if len(profile.pages) < self.min_pages:
+            return [False] * len(lines)
+        dropped = [
+            profile.share(fp) >= self.threshold and not is_disclosure(line)
+            for line, fp in zip(lines, fingerprints)
+        ]
+        # a repeated heading stays when the section under it isn't boilerplate
+        for i, line in enumerate(lines):
+            if dropped[i] and line.startswith("#"):
+                for j in range(i + 1, len(lines)):
+                    if lines[j].startswith("#"):
+                        break
+                    if lines[j].strip() and not dropped[j]:
+                        dropped[i] = False
+                        break
+        return dropped
+
+    def _filter(
+        self,
+        url: str,
+        lines: list[str],
+        model: str,
+        keys: list[Hashable] | None = None,
+    ) -> list[bool]:
+        """records the lines of a page and flags the boilerplate ones"""
+        with self._lock:
+            profile = self._profile(domain_of(url))
+            page = page_key(url)
+            learn = page not in profile.pages and len(profile.pages) < self.max_pages
+            fingerprints = self._fingerprints(profile, lines, keys, learn)
+            if learn:
+                self._observe(
+                    profile, page, {fp for fp in fingerprints if fp is not None}
+                )
+            dropped = self._dropped(profile, lines, fingerprints)
+
+            removed = "\n".join(line for line, drop in zip(lines, dropped) if drop)
+            saved = count_tokens(removed, model) if removed else 0
+            profile.tokens_seen += count_tokens("\n".join(lines), model)
+            profile.tokens_saved += saved
+            self._db.execute(
+                "INSERT OR REPLACE INTO boilerplate_tokens (domain, seen, saved) "
+                "VALUES (?, ?, ?)",
+                (profile.domain, profile.tokens_seen, profile.tokens_saved),
+            )
+            self._db.commit()
+        if saved:
+            TOKENS_SAVED.inc(saved)
+        return dropped
+
+    def strip(self, url: str, text: str, model: str = "") -> str:
+        """records the blocks of the page and removes the boilerplate of its domain
+
+        Args:
+            url: url of the page
+            text: text extracted from the page, one block per line
+            model: model the text is sent to, to count the tokens saved
+
+        Returns:
+            the text without its boilerplate blocks, unchanged when none was found
+        """
+        lines = text.split("\n")
+        dropped = self._filter(url, lines, model)
+        if not any(dropped):
+            return text
+        kept = [line for line, drop in zip(lines, dropped) if not drop]
+        return re.sub(r"\n{3,}", "\n\n", "\n".join(kept)).strip("\n")
+
+    def strip_page(
+        self, url: str, page: ExtractedPage, model: str = ""
+    ) -> ExtractedPage:
+        """`strip` for the blocks of a page, the simhashes of its blocks are
+        looked up by their content hash
+
+        Returns:
+            the page without its boilerplate blocks (sharing its buffer), the same
+            page when none was found
+        """
+        lines = [page.line(i) for i in range(len(page))]
+        keys: list[Hashable] = [
+            (block_hash, page.level(i)) for i, block_hash in enumerate(page.hashes)
+        ]
+        dropped = self._filter(url, lines, model, keys)
+        if not any(dropped):
+            return page
+        return page.select(i for i, drop in enumerate(dropped) if not drop)
+
+    def stats(self) -> list[BoilerplateStats]:
+        """pages, blocks and tokens saved of every domain seen since the start"""
+        with self._lock:
+            return [
+                BoilerplateStats(
+                    domain=profile.domain,
+                    pages=len(profile.pages),
+                    blocks=len(profile.counts),
+                    boilerplate_blocks=(
+                        sum(
+                            profile.share(fp) >= self.threshold for fp in profile.counts
+                        )
+                        if len(profile.pages) >= self.min_pages
+                        else 0
+                    ),
+                    tokens_seen=profile.tokens_seen,
+                    tokens_saved=profile.tokens_saved,
+                )
+                for profile in self._profiles.values()
+            ]
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
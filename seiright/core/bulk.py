@@ -0,0 +1,279 @@
+"""Bulk checks of lists of urls, outside of the api.
+
+Urls are read from a text (one url per line), csv or parquet file and checked with
+`ComplianceChecker.achat_many`. The verdicts are written as they finish, as json
+lines or as parquet (a directory of part files, one per `batch_size` verdicts).
+
+The output doubles as the checkpoint: a run started again with the same output
+skips the urls it already holds, so an interrupted run resumes where it stopped.
+Verdicts are flushed in batches, a run killed outright redoes at most the last
+batch. With `retry_failed`, urls which failed are checked again, their new verdict
+is appended after the failed one.
+
+Parquet requires the optional `pandas` and `pyarrow` dependencies.
+"""
+
+import csv
+import json
+import logging
+import os
+from pathlib import Path
+from time import perf_counter
+from typing import Any, Iterable, Protocol
+
+from ._types import BulkSummary, PageVerdict
+from .assemble import ComplianceChecker
+from .ratelimit import BATCH, priority
+
+logger = logging.getLogger(__name__)
+
+JSONL_SUFFIXES = (".jsonl", ".ndjson", ".json")
+# dtypes of the parquet columns, so that parts without a value of a column (e.g.
+# only failures) keep the schema of the others
+PARQUET_DTYPES = {
+    "url": "string",
+    "is_compliant": "boolean",
+    "confidence_score": "float64",
+    "reasoning": "string",
+    "error": "string",
+}
+
+
+def _pandas() -> Any:
+    try:
+        import pandas
+    except ImportError as e:
+        raise ImportError(
+            "Parquet files require pandas and pyarrow, install them with "
+            "`pip install pandas pyarrow`"
+        ) from e
+    return pandas
+
+
+def read_urls(path: str | Path, column: str | None = None) -> list[str]:
+    """urls of a file, in order and without duplicates
+
+    Args:
+        path: `.parquet` or `.csv` file, any other file is read as text with one
+            url per line (blank lines and `#` comments are skipped)
+        column: column of the urls (csv and parquet), defaults to `url` when there
+            is one and to the first column otherwise
+
+    Returns:
+        urls of the file
+    """
+    path = Path(path)
+    suffix = path.suffix.lower()
+    if suffix == ".parquet":
+        frame = _pandas().read_parquet(path)
+        name = column or ("url" if "url" in frame.columns else frame.columns[0])
+        urls = frame[name].dropna().astype(str).tolist()
+    elif suffix == ".csv":
+        with open(path, newline="", encoding="utf-8") as f:
+            rows = list(csv.reader(f))
+        header = rows[0] if rows else []
+        if column is not None:
+            if column not in header:
+                raise ValueError(f"{path} has no column {column}")
+            index, rows = header.index(column), rows[1:]
+        elif "url" in header:
+            index, rows = header.index("url"), rows[1:]
+        else:
+            # no header, unless the first row isn't a url
+            index = 0
+            if header and "://" not in header[0]:
+                rows = rows[1:]
+        urls = [row[index] for row in rows if len(row) > index]
+    else:
+        with open(path, encoding="utf-8") as f:
+            urls = [line for line in f if not line.lstrip().startswith("#")]
+    return list(dict.fromkeys(url.strip() for url in urls if url.strip()))
+
+
+def _completed(rows: Iterable[tuple[str, bool]], retry_failed: bool) -> set[str]:
+    succeeded: set[str] = set()
+    failed: set[str] = set()
+    for url, ok in rows:
+        (succeeded if ok else failed).add(url)
+    return succeeded if retry_failed else succeeded | failed
+
+
+class ResultWriter(Protocol):
+    def completed(self, retry_failed: bool = False) -> set[str]: ...
+
+    def write(self, verdict: PageVerdict) -> None: ...
+
+    def close(self) -> None: ...
+
+
+class JsonlWriter:
+    """Appends the verdicts to a json lines file, one `PageVerdict` per line
+
+    Args:
+        path: path of the file, the verdicts already in it are kept
+        flush_every: number of verdicts written between two flushes to disk
+    """
+
+    def __init__(self, path: str | Path, flush_every: int = 100):
+        self.path = Path(path)
+        self.flush_every = flush_every
+        self._rows: list[tuple[str, bool]] = []
+        if self.path.exists():
+            self._load()
+        self._file = open(self.path, "a", encoding="utf-8")
+        self._unflushed = 0
+
+    def _load(self) -> None:
+        with open(self.path, "rb+") as f:
+            content = f.read()
+            # a line cut short by a kill is dropped, its url is checked again
+            end = content.rfind(b"\n") + 1
+            if end < len(content):
+                f.truncate(end)
+        for line in content[:end].splitlines():
+            if line.strip():
+                row = json.loads(line)
+                self._rows.append((row["url"], row.get("error") is None))
+
+    def completed(self, retry_failed: bool = False) -> set[str]:
+        """urls already in the file"""
+        return _completed(self._rows, retry_failed)
+
+    def write(self, verdict: PageVerdict) -> None:
+        self._file.write(verdict.model_dump_json() + "\n")
+        self._unflushed += 1
+        if self._unflushed >= self.flush_every:
+            self.flush()
+
+    def flush(self) -> None:
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._unflushed = 0
+
+    def close(self) -> None:
+        if not self._file.closed:
+            self.flush()
+            self._file.close()
+
+
+class ParquetWriter:
+    """Writes the verdicts to a directory of parquet files, `part-00000.parquet`,
+    `part-00001.parquet`... Every part is written to a temporary file and renamed,
+    so a part is either complete or absent
+
+    Args:
+        path: path of the directory, the parts already in it are kept
+        batch_size: number of verdicts of a part
+    """
+
+    def __init__(self, path: str | Path, batch_size: int = 1000):
+        self.pandas = _pandas()
+        self.path = Path(path)
+        self.batch_size = batch_size
+        self.path.mkdir(parents=True, exist_ok=True)
+        self._parts = sorted(self.path.glob("part-*.parquet"))
+        self._buffer: list[dict] = []
+
+    def completed(self, retry_failed: bool = False) -> set[str]:
+        """urls of the parts already in the directory"""
+        rows: list[tuple[str, bool]] = []
+        for part in self._parts:
+            frame = self.pandas.read_parquet(part, columns=["url", "error"])
+            rows.extend(zip(frame["url"], frame["error"].isna()))
+        return _completed(rows, retry_failed)
+
+    def write(self, verdict: PageVerdict) -> None:
+        self._buffer.append(verdict.model_dump())
+        if len(self._buffer) >= self.batch_size:
+            self.flush()
+
+    def flush(self) -> None:
+        if not self._buffer:
+            return
+        frame = self.pandas.DataFrame(self._buffer, columns=list(PARQUET_DTYPES))
+        part = self.path / f"part-{len(self._parts):05d}.parquet"
+        tmp = part.with_name(f".{part.name}.tmp")
+        frame.astype(PARQUET_DTYPES).to_parquet(tmp, index=False)
+        os.replace(tmp, part)
+        self._parts.append(part)
+        self._buffer = []
+
+    def close(self) -> None:
+        self.flush()
+
+
+def open_writer(
+    path: str | Path, format: str | None = None, batch_size: int = 1000
+) -> ResultWriter:
+    """writer of the verdicts, `format` (`jsonl` or `parquet`) defaults to the
+    suffix of `path`"""
+    if format is None:
+        suffix = Path(path).suffix.lower()
+        if suffix in JSONL_SUFFIXES:
+            format = "jsonl"
+        elif suffix == ".parquet":
+            format = "parquet"
+        else:
+            raise ValueError(f"Unable to tell the format of {path}, set it")
+    if format == "jsonl":
+        return JsonlWriter(path, flush_every=min(batch_size, 100))
+    if format == "parquet":
+        return ParquetWriter(path, batch_size=batch_size)
+    raise ValueError(f"Unknown output format {format}")
+
+
+async def run_bulk(
+    checker: ComplianceChecker,
+    urls: list[str],
+    writer: ResultWriter,
+    max_fetches: int = 16,
+    max_llm_calls: int = 8,
+    retry_failed: bool = False,
+    log_every: int = 1000,
+) -> BulkSummary:
+    """checks the urls not yet in the output of `writer` and writes their verdicts
+    as they finish
+
+    Args:
+        checker: checker of the pages
+        urls: urls to check
+        writer: output of the verdicts, it is not closed
+        max_fetches: maximum number of pages crawled at the same time
+        max_llm_calls: maximum number of llm calls in flight at the same time
+        retry_failed: whether to check again the urls which failed in a previous run
+        log_every: number of verdicts between two progress logs
+
+    Returns:
+        counts of the run
+    """
+    completed = writer.completed(retry_failed)
+    todo = [url for url in urls if url not in completed]
+    summary = BulkSummary(urls=len(urls), skipped=len(urls) - len(todo))
+    if summary.skipped:
+        logger.info(f"resuming, {summary.skipped} urls were already checked")
+    started = perf_counter()
+    # the llm budget goes to the interactive checks first, if any share it
+    with priority(BATCH):
+        async for url, result in checker.achat_many(
+            todo, max_fetches=max_fetches, max_llm_calls=max_llm_calls
+        ):
+            if isinstance(result, Exception):
+                verdict = PageVerdict(
+                    url=url, error=f"{type(result).__name__}: {result}"
+                )
+                summary.failed += 1
+            else:
+                verdict = PageVerdict(
+                    url=url,
+                    is_compliant=result.is_compliant,
+                    confidence_score=result.confidence_score,
+                    reasoning=result.reasoning,
+                )
+                summary.checked += 1
+            writer.write(verdict)
+            done = summary.checked + summary.failed
+            if done % log_every == 0:
+                rate = done / (perf_counter() - started)
+                logger.info(f"{done}/{len(todo)} urls checked, {rate:.1f} urls/s")
+    summary.seconds = perf_counter() - started
+    return summary
@@ -0,0 +1,161 @@
+"""Content addressed cache of compliance verdicts.
+
+A verdict only depends on the text sent to the llm, the prompts and the model
+that produced it, so the cache key is derived from exactly those. Entries live
+in an in-memory LRU and, optionally, in a sqlite file so that they survive
+restarts.
+"""
+
+import asyncio
+import hashlib
+import logging
+import sqlite3
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from time import time
+
+from ._types import CacheStats, LLMProvider, LLMResponse
+from .prompts import SeiPrompts
+
+logger = logging.getLogger(__name__)
+
+
+def verdict_key(
+    text: str,
+    llm_provider: LLMProvider | str,
+    model: str,
+    prompts_version: str | None = None,
+) -> str:
+    """builds the cache key of a verdict
+
+    Args:
+        text: reformatted text of the webpage (output of `reformat_extracted_text`)
+        llm_provider: llm provider used for the check
+        model: model used for the check
+        prompts_version: hash of the system prompt and properties, defaults to
+            the currently loaded prompts
+
+    Returns:
+        sha256 hex digest
+    """
+    prompts_version = prompts_version or SeiPrompts.version
+    text_hash = hashlib.sha256(text.encode("utf-8")).hexdigest()
+    raw = f"{text_hash}:{prompts_version}:{llm_provider}:{model}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class VerdictCache:
+    """Two tier (memory LRU + optional sqlite) cache of `LLMResponse`s with TTL
+
+    Args:
+        maxsize: maximum number of entries kept in memory
+        ttl: time to live of an entry in seconds
+        db_path: path of the sqlite file. If `None`, only the memory tier is used
+    """
+
+    def __init__(
+        self,
+        maxsize: int = 1024,
+        ttl: float = 24 * 60 * 60,
+        db_path: str | Path | None = None,
+    ):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._memory: OrderedDict[str, tuple[float, LLMResponse]] = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._memory_hits = 0
+        self._disk_hits = 0
+
+        self._db: sqlite3.Connection | None = None
+        if db_path is not None:
+            self._db = sqlite3.connect(str(db_path), check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS verdicts "
+                "(key TEXT PRIMARY KEY, response TEXT NOT NULL, created_at REAL NOT NULL)"
+            )
+            self._db.commit()
+
+    def get(self, key: str) -> LLMResponse | None:
+        now = time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                created_at, response = entry
+                if now - created_at < self.ttl:
+                    self._memory.move_to_end(key)
+                    self._hits += 1
+                    self._memory_hits += 1
+                    return response
+                del self._memory[key]
+
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT response, created_at FROM verdicts WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None:
+                    created_at = row[1]
+                    if now - created_at < self.ttl:
+                        response = LLMResponse.model_validate_json(row[0])
+                        self._put_memory(key, created_at, response)
+                        self._hits += 1
+                        self._disk_hits += 1
+                        return response
+                    self._db.execute("DELETE FROM verdicts WHERE key = ?", (key,))
+                    self._db.commit()
+
+            self._misses += 1
+            return None
+
+    def set(self, key: str, response: LLMResponse) -> None:
+        created_at = time()
+        with self._lock:
+            self._put_memory(key, created_at, response)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO verdicts (key, response, created_at) VALUES (?, ?, ?)",
+                    (key, response.model_dump_json(), created_at),
+                )
+                self._db.commit()
+
+    async def aget(self, key: str) -> LLMResponse | None:
+        """`get` for the event loop, the sqlite tier is read in a thread"""
+        if self._db is None:
+            return self.get(key)
+        return await asyncio.to_thread(self.get, key)
+
+    async def aset(self, key: str, response: LLMResponse) -> None:
+        """`set` for the event loop, the sqlite tier is written in a thread"""
+        if self._db is None:
+            return self.set(key, response)
+        await asyncio.to_thread(self.set, key, response)
+
+    def _put_memory(self, key: str, created_at: float, response: LLMResponse) -> None:
+        self._memory[key] = (created_at, response)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.maxsize:
+            self._memory.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._memory.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM verdicts")
+                self._db.commit()
+
+    def stats(self) -> CacheStats:
+        with self._lock:
+            return CacheStats(
+                hits=self._hits,
+                misses=self._misses,
+                memory_hits=self._memory_hits,
+                disk_hits=self._disk_hits,
+                size=len(self._memory),
+            )
+
+    def close(self) -> None:
+        if self._db is not None:
+            self._db.close()
+            self._db = None
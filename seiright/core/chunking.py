@@ -0,0 +1,194 @@
+"""Token aware chunking of long pages and reduction of the per chunk verdicts.
+
+Long pages are split on their headings (`extract_text_from_url` prefixes them with
+`#`), packed into chunks below a token budget, checked concurrently and the chunk
+verdicts are reduced into a single verdict for the page.
+"""
+
+import logging
+import re
+from functools import lru_cache
+from typing import Any, Callable
+
+from ._types import LLMResponse, ReductionRule
+
+logger = logging.getLogger(__name__)
+
+HEADING = re.compile(r"^(?=#{1,6} )", re.MULTILINE)
+TITLE_BANNER = re.compile(r"\A=*Title: .*=*\n")
+
+
+@lru_cache(maxsize=16)
+def _tiktoken_encoding(model: str) -> Any:
+    try:
+        import tiktoken
+    except ImportError:
+        return None
+    try:
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            return tiktoken.get_encoding("o200k_base")
+    except Exception as e:
+        logger.warning(f"unable to load the tiktoken encoding of {model}: {e!r}")
+        return None
+
+
+def count_tokens(text: str, model: str = "") -> int:
+    """number of tokens of `text`. Uses the `tiktoken` encoding of the model when
+    it is available (optional dependency) and a 4 characters per token estimate
+    otherwise
+
+    Args:
+        text: text to count the tokens of
+        model: model the text is sent to
+
+    Returns:
+        number of tokens
+    """
+    encoding = _tiktoken_encoding(model)
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    return (len(text) + 3) // 4
+
+
+def split_sections(text: str) -> list[str]:
+    """splits the text of a page on its headings, every section starts with its
+    heading (the text before the first heading is a section of its own)"""
+    return [section for section in HEADING.split(text) if section.strip()]
+
+
+def _split_oversized(
+    section: str, max_tokens: int, tokens: Callable[[str], int]
+) -> list[str]:
+    parts: list[str] = []
+    current: list[str] = []
+    current_tokens = 0
+    for line in section.splitlines(keepends=True):
+        line_tokens = tokens(line)
+        if line_tokens > max_tokens:
+            words = line.split(" ")
+            step = max(1, len(words) * max_tokens // line_tokens)
+            pieces = [" ".join(words[i : i + step]) for i in range(0, len(words), step)]
+        else:
+            pieces = [line]
+        for piece in pieces:
+            piece_tokens = tokens(piece)
+            if current and current_tokens + piece_tokens > max_tokens:
+                parts.append("".join(current))
+                current, current_tokens = [], 0
+            current.append(piece)
+            current_tokens += piece_tokens
+    if current:
+        parts.append("".join(current))
+    return parts
+
+
+def chunk_text(text: str, max_tokens: int, model: str = "") -> list[str]:
+    """splits the text of a page into chunks of at most `max_tokens` tokens, on
+    heading boundaries whenever possible. The title banner added by
+    `reformat_extracted_text` is repeated at the top of every chunk.
+
+    Args:
+        text: (reformatted) text of the page
+        max_tokens: token budget of a chunk
+        model: model the chunks are sent to, to count the tokens
+
+    Returns:
+        chunks of the text
+    """
+
+    def tokens(s: str) -> int:
+        return count_tokens(s, model)
+
+    if tokens(text) <= max_tokens:
+        return [text]
+
+    banner_match = TITLE_BANNER.match(text)
+    banner = banner_match.group(0) if banner_match else ""
+    body = text[len(banner) :]
+    budget = max(1, max_tokens - tokens(banner))
+
+    chunks: list[str] = []
+    current: list[str] = []
+    current_tokens = 0
+    for section in split_sections(body):
+        section_tokens = tokens(section)
+        pieces = (
+            _split_oversized(section, budget, tokens)
+            if section_tokens > budget
+            else [section]
+        )
+        for piece in pieces:
+            piece_tokens = tokens(piece) if len(pieces) > 1 else section_tokens
+            if current and current_tokens + piece_tokens > budget:
+                chunks.append(banner + "".join(current))
+                current, current_tokens = [], 0
+            current.append(piece)
+            current_tokens += piece_tokens
+    if current:
+        chunks.append(banner + "".join(current))
+    return chunks
+
+
+def reduce_verdicts(
+    responses: list[LLMResponse],
+    weights: list[float] | None = None,
+    rule: ReductionRule = "any_non_compliant",
+) -> LLMResponse:
+    """combines the verdicts of the chunks of a page into the verdict of the page
+
+    Args:
+        responses: verdict of every chunk, in page order
+        weights: weight of every chunk (e.g. its number of tokens), defaults to 1
+        rule: `any_non_compliant`, the page is non compliant as soon as one chunk
+            is, with the confidence of the most confident non compliant chunk (or of
+            the least confident chunk when all are compliant).
+            `confidence_weighted`, every chunk votes with its confidence times its
+            weight, the sign of the vote decides the verdict and its margin the
+            confidence
+
+    Returns:
+        verdict of the page
+    """
+    if not responses:
+        raise ValueError("At least one response is required to reduce verdicts")
+    if len(responses) == 1:
+        return responses[0]
+    weights = weights or [1.0] * len(responses)
+
+    non_compliant = [r for r in responses if not r.is_compliant]
+    if rule == "any_non_compliant":
+        is_compliant = not non_compliant
+        if non_compliant:
+            confidence_score = max(r.confidence_score for r in non_compliant)
+        else:
+            confidence_score = min(r.confidence_score for r in responses)
+    elif rule == "confidence_weighted":
+        total = sum(r.confidence_score * w for r, w in zip(responses, weights))
+        vote = sum(
+            r.confidence_score * w * (1 if r.is_compliant else -1)
+            for r, w in zip(responses, weights)
+        )
+        score = vote / total if total else 0.0
+        is_compliant = score >= 0
+        confidence_score = abs(score)
+    else:
+        raise ValueError(f"Unknown reduction rule {rule}")
+
+    reasoning = "\n".join(
+        f"[part {i}/{len(responses)}] {r.reasoning}"
+        for i, r in enumerate(responses, start=1)
+        if is_compliant or not r.is_compliant
+    )
+    return LLMResponse(
+        model=responses[0].model,
+        llm_provider=responses[0].llm_provider,
+        is_compliant=is_compliant,
+        reasoning=reasoning,
+        input_msg="\n".join(r.input_msg for r in responses),
+        confidence_score=confidence_score,
+        cached_tokens=sum(r.cached_tokens for r in responses),
+        uncached_tokens=sum(r.uncached_tokens for r in responses),
+        completion_tokens=sum(r.completion_tokens for r in responses),
+    )
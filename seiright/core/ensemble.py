@@ -0,0 +1,177 @@
+"""Cross checks a page with several llms.
+
+The same text is sent to every member (provider/model pair) concurrently. By
+default the check returns as soon as a quorum of members agree on
+`is_compliant` and the calls still in flight are cancelled, so a verdict costs
+roughly the latency of the fastest agreeing members. In comparison mode every
+member is awaited, to compare the models against each other.
+"""
+
+import asyncio
+import logging
+import time
+
+from ._types import EnsembleVerdict, LLMProvider, LLMResponse, MemberVerdict
+from .assemble import ComplianceChecker
+
+logger = logging.getLogger(__name__)
+
+
+def parse_members(spec: str) -> list[tuple[LLMProvider, str]]:
+    """parses a comma separated list of `provider:model`, e.g.
+    `openai:gpt-4o,anthropic:claude-3-5-sonnet-20240620`"""
+    members = []
+    for member in spec.split(","):
+        if member.strip():
+            provider, _, model = member.strip().partition(":")
+            if not model:
+                raise ValueError(f"expected `provider:model`, got {member!r}")
+            members.append((LLMProvider(provider.lower()), model))
+    return members
+
+
+class EnsembleChecker:
+    """Checks pages with several provider/model pairs concurrently
+
+    Args:
+        members: checkers of the provider/model pairs, at least one
+        quorum: number of members which must agree on `is_compliant` to settle the
+            verdict, defaults to a majority of the members
+
+    Usage:
+        ensemble = EnsembleChecker.from_models(
+            [(LLMProvider.OPENAI, "gpt-4o"), (LLMProvider.ANTHROPIC, "claude-3-5-sonnet-20240620")],
+            quorum=2,
+        )
+        verdict = await ensemble.achat("https://mercury.com")
+    """
+
+    def __init__(self, members: list[ComplianceChecker], quorum: int | None = None):
+        if not members:
+            raise ValueError("an ensemble needs at least one member")
+        quorum = quorum or len(members) // 2 + 1
+        if not 0 < quorum <= len(members):
+            raise ValueError(f"quorum must be between 1 and {len(members)}")
+        self.members = members
+        self.quorum = quorum
+
+    @classmethod
+    def from_models(
+        cls,
+        models: list[tuple[LLMProvider, str]],
+        quorum: int | None = None,
+        **checker_kwargs,
+    ) -> "EnsembleChecker":
+        """builds an ensemble out of provider/model pairs, `checker_kwargs` (caches,
+        extractor config, chunking) are passed to the checker of every member"""
+        members = [
+            ComplianceChecker(llm_provider=provider, model=model, **checker_kwargs)
+            for provider, model in models
+        ]
+        return cls(members, quorum=quorum)
+
+    async def achat(self, url: str, compare: bool = False) -> EnsembleVerdict:
+        webcontent = await self.members[0].awebpage(url=url)
+        return await self.acheck_text(webcontent, compare=compare)
+
+    async def acheck_text(self, text: str, compare: bool = False) -> EnsembleVerdict:
+        """checks `text` with every member
+
+        Args:
+            text: reformatted text of the webpage
+            compare: wait for every member instead of stopping at the quorum
+
+        Returns:
+            the verdict of the ensemble and of each of its members
+        """
+        start = time.perf_counter()
+
+        async def check(i: int) -> tuple[int, LLMResponse | Exception, float]:
+            member = self.members[i]
+            t0 = time.perf_counter()
+            response: LLMResponse | Exception
+            try:
+                response = await member.acheck_text(text)
+            except Exception as e:
+                logger.warning(f"{member.llm_provider}:{member.model} failed: {e!r}")
+                response = e
+            return i, response, time.perf_counter() - t0
+
+        tasks = [asyncio.create_task(check(i)) for i in range(len(self.members))]
+        results: dict[int, tuple[LLMResponse | Exception, float]] = {}
+        votes = {True: 0, False: 0}
+        settled: bool | None = None
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                i, response, latency = await next_done
+                results[i] = (response, latency)
+                if isinstance(response, LLMResponse):
+                    votes[response.is_compliant] += 1
+                    if settled is None and votes[response.is_compliant] >= self.quorum:
+                        settled = response.is_compliant
+                        if not compare:
+                            break
+        finally:
+            for task in tasks:
+                task.cancel()
+
+        members = [self.member_verdict(i, results.get(i)) for i in range(len(tasks))]
+        return summarize_ensemble(
+            members,
+            quorum=self.quorum,
+            settled=settled,
+            latency=time.perf_counter() - start,
+        )
+
+    def member_verdict(
+        self, i: int, result: tuple[LLMResponse | Exception, float] | None
+    ) -> MemberVerdict:
+        member = self.members[i]
+        verdict = MemberVerdict(llm_provider=member.llm_provider, model=member.model)
+        if result is None:
+            return verdict
+        response, latency = result
+        verdict.latency = latency
+        if isinstance(response, Exception):
+            verdict.status = "failed"
+            verdict.error = repr(response)
+        else:
+            verdict.status = "succeeded"
+            verdict.is_compliant = response.is_compliant
+            verdict.confidence_score = response.confidence_score
+            verdict.reasoning = response.reasoning
+        return verdict
+
+    async def aclose(self) -> None:
+        for member in self.members:
+            await member.aclose()
+
+
+def summarize_ensemble(
+    members: list[MemberVerdict],
+    quorum: int,
+    settled: bool | None,
+    latency: float,
+) -> EnsembleVerdict:
+    """combines the verdicts of the members. Without a quorum the majority of the
+    members which answered wins, a tie is reported as non compliant so that the
+    page gets reviewed"""
+    answered = [m for m in members if m.status == "succeeded"]
+    if settled is not None:
+        is_compliant: bool | None = settled
+    elif answered:
+        compliant = sum(bool(m.is_compliant) for m in answered)
+        is_compliant = compliant > len(answered) - compliant
+    else:
+        is_compliant = None
+    agreeing = [m for m in answered if m.is_compliant == is_compliant]
+    scores = [m.confidence_score for m in agreeing if m.confidence_score is not None]
+    return EnsembleVerdict(
+        is_compliant=is_compliant,
+        quorum=quorum,
+        quorum_reached=settled is not None,
+        agreement=len(agreeing) / len(answered) if answered else 0.0,
+        confidence_score=sum(scores) / len(scores) if scores else None,
+        latency=latency,
+        members=members,
+    )
@@ -0,0 +1,347 @@
+"""Streaming extraction of the text of a webpage.
+
+The html is fed in chunks, as it is downloaded, and text blocks are emitted as
+soon as their element closes, no document tree is ever built. Subtrees which
+never contain page copy (scripts, styles, navigation, ...) are skipped and the
+extraction stops once a byte, text or parse time limit is reached, so the cost of a
+page is bounded no matter how large it is.
+"""
+
+import codecs
+import re
+import time
+from html.parser import HTMLParser
+from typing import Any, Protocol
+
+from ._types import ExtractorConfig
+from .blocks import ExtractedPage
+
+BLOCK_TAGS = frozenset(["p", "h1", "h2", "h3", "h4", "h5", "h6", "li"])
+SKIPPED_TAGS = frozenset(
+    ["script", "style", "nav", "noscript", "template", "svg", "iframe"]
+)
+META_CHARSET = re.compile(rb"""<meta[^>]+charset=["']?([\w-]+)""", re.IGNORECASE)
+WHITESPACE = re.compile(r"\s+")
+
+
+class BlockCollector:
+    """Turns start/end/data parser events into text blocks.
+
+    Text is attributed to the innermost open block, when a block opens inside
+    another one the text collected so far for the outer block is emitted first,
+    so every piece of text ends up in exactly one block, in document order. Every
+    block is recorded with `position`, the offset of the chunk being parsed.
+    """
+
+    def __init__(self, collect_links: bool = False):
+        self.collect_links = collect_links
+        self.blocks: list[tuple[str, str]] = []
+        self.positions: list[int] = []
+        self.position = 0
+        self.text_size = 0
+        self.title: str | None = None
+        self.links: list[str] = []
+        self.canonical: str | None = None
+
+        self._open: list[tuple[str, list[str]]] = []
+        self._skip_depth = 0
+        self._in_title = False
+        self._title: list[str] = []
+
+    def start(self, tag: str, attrs: dict[str, str | None]) -> None:
+        tag = tag.lower()
+        if self._skip_depth or tag in SKIPPED_TAGS:
+            self._skip_depth += tag in SKIPPED_TAGS
+        elif tag == "title":
+            self._in_title = self.title is None
+        elif tag == "link" and self.collect_links:
+            if "canonical" in (attrs.get("rel") or "").lower().split():
+                self.canonical = self.canonical or attrs.get("href")
+        elif tag == "a" and self.collect_links and attrs.get("href"):
+            self.links.append(attrs["href"])  # type: ignore
+        elif tag in BLOCK_TAGS:
+            if self._open:
+                self._emit(*self._open[-1])
+                self._open[-1][1].clear()
+            self._open.append((tag, []))
+
+    def end(self, tag: str) -> None:
+        tag = tag.lower()
+        if tag == "title" and self._in_title:
+            self._in_title = False
+            self.title = WHITESPACE.sub(" ", "".join(self._title)).strip() or None
+        if tag in SKIPPED_TAGS and self._skip_depth:
+            self._skip_depth -= 1
+            return
+        if self._skip_depth or tag not in BLOCK_TAGS:
+            return
+        for i in range(len(self._open) - 1, -1, -1):
+            if self._open[i][0] == tag:
+                while len(self._open) > i:
+                    self._emit(*self._open.pop())
+                return
+
+    def data(self, data: str) -> None:
+        if self._in_title:
+            self._title.append(data)
+        elif self._open and not self._skip_depth:
+            self._open[-1][1].append(data)
+
+    def close(self) -> None:
+        while self._open:
+            self._emit(*self._open.pop())
+
+    def _emit(self, tag: str, parts: list[str]) -> None:
+        text = WHITESPACE.sub(" ", "".join(parts)).strip()
+        if text:
+            self.blocks.append((tag, text))
+            self.positions.append(self.position)
+            self.text_size += len(text)
+
+
+class ParserBackend(Protocol):
+    def feed(self, chunk: bytes) -> None: ...
+
+    def close(self) -> None: ...
+
+
+class _HTMLParserAdapter(HTMLParser):
+    def __init__(self, collector: BlockCollector):
+        super().__init__(convert_charrefs=True)
+        self.collector = collector
+
+    def handle_starttag(self, tag: str, attrs: list[tuple[str, str | None]]) -> None:
+        self.collector.start(tag, dict(attrs))
+
+    def handle_startendtag(self, tag: str, attrs: list[tuple[str, str | None]]):
+        self.collector.start(tag, dict(attrs))
+        self.collector.end(tag)
+
+    def handle_endtag(self, tag: str) -> None:
+        self.collector.end(tag)
+
+    def handle_data(self, data: str) -> None:
+        self.collector.data(data)
+
+
+class HTMLParserBackend:
+    """pure python backend, built on the standard library `html.parser`"""
+
+    def __init__(self, collector: BlockCollector, encoding: str | None = None):
+        self.parser = _HTMLParserAdapter(collector)
+        self.encoding = encoding
+        self._decoder: Any = None
+
+    def feed(self, chunk: bytes) -> None:
+        if self._decoder is None:
+            encoding = self.encoding or sniff_encoding(chunk) or "utf-8"
+            try:
+                self._decoder = codecs.getincrementaldecoder(encoding)("replace")
+            except LookupError:
+                self._decoder = codecs.getincrementaldecoder("utf-8")("replace")
+        self.parser.feed(self._decoder.decode(chunk))
+
+    def close(self) -> None:
+        if self._decoder is not None:
+            self.parser.feed(self._decoder.decode(b"", final=True))
+        self.parser.close()
+
+
+class _LxmlTarget:
+    def __init__(self, collector: BlockCollector):
+        self.collector = collector
+
+    def start(self, tag: str, attrib: dict[str, str]) -> None:
+        self.collector.start(tag, dict(attrib))
+
+    def end(self, tag: str) -> None:
+        self.collector.end(tag)
+
+    def data(self, data: str) -> None:
+        self.collector.data(data)
+
+    def close(self) -> None:
+        pass
+
+
+class LxmlBackend:
+    """libxml2 backend (requires the optional `lxml` dependency). The parser is
+    driven through its target interface, so no tree is built"""
+
+    def __init__(self, collector: BlockCollector, encoding: str | None = None):
+        try:
+            from lxml import etree
+        except ImportError as e:
+            raise ImportError(
+                "The lxml parser backend requires lxml, install it with `pip install lxml`"
+            ) from e
+        self.parser = etree.HTMLParser(
+            target=_LxmlTarget(collector), encoding=encoding, recover=True
+        )
+        self._fed = False
+
+    def feed(self, chunk: bytes) -> None:
+        if chunk:
+            self._fed = True
+            self.parser.feed(chunk)
+
+    def close(self) -> None:
+        if self._fed:
+            self.parser.close()
+
+
+BACKENDS = {"html.parser": HTMLParserBackend, "lxml": LxmlBackend}
+
+
+def sniff_encoding(chunk: bytes) -> str | None:
+    if chunk.startswith(codecs.BOM_UTF8):
+        return "utf-8-sig"
+    match = META_CHARSET.search(chunk[:4096])
+    return match.group(1).decode("ascii") if match else None
+
+
+def content_type_encoding(content_type: str | None) -> str | None:
+    if content_type:
+        for param in content_type.split(";")[1:]:
+            key, _, value = param.strip().partition("=")
+            if key.lower() == "charset" and value:
+                return value.strip("\"'")
+    return None
+
+
+class StreamingExtractor:
+    """Incremental extractor of the text blocks of an html document
+
+    Args:
+        config: parser backend and size limits
+        encoding: encoding of the document, if known (e.g. from the Content-Type
+            header). Otherwise it is sniffed from the document
+        collect_links: whether to collect the `href` of links and the canonical url
+
+    Usage:
+        extractor = StreamingExtractor()
+        for chunk in response.iter_content(extractor.config.chunk_size):
+            extractor.feed(chunk)
+            if extractor.done:
+                break
+        page = extractor.page()
+    """
+
+    def __init__(
+        self,
+        config: ExtractorConfig | None = None,
+        encoding: str | None = None,
+        collect_links: bool = False,
+    ):
+        self.config = config or ExtractorConfig()
+        self.collector = BlockCollector(collect_links=collect_links)
+        self.backend: ParserBackend = BACKENDS[self.config.backend](
+            self.collector, encoding=encoding
+        )
+        self.bytes_read = 0
+        self.parse_seconds = 0.0
+        self.truncated = False
+        self._closed = False
+
+    @property
+    def done(self) -> bool:
+        """whether a limit was reached, the rest of the document can be discarded"""
+        return self.truncated or self._closed
+
+    def feed(self, chunk: bytes) -> list[tuple[str, str]]:
+        """parses the next chunk of the document
+
+        Args:
+            chunk: next bytes of the document
+
+        Returns:
+            text blocks (tag, text) completed by this chunk
+        """
+        if self.done:
+            return []
+        remaining = self.config.max_bytes - self.bytes_read
+        if len(chunk) >= remaining:
+            chunk = chunk[:remaining]
+            self.truncated = True
+        self.collector.position = self.bytes_read
+        self.bytes_read += len(chunk)
+        emitted = len(self.collector.blocks)
+        start = time.perf_counter()
+        self.backend.feed(chunk)
+        self.parse_seconds += time.perf_counter() - start
+        if self.collector.text_size >= self.config.max_text_chars:
+            self.truncated = True
+        max_seconds = self.config.max_parse_seconds
+        if max_seconds is not None and self.parse_seconds >= max_seconds:
+            self.truncated = True
+        return self.collector.blocks[emitted:]
+
+    def close(self) -> list[tuple[str, str]]:
+        if self._closed:
+            return []
+        emitted = len(self.collector.blocks)
+        start = time.perf_counter()
+        self.backend.close()
+        self.collector.close()
+        self.parse_seconds += time.perf_counter() - start
+        self._closed = True
+        return self.collector.blocks[emitted:]
+
+    @property
+    def blocks(self) -> list[tuple[str, str]]:
+        return self.collector.blocks
+
+    @property
+    def title(self) -> str | None:
+        return self.collector.title
+
+    def page(self) -> ExtractedPage:
+        """closes the extractor and returns its blocks, up to the one reaching
+        `max_text_chars` characters
+
+        Returns:
+            blocks and title of the page
+        """
+        self.close()
+        collector = self.collector
+        return ExtractedPage.from_blocks(
+            (
+                (tag, text, position)
+                for (tag, text), position in zip(collector.blocks, collector.positions)
+            ),
+            title=self.title,
+        ).head(self.config.max_text_chars)
+
+    def result(self) -> tuple[str, str | None]:
+        """closes the extractor and formats the blocks the same way the rest of the
+        pipeline expects them: headings are prefixed with `#` (one per level) and
+        blocks are separated by new lines
+
+        Returns:
+            extracted text and the title of the page
+        """
+        page = self.page()
+        return page.render(), page.title
+
+
+def extract_html(
+    html: str | bytes,
+    config: ExtractorConfig | None = None,
+    collect_links: bool = False,
+) -> StreamingExtractor:
+    """runs the streaming extractor over a complete document"""
+    config = config or ExtractorConfig()
+    if isinstance(html, str):
+        html = html.encode("utf-8")
+        encoding: str | None = "utf-8"
+    else:
+        encoding = None
+    extractor = StreamingExtractor(
+        config=config, encoding=encoding, collect_links=collect_links
+    )
+    for start in range(0, len(html), config.chunk_size):
+        extractor.feed(html[start : start + config.chunk_size])
+        if extractor.done:
+            break
+    extractor.close()
+    return extractor
@@ -0,0 +1,180 @@
+"""Compliance checker configured from the environment.
+
+The service (`seiright/app/main.py`) and the command line interface
+(`seiright/cli.py`) build their checker here, so that both read the same variables
+with the same defaults: caches (`VERDICT_CACHE_*`, `PAGE_CACHE_DB`), extraction
+limits, extraction workers, boilerplate removal, incremental checks, near
+duplicate reuse, llm rate limits and fallbacks, and chunking.
+"""
+
+import os
+
+from ..utils.utils import get_env_var
+from ._types import ExtractorConfig, LLMProvider
+from .assemble import ComplianceChecker
+from .boilerplate import BoilerplateFilter
+from .cache import VerdictCache
+from .ensemble import EnsembleChecker, parse_members
+from .incremental import BlockStore
+from .llms import get_llm
+from .neardup import NearDuplicateIndex
+from .ratelimit import llm_scheduler, parse_rate_limits
+from .router import LLMRouter
+from .web_crawler import PageCache
+from .workers import ExtractionPool
+
+DEFAULT_PROVIDER = LLMProvider.OPENAI
+DEFAULT_MODEL = "gpt4o"
+
+
+def env_flag(name: str, default: bool) -> bool:
+    return get_env_var(name, default=str(default)).lower() == "true"
+
+
+def configure_rate_limits() -> None:
+    """sets the limits of `LLM_RATE_LIMITS` upfront on the llm scheduler"""
+    for provider, model, rpm, tpm in parse_rate_limits(
+        os.getenv("LLM_RATE_LIMITS", "")
+    ):
+        llm_scheduler.configure(provider, model, rpm=rpm, tpm=tpm)
+
+
+def router_members(
+    provider: LLMProvider = DEFAULT_PROVIDER, model: str = DEFAULT_MODEL
+) -> list[tuple[LLMProvider, str]]:
+    """`provider`/`model` followed by the fallbacks of `LLM_FALLBACKS`"""
+    return [(provider, model)] + parse_members(os.getenv("LLM_FALLBACKS", ""))
+
+
+def ensemble_members() -> list[tuple[LLMProvider, str]]:
+    return parse_members(os.getenv("ENSEMBLE_MODELS", ""))
+
+
+def extractor_config() -> ExtractorConfig:
+    return ExtractorConfig(
+        backend=get_env_var("HTML_PARSER_BACKEND", default="html.parser"),
+        max_bytes=int(get_env_var("MAX_PAGE_BYTES", default=5 * 1024 * 1024)),
+        max_text_chars=int(get_env_var("MAX_PAGE_TEXT_CHARS", default=500_000)),
+        max_parse_seconds=float(get_env_var("MAX_PARSE_SECONDS", default=0)) or None,
+    )
+
+
+def verdict_cache() -> VerdictCache:
+    return VerdictCache(
+        maxsize=int(get_env_var("VERDICT_CACHE_SIZE", default=1024)),
+        ttl=float(get_env_var("VERDICT_CACHE_TTL", default=24 * 60 * 60)),
+        db_path=os.getenv("VERDICT_CACHE_DB"),
+    )
+
+
+def page_cache() -> PageCache:
+    return PageCache(db_path=get_env_var("PAGE_CACHE_DB", default=":memory:"))
+
+
+def extraction_pool() -> ExtractionPool | None:
+    workers = int(get_env_var("EXTRACTION_WORKERS", default=0))
+    if not workers:
+        return None
+    return ExtractionPool(
+        workers=workers,
+        min_bytes=int(get_env_var("EXTRACTION_MIN_BYTES", default=256 * 1024)),
+        min_chars=int(get_env_var("EXTRACTION_MIN_CHARS", default=64 * 1024)),
+        timeout=float(get_env_var("EXTRACTION_TIMEOUT", default=30)),
+    )
+
+
+def boilerplate_filter() -> BoilerplateFilter | None:
+    if not env_flag("STRIP_BOILERPLATE", default=False):
+        return None
+    return BoilerplateFilter(
+        db_path=get_env_var("BOILERPLATE_DB", default=":memory:"),
+        min_pages=int(get_env_var("BOILERPLATE_MIN_PAGES", default=5)),
+        threshold=float(get_env_var("BOILERPLATE_THRESHOLD", default=0.6)),
+    )
+
+
+def block_store() -> BlockStore | None:
+    if not env_flag("INCREMENTAL_CHECKS", default=False):
+        return None
+    return BlockStore(db_path=get_env_var("BLOCK_STORE_DB", default=":memory:"))
+
+
+def near_duplicates() -> NearDuplicateIndex | None:
+    # off by default: a page differing from a checked one by a removed
+    # disclosure would get its verdict
+    if not env_flag("REUSE_NEAR_DUPLICATES", default=False):
+        return None
+    return NearDuplicateIndex(
+        threshold=float(get_env_var("NEAR_DUPLICATE_THRESHOLD", default=0.95)),
+        db_path=get_env_var("NEAR_DUPLICATE_DB", default=":memory:"),
+        max_pages=int(get_env_var("NEAR_DUPLICATE_MAX_PAGES", default=100_000)),
+    )
+
+
+def llm_router(members: list[tuple[LLMProvider, str]]) -> LLMRouter:
+    # the sdk clients are built on first use, once the api keys are available
+    return LLMRouter(
+        [get_llm(provider, model) for provider, model in members],
+        hedge_percentile=float(get_env_var("LLM_HEDGE_PERCENTILE", default=95)),
+        failure_threshold=int(get_env_var("LLM_FAILURE_THRESHOLD", default=5)),
+        reset_timeout=float(get_env_var("LLM_RESET_TIMEOUT", default=30)),
+    )
+
+
+def build_checker(
+    provider: LLMProvider = DEFAULT_PROVIDER, model: str = DEFAULT_MODEL
+) -> ComplianceChecker:
+    """checker of `provider`/`model` (and its fallbacks) configured from the
+    environment, its stores are closed with `close_checker`"""
+    configure_rate_limits()
+    return ComplianceChecker(
+        llm_provider=provider,
+        model=model,
+        llm=llm_router(router_members(provider, model)),
+        verdict_cache=verdict_cache(),
+        page_cache=page_cache(),
+        extractor_config=extractor_config(),
+        max_chunk_tokens=int(get_env_var("MAX_CHUNK_TOKENS", default=8000)),
+        max_chunk_calls=int(get_env_var("MAX_CHUNK_CALLS", default=4)),
+        reduction=get_env_var("CHUNK_REDUCTION", default="any_non_compliant"),  # type: ignore
+        boilerplate=boilerplate_filter(),
+        block_store=block_store(),
+        block_tokens=int(get_env_var("BLOCK_TOKENS", default=2000)),
+        near_duplicates=near_duplicates(),
+        extraction_pool=extraction_pool(),
+    )
+
+
+def build_ensemble(checker: ComplianceChecker) -> EnsembleChecker | None:
+    """ensemble of `ENSEMBLE_MODELS` sharing the caches, extraction settings and
+    chunking of `checker`, `None` when it is not set"""
+    members = ensemble_members()
+    if not members:
+        return None
+    return EnsembleChecker.from_models(
+        members,
+        quorum=int(get_env_var("ENSEMBLE_QUORUM", default=0)) or None,
+        verdict_cache=checker.verdict_cache,
+        page_cache=checker.page_cache,
+        extractor_config=checker.extractor_config,
+        max_chunk_tokens=checker.max_chunk_tokens,
+        max_chunk_calls=checker.max_chunk_calls,
+        reduction=checker.reduction,
+        boilerplate=checker.boilerplate,
+        extraction_pool=checker.extraction_pool,
+    )
+
+
+def close_checker(checker: ComplianceChecker) -> None:
+    """closes the stores and the extraction pool of a checker of `build_checker`"""
+    if checker.extraction_pool is not None:
+        checker.extraction_pool.close()
+    for store in (
+        checker.verdict_cache,
+        checker.page_cache,
+        checker.boilerplate,
+        checker.block_store,
+        checker.near_duplicates,
+    ):
+        if store is not None:
+            store.close()
@@ -0,0 +1,227 @@
+"""Incremental re-checks of pages.
+
+The text of a page is split into blocks on its headings (the sections of
+`split_sections`). The first check of a page judges the whole page, and its
+assessment is stored along with the blocks of the page. When the page is checked
+again, a stored assessment is reused when every block of it is still on the page,
+unchanged. The blocks left over (added or edited) are sent to the llm along with
+their neighbouring blocks, and the verdict of the page is reduced from the fresh and
+the reused assessments.
+"""
+
+import asyncio
+import hashlib
+import sqlite3
+import threading
+from collections import Counter
+from dataclasses import dataclass, field
+from pathlib import Path
+from time import time
+
+from ._types import BlockAssessment, LLMResponse, PageBlocks
+from .chunking import TITLE_BANNER, count_tokens, split_sections
+from .metrics import counter
+from .urls import page_key
+
+BLOCKS = counter(
+    "seiright_incremental_blocks_total",
+    "Blocks of the pages checked incrementally, by whether their assessment was "
+    "reused or checked",
+    ("kind",),
+)
+
+# between the blocks of a re-check which are not next to each other on the page
+GAP = "[...]\n\n"
+
+
+def block_hash(block: str) -> str:
+    """hash of a block, insensitive to how the page was wrapped"""
+    return hashlib.sha256(" ".join(block.split()).encode("utf-8")).hexdigest()
+
+
+@dataclass
+class RecheckPlan:
+    """blocks of a page, the stored assessments still valid, and the blocks to
+    send to the llm with the blocks around them (indices into `sections`)"""
+
+    banner: str
+    sections: list[str]
+    blocks: list[str]
+    tokens: list[int]
+    reused: list[BlockAssessment] = field(default_factory=list)
+    changed: list[int] = field(default_factory=list)
+    context: list[int] = field(default_factory=list)
+
+    @property
+    def whole_page(self) -> bool:
+        return not self.reused
+
+    def recheck_text(self) -> str:
+        """text sent to the llm for the changed blocks: under the title banner of
+        the page, with the blocks next to them"""
+        indices = sorted(set(self.changed) | set(self.context))
+        text = self.banner
+        for previous, i in zip([None] + indices, indices):
+            if previous is not None and i != previous + 1:
+                text += GAP
+            text += self.sections[i]
+        return text
+
+    def in_page_order(
+        self, assessments: list[BlockAssessment]
+    ) -> list[BlockAssessment]:
+        first: dict[str, int] = {}
+        for i, block in enumerate(self.blocks):
+            first.setdefault(block, i)
+        return sorted(assessments, key=lambda a: min(first[b] for b in a.blocks))
+
+    def assessment(self, response: LLMResponse) -> BlockAssessment:
+        """assessment of the changed blocks, stored without the prompt sent"""
+        return BlockAssessment(
+            blocks=[self.blocks[i] for i in self.changed],
+            tokens=sum(self.tokens[i] for i in self.changed),
+            response=response.model_copy(update={"input_msg": ""}),
+        )
+
+    def _partial(self, assessment: BlockAssessment, blocks: Counter) -> BlockAssessment:
+        tokens = dict(zip(self.blocks, self.tokens))
+        kept = list(blocks.elements())
+        return BlockAssessment(
+            blocks=kept,
+            tokens=sum(tokens[b] for b in kept),
+            response=assessment.response,
+        )
+
+
+def plan_recheck(
+    text: str, previous: PageBlocks | None, max_tokens: int, model: str = ""
+) -> RecheckPlan:
+    """diffs a page against its stored blocks
+
+    Args:
+        text: (reformatted) text of the page
+        previous: blocks and assessments stored by the last check of the page,
+            `None` to judge the whole page
+        max_tokens: token budget of the changed blocks and their neighbours, the
+            whole page is judged again above it
+        model: model the blocks are sent to, to count the tokens
+
+    Returns:
+        the reusable assessments and the changed blocks
+    """
+    banner_match = TITLE_BANNER.match(text)
+    banner = banner_match.group(0) if banner_match else ""
+    sections = split_sections(text[len(banner) :])
+    plan = RecheckPlan(
+        banner=banner,
+        sections=sections,
+        blocks=[block_hash(s) for s in sections],
+        tokens=[count_tokens(s, model) for s in sections],
+    )
+
+    available = Counter(plan.blocks)
+    partial: list[BlockAssessment] = []
+    for assessment in previous.assessments if previous is not None else []:
+        needed = Counter(assessment.blocks)
+        if all(available[block] >= n for block, n in needed.items()):
+            available -= needed
+            plan.reused.append(assessment)
+        elif assessment.response.is_compliant:
+            # a compliant verdict still holds for the blocks left of it, while
+            # a non compliant one may have been about the blocks changed
+            partial.append(assessment)
+    for assessment in partial:
+        kept = Counter(assessment.blocks) & available
+        if kept:
+            available -= kept
+            plan.reused.append(plan._partial(assessment, kept))
+
+    covered = Counter(plan.blocks) - available
+    for i, block in enumerate(plan.blocks):
+        if covered[block]:
+            covered[block] -= 1
+        else:
+            plan.changed.append(i)
+    changed = set(plan.changed)
+    neighbours = {j for i in changed for j in (i - 1, i + 1) if 0 <= j < len(sections)}
+    plan.context = sorted(neighbours - changed)
+
+    budget = count_tokens(banner, model) + sum(
+        plan.tokens[i] for i in changed | set(plan.context)
+    )
+    if plan.changed and budget > max_tokens:
+        plan.reused = []
+    if plan.whole_page:
+        plan.changed, plan.context = list(range(len(sections))), []
+
+    BLOCKS.labels("reused").inc(sum(len(a.blocks) for a in plan.reused))
+    BLOCKS.labels("checked").inc(len(plan.changed))
+    return plan
+
+
+class BlockStore:
+    """sqlite store of the blocks of the last check of every page, with their
+    assessments
+
+    Args:
+        db_path: path of the sqlite file, `":memory:"` for a non persistent store
+    """
+
+    def __init__(self, db_path: str | Path = ":memory:"):
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(str(db_path), check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS page_blocks ("
+            "url TEXT PRIMARY KEY, key TEXT NOT NULL, page TEXT NOT NULL)"
+        )
+        self._db.commit()
+
+    def get(self, url: str, key: str) -> PageBlocks | None:
+        """blocks of the last check of `url` made with `key` (provider, model and
+        prompts version)"""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT page FROM page_blocks WHERE url = ? AND key = ?",
+                (page_key(url), key),
+            ).fetchone()
+        return None if row is None else PageBlocks.model_validate_json(row[0])
+
+    def set(
+        self,
+        url: str,
+        key: str,
+        plan: RecheckPlan,
+        assessments: list[BlockAssessment],
+    ) -> PageBlocks:
+        page = PageBlocks(
+            url=page_key(url),
+            key=key,
+            blocks=plan.blocks,
+            assessments=assessments,
+            updated_at=time(),
+        )
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO page_blocks (url, key, page) VALUES (?, ?, ?)",
+                (page.url, key, page.model_dump_json()),
+            )
+            self._db.commit()
+        return page
+
+    async def aget(self, url: str, key: str) -> PageBlocks | None:
+        """`get` for the event loop, read in a thread"""
+        return await asyncio.to_thread(self.get, url, key)
+
+    async def aset(
+        self,
+        url: str,
+        key: str,
+        plan: RecheckPlan,
+        assessments: list[BlockAssessment],
+    ) -> PageBlocks:
+        """`set` for the event loop, written in a thread"""
+        return await asyncio.to_thread(self.set, url, key, plan, assessments)
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
@@ -0,0 +1,370 @@
+"""Queue of compliance checks run in the background by a pool of workers.
+
+Accepting a check is decoupled from running it: a submitted job is persisted
+(sqlite) and queued, and its id is returned straight away. Jobs which were queued
+or running when the service stopped are queued again when it restarts.
+"""
+
+import asyncio
+import ipaddress
+import logging
+import socket
+import sqlite3
+import threading
+import uuid
+from pathlib import Path
+from time import time
+from typing import Any, Callable
+from urllib.parse import urlsplit
+
+import httpx
+
+from ._types import Job, JobStatus, LLMResponse
+from .assemble import ComplianceChecker
+from .ratelimit import BATCH, priority
+from .web_crawler import async_http_client
+
+logger = logging.getLogger(__name__)
+
+WEBHOOK_ATTEMPTS = 3
+WEBHOOK_TIMEOUT = 10.0
+
+
+class UnsafeWebhookError(ValueError):
+    """raised for a webhook url which isn't http(s) or points to a host which
+    isn't public (loopback, private, link local...)"""
+
+
+async def acheck_webhook_url(url: str) -> str:
+    """checks that a webhook url may be posted to from inside the service, every
+    address its host resolves to must be public
+
+    Raises:
+        UnsafeWebhookError: Raises an error if the url must not be posted to
+
+    Returns:
+        the address the webhook is posted to, connecting to it (instead of
+        resolving the host again) keeps a rebound dns name from pointing elsewhere
+    """
+    parts = urlsplit(url)
+    if parts.scheme not in ("http", "https") or not parts.hostname:
+        raise UnsafeWebhookError(f"{url} is not an http(s) url")
+    try:
+        addresses = [ipaddress.ip_address(parts.hostname)]
+    except ValueError:
+        try:
+            infos = await asyncio.get_running_loop().getaddrinfo(
+                parts.hostname, parts.port, type=socket.SOCK_STREAM
+            )
+        except socket.gaierror as e:
+            raise UnsafeWebhookError(f"unable to resolve {parts.hostname}") from e
+        addresses = [ipaddress.ip_address(info[4][0].split("%")[0]) for info in infos]
+    for address in addresses:
+        if isinstance(address, ipaddress.IPv6Address) and address.ipv4_mapped:
+            address = address.ipv4_mapped
+        if not address.is_global:
+            raise UnsafeWebhookError(f"{parts.hostname} is not a public host")
+    return str(addresses[0])
+
+
+class QueueFullError(Exception):
+    """raised when a job is submitted while the queue is at its depth limit"""
+
+
+class JobStore:
+    """sqlite store of the jobs
+
+    Args:
+        db_path: path of the sqlite file, `":memory:"` for a non persistent store
+    """
+
+    def __init__(self, db_path: str | Path = ":memory:"):
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(str(db_path), check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "id TEXT PRIMARY KEY, url TEXT NOT NULL, user TEXT NOT NULL, "
+            "status TEXT NOT NULL, webhook_url TEXT, result TEXT, error TEXT, "
+            "created_at REAL NOT NULL, updated_at REAL NOT NULL)"
+        )
+        self._db.execute(
+            "CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created_at)"
+        )
+        self._db.commit()
+
+    def save(self, job: Job) -> None:
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO jobs "
+                "(id, url, user, status, webhook_url, result, error, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    job.id,
+                    job.url,
+                    job.user,
+                    job.status.value,
+                    job.webhook_url,
+                    job.result.model_dump_json() if job.result else None,
+                    job.error,
+                    job.created_at,
+                    job.updated_at,
+                ),
+            )
+            self._db.commit()
+
+    async def asave(self, job: Job) -> None:
+        await asyncio.to_thread(self.save, job)
+
+    def get(self, job_id: str) -> Job | None:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT id, url, user, status, webhook_url, result, error, "
+                "created_at, updated_at FROM jobs WHERE id = ?",
+                (job_id,),
+            ).fetchone()
+        return None if row is None else self._job(row)
+
+    async def aget(self, job_id: str) -> Job | None:
+        return await asyncio.to_thread(self.get, job_id)
+
+    def unfinished(self) -> list[Job]:
+        """jobs queued or running, oldest first"""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT id, url, user, status, webhook_url, result, error, "
+                "created_at, updated_at FROM jobs WHERE status IN (?, ?) "
+                "ORDER BY created_at",
+                (JobStatus.QUEUED.value, JobStatus.RUNNING.value),
+            ).fetchall()
+        return [self._job(row) for row in rows]
+
+    def prune(self, finished_before: float) -> int:
+        """deletes the jobs which finished before `finished_before`
+
+        Returns:
+            number of jobs deleted
+        """
+        with self._lock:
+            cursor = self._db.execute(
+                "DELETE FROM jobs WHERE status IN (?, ?) AND updated_at < ?",
+                (JobStatus.SUCCEEDED.value, JobStatus.FAILED.value, finished_before),
+            )
+            self._db.commit()
+        return cursor.rowcount
+
+    async def aprune(self, finished_before: float) -> int:
+        return await asyncio.to_thread(self.prune, finished_before)
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+    @staticmethod
+    def _job(row: tuple) -> Job:
+        fields = ("id", "url", "user", "status", "webhook_url", "result", "error")
+        job = dict(zip(fields, row))
+        if job["result"] is not None:
+            job["result"] = LLMResponse.model_validate_json(job["result"])
+        return Job(**job, created_at=row[7], updated_at=row[8])
+
+
+class JobQueue:
+    """Bounded queue of compliance checks, consumed by a pool of workers running
+    on the event loop
+
+    Args:
+        checker: checker running the jobs
+        store: store the jobs are persisted in
+        workers: number of jobs run concurrently
+        max_queued: maximum number of jobs waiting for a worker, submissions are
+            rejected with `QueueFullError` beyond it
+        retention: number of seconds finished jobs are kept for
+        webhook_payload: builds the body posted to the webhook of a finished job,
+            defaults to the job itself
+        client: http client used for the webhooks, defaults to the shared async client
+
+    Usage:
+        queue = JobQueue(checker, JobStore("jobs.db"))
+        queue.start()
+        job = await queue.asubmit("https://mercury.com", user="monte")
+        ...
+        await queue.aget(job.id)
+        await queue.aclose()
+    """
+
+    def __init__(
+        self,
+        checker: ComplianceChecker,
+        store: JobStore,
+        workers: int = 4,
+        max_queued: int = 100,
+        retention: float = 24 * 60 * 60,
+        webhook_payload: Callable[[Job], Any] | None = None,
+        client: httpx.AsyncClient | None = None,
+    ):
+        self.checker = checker
+        self.store = store
+        self.workers = workers
+        self.max_queued = max_queued
+        self.retention = retention
+        self.webhook_payload = webhook_payload or (
+            lambda job: job.model_dump(mode="json")
+        )
+        self.client = client
+        self._queue: asyncio.Queue[str] = asyncio.Queue()
+        self._tasks: set[asyncio.Task] = set()
+
+    @property
+    def depth(self) -> int:
+        """number of jobs waiting for a worker"""
+        return self._queue.qsize()
+
+    def start(self) -> None:
+        """queues again the jobs left unfinished by a previous run and starts the
+        workers. Must be called from the event loop"""
+        self.store.prune(time() - self.retention)
+        for job in self.store.unfinished():
+            if job.status == JobStatus.RUNNING:
+                job = self._update(job, status=JobStatus.QUEUED)
+            self._queue.put_nowait(job.id)
+        if self.depth:
+            logger.info(f"resuming {self.depth} unfinished jobs")
+        for _ in range(self.workers):
+            self._spawn(self._worker())
+
+    def submit(self, url: str, user: str, webhook_url: str | None = None) -> Job:
+        """queues a compliance check of `url`
+
+        Args:
+            url: url to check
+            user: user submitting the job
+            webhook_url: url the job is posted to once it finished
+
+        Raises:
+            QueueFullError: Raises an error if `max_queued` jobs are already waiting
+
+        Returns:
+            the queued job
+        """
+        job = self._new_job(url, user, webhook_url)
+        self.store.save(job)
+        self._queue.put_nowait(job.id)
+        return job
+
+    async def asubmit(self, url: str, user: str, webhook_url: str | None = None) -> Job:
+        """`submit`, persisting the job off the event loop"""
+        job = self._new_job(url, user, webhook_url)
+        await self.store.asave(job)
+        self._queue.put_nowait(job.id)
+        return job
+
+    def get(self, job_id: str) -> Job | None:
+        return self.store.get(job_id)
+
+    async def aget(self, job_id: str) -> Job | None:
+        return await self.store.aget(job_id)
+
+    async def aclose(self) -> None:
+        """stops the workers. Jobs interrupted while running stay `running` in the
+        store and are run again by the next `start`"""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks.clear()
+
+    def _spawn(self, coro) -> None:
+        task = asyncio.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def _new_job(self, url: str, user: str, webhook_url: str | None) -> Job:
+        if self.depth >= self.max_queued:
+            raise QueueFullError(f"{self.depth} jobs are already queued")
+        now = time()
+        return Job(
+            id=uuid.uuid4().hex,
+            url=url,
+            user=user,
+            webhook_url=webhook_url,
+            created_at=now,
+            updated_at=now,
+        )
+
+    def _update(self, job: Job, **changes) -> Job:
+        job = job.model_copy(update={**changes, "updated_at": time()})
+        self.store.save(job)
+        return job
+
+    async def _aupdate(self, job: Job, **changes) -> Job:
+        job = job.model_copy(update={**changes, "updated_at": time()})
+        await self.store.asave(job)
+        return job
+
+    async def _worker(self) -> None:
+        while True:
+            job_id = await self._queue.get()
+            try:
+                with priority(BATCH):
+                    await self._run(job_id)
+            except Exception:
+                logger.exception(f"unable to run job {job_id}")
+            finally:
+                self._queue.task_done()
+
+    async def _run(self, job_id: str) -> None:
+        job = await self.store.aget(job_id)
+        if job is None or job.status != JobStatus.QUEUED:
+            return
+        job = await self._aupdate(job, status=JobStatus.RUNNING)
+        try:
+            result = await self.checker.achat(job.url)
+            job = await self._aupdate(job, status=JobStatus.SUCCEEDED, result=result)
+        except Exception as e:
+            logger.warning(f"job {job.id} failed for {job.url}: {e!r}")
+            job = await self._aupdate(job, status=JobStatus.FAILED, error=repr(e))
+        if job.webhook_url:
+            self._spawn(self.notify(job))
+        await self.store.aprune(time() - self.retention)
+
+    async def notify(self, job: Job) -> bool:
+        """posts a finished job to its webhook, retrying with backoff. The post
+        goes to the address checked by `acheck_webhook_url` and redirects aren't
+        followed, so that the webhook can't send it to an internal host
+
+        Returns:
+            whether the webhook accepted the notification
+        """
+        try:
+            # checked again, the host may resolve elsewhere since the submission
+            address = await acheck_webhook_url(job.webhook_url)  # type: ignore
+        except UnsafeWebhookError as e:
+            logger.warning(f"not posting job {job.id} to its webhook: {e}")
+            return False
+        url = httpx.URL(job.webhook_url)  # type: ignore
+        client = self.client or async_http_client()
+        payload = self.webhook_payload(job)
+        for attempt in range(WEBHOOK_ATTEMPTS):
+            try:
+                response = await client.post(
+                    url.copy_with(host=address),
+                    json=payload,
+                    headers={"Host": url.netloc.decode("ascii")},
+                    extensions={"sni_hostname": url.host},
+                    follow_redirects=False,
+                    timeout=WEBHOOK_TIMEOUT,
+                )
+                if response.is_redirect:
+                    logger.warning(
+                        f"webhook of job {job.id} redirected to "
+                        f"{response.headers.get('location')}, not following it"
+                    )
+                    return False
+                response.raise_for_status()
+                return True
+            except httpx.HTTPError as e:
+                logger.warning(
+                    f"webhook of job {job.id} failed (attempt {attempt + 1}): {e!r}"
+                )
+                if attempt + 1 < WEBHOOK_ATTEMPTS:
+                    await asyncio.sleep(2**attempt)
+        return False
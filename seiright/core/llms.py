@@ -1,110 +1,239 @@
 """An abstraction over different llm providers"""
 
+import inspect
 import json
 import logging
+import os
 from abc import ABC, abstractmethod
-from typing import Any
+from contextlib import contextmanager
+from functools import lru_cache
+from typing import Any, Iterator, Mapping
 
-import yaml
-from anthropic import Anthropic
-from openai import OpenAI
-
-from ..utils.utils import get_env_var
+from ..utils.utils import asecret, secret
 from ._types import (
     LLMProvider,
     LLMResponse,
     LLMResponseSchema,
-    Prompt,
     PromptContent,
     PromptMessages,
-    SchemaProperty,
 )
-from .prompts import SeiPrompts, prompts_dir
+from .chunking import count_tokens
+from .metrics import LLM_CALLS, LLM_TOKENS, span
+from .prompts import PromptVersion, SeiPrompts, prompt_registry
+from .ratelimit import llm_scheduler
 
 logger = logging.getLogger(__name__)
 
 
+@lru_cache(maxsize=16)
+def system_prompt_tokens(system_prompt: str, model: str) -> int:
+    return count_tokens(system_prompt, model)
+
+
 class LLM(ABC):
+    # expected size of a verdict, reserved from the tokens per minute budget
+    # until the actual usage is known
+    output_tokens_estimate = 512
 
     def __init__(self, model: str, llm_provider: LLMProvider):
         self.model = model
         self.llm_provider = llm_provider
+        self._clients: dict[bool, tuple[str, Any]] = {}
 
     @property
     def api_key(self) -> str:
-        provider = str(self.llm_provider.value.upper())
-        return get_env_var(f"{provider}_API_KEY", raise_error=True)
+        """`<PROVIDER>_API_KEY` from the environment, the `<provider>-api-key`
+        secret otherwise"""
+        provider = str(self.llm_provider.value)
+        return os.getenv(f"{provider.upper()}_API_KEY") or secret(f"{provider}-api-key")
+
+    async def aapi_key(self) -> str:
+        """`api_key`, the secret is fetched off the event loop"""
+        provider = str(self.llm_provider.value)
+        return os.getenv(f"{provider.upper()}_API_KEY") or await asecret(
+            f"{provider}-api-key"
+        )
 
     @abstractmethod
-    def chat(self, user_prompt: str) -> LLMResponse:
+    def make_client(self, api_key: str, asynchronous: bool) -> Any:
+        """builds a client of the sdk of the provider, imported on first use"""
+        pass
+
+    def _client(self, api_key: str, asynchronous: bool) -> Any:
+        # clients are built on first use, and again when the key was rotated
+        cached = self._clients.get(asynchronous)
+        if cached is None or cached[0] != api_key:
+            cached = (api_key, self.make_client(api_key, asynchronous))
+            self._clients[asynchronous] = cached
+        return cached[1]
+
+    @property
+    def client(self) -> Any:
+        return self._client(self.api_key, asynchronous=False)
+
+    async def aclient(self) -> Any:
+        return self._client(await self.aapi_key(), asynchronous=True)
+
+    @abstractmethod
+    def request_kwargs(self, user_prompt: str) -> dict[str, Any]:
+        pass
+
+    @abstractmethod
+    def create(self, kwargs: dict[str, Any]) -> Any:
+        """sends the request, returns the raw response of the sdk"""
         pass
 
     @abstractmethod
-    def create_prompt(self, msg: str) -> Prompt:
+    async def acreate(self, kwargs: dict[str, Any]) -> Any:
         pass
 
+    @abstractmethod
+    def parse_response(self, response: Any, user_prompt: str) -> LLMResponse:
+        pass
+
+    def estimate_tokens(self, user_prompt: str) -> int:
+        """estimate of the tokens of a call, before it is sent"""
+        return (
+            system_prompt_tokens(SeiPrompts.system_prompt, self.model)
+            + count_tokens(user_prompt, self.model)
+            + self.output_tokens_estimate
+        )
+
+    def settle(self, reserved: int, response: LLMResponse) -> LLMResponse:
+        used = (
+            response.cached_tokens
+            + response.uncached_tokens
+            + response.completion_tokens
+        )
+        if used:
+            llm_scheduler.limiter(self.llm_provider, self.model).settle(reserved, used)
+        for kind in ("cached", "uncached", "completion"):
+            tokens = getattr(response, f"{kind}_tokens")
+            if tokens:
+                LLM_TOKENS.labels(self.llm_provider, self.model, kind).inc(tokens)
+        return response
+
+    @contextmanager
+    def recorded(self) -> Iterator[None]:
+        """counts the outcome of the call made within the block"""
+        try:
+            yield
+        except Exception:
+            LLM_CALLS.labels(self.llm_provider, self.model, "error").inc()
+            raise
+        LLM_CALLS.labels(self.llm_provider, self.model, "ok").inc()
+
+    def chat(self, user_prompt: str) -> LLMResponse:
+        with span("prompt"):
+            kwargs = self.request_kwargs(user_prompt=user_prompt)
+            tokens = self.estimate_tokens(user_prompt)
+        with self.recorded():
+            raw = llm_scheduler.run(
+                self.llm_provider, self.model, tokens, lambda: self.create(kwargs)
+            )
+            response = self.parse_response(raw.parse(), user_prompt=user_prompt)
+        return self.settle(tokens, response)
+
+    async def achat(self, user_prompt: str) -> LLMResponse:
+        with span("prompt"):
+            kwargs = self.request_kwargs(user_prompt=user_prompt)
+            tokens = self.estimate_tokens(user_prompt)
+        with self.recorded():
+            raw = await llm_scheduler.arun(
+                self.llm_provider, self.model, tokens, lambda: self.acreate(kwargs)
+            )
+            # the raw responses of the async clients parse asynchronously in the
+            # recent sdks
+            parsed = raw.parse()
+            if inspect.isawaitable(parsed):
+                parsed = await parsed
+            response = self.parse_response(parsed, user_prompt=user_prompt)
+        return self.settle(tokens, response)
+
+    async def aclose(self) -> None:
+        """closes the connection pool of the async client"""
+        cached = self._clients.pop(True, None)
+        if cached is not None:
+            await cached[1].close()
+
     @abstractmethod
     def response_format(self) -> dict[str, str]:
         pass
 
     @property
     def properties(self) -> LLMResponseSchema:
-        dir = prompts_dir()
-        properties_file = dir.joinpath("properties.yaml")
-        with open(properties_file, "r") as f:
-            props = yaml.safe_load(f.read())
-        _r = {}
-        for prop in props:
-            _r[prop["name"]] = SchemaProperty(
-                type=prop["type"], description=prop["description"]
-            )
-        return LLMResponseSchema(type="object", properties=_r)
+        return prompt_registry.current().properties
+
+    @abstractmethod
+    def build_template(self, prompts: PromptVersion) -> dict[str, Any]:
+        """builds the static part of the requests (everything but the user
+        message) for a version of the prompts"""
+        pass
+
+    @property
+    def request_template(self) -> Mapping[str, Any]:
+        """static part of the requests, compiled once per version of the prompts"""
+        return prompt_registry.current().template(
+            (self.llm_provider, self.model), self.build_template
+        )
 
 
 class OpenAILLM(LLM):
     def __init__(self, model: str):
         super().__init__(model=model, llm_provider=LLMProvider.OPENAI)
-        self.client = OpenAI(api_key=self.api_key)
-
-    def create_prompt(self, user_prompt: str) -> Prompt:
-        system_prompt = SeiPrompts.system_prompt
-        system_content = PromptContent(type="text", text=system_prompt)
-        user_content = PromptContent(type="text", text=user_prompt)
-        return Prompt(
-            messages=[
-                PromptMessages(role="system", content=[system_content]),
-                PromptMessages(role="user", content=[user_content]),
-            ]
-        )
+
+    def make_client(self, api_key: str, asynchronous: bool) -> Any:
+        # retries are left to the scheduler, which pauses every caller on a 429
+        from openai import AsyncOpenAI, OpenAI
+
+        client_class = AsyncOpenAI if asynchronous else OpenAI
+        return client_class(api_key=api_key, max_retries=0)
 
     def response_format(self) -> dict[str, Any]:
+        return self.request_template["response_format"]
+
+    def build_template(self, prompts: PromptVersion) -> dict[str, Any]:
+        # OpenAI caches prompt prefixes automatically, the static system prompt
+        # goes first and is sent byte for byte identical on every call
+        system_content = PromptContent(type="text", text=prompts.system_prompt)
+        system_message = PromptMessages(role="system", content=[system_content])
         return {
-            "type": "json_schema",
-            "json_schema": {
-                "name": "compliance_response",
-                "description": "Returns the compliance response for the given input in a structured json format",
-                "strict": True,
-                "schema": {
-                    **self.properties.model_dump(),
-                    "required": ["is_compliant", "reasoning", "confidence_score"],
-                    "additionalProperties": False,
+            "model": self.model,
+            "system_message": system_message.model_dump(exclude_none=True),
+            "response_format": {
+                "type": "json_schema",
+                "json_schema": {
+                    "name": "compliance_response",
+                    "description": "Returns the compliance response for the given input in a structured json format",
+                    "strict": True,
+                    "schema": {
+                        **prompts.properties.model_dump(),
+                        "required": ["is_compliant", "reasoning", "confidence_score"],
+                        "additionalProperties": False,
+                    },
                 },
             },
         }
 
-    def chat(self, user_prompt: str) -> LLMResponse:
-        llm_prompt = self.create_prompt(user_prompt=user_prompt)
-        messages = [x.model_dump() for x in llm_prompt.messages]
-        logger.debug(messages)
-        rf = self.response_format()
-        logger.debug(f"response format: {rf}")
-        response = self.client.chat.completions.create(
-            model=self.model, messages=messages, response_format=rf
-        )
+    def request_kwargs(self, user_prompt: str) -> dict[str, Any]:
+        template = self.request_template
+        user_message = {
+            "role": "user",
+            "content": [{"type": "text", "text": user_prompt}],
+        }
+        return {
+            "model": template["model"],
+            "messages": [template["system_message"], user_message],
+            "response_format": template["response_format"],
+        }
 
+    def parse_response(self, response: Any, user_prompt: str) -> LLMResponse:
         content = response.choices[0].message.content
         if content:
             content = json.loads(content)
+            usage = response.usage
+            details = getattr(usage, "prompt_tokens_details", None)
+            cached_tokens = (getattr(details, "cached_tokens", 0) or 0) if usage else 0
             return LLMResponse(
                 model=self.model,
                 llm_provider=self.llm_provider,
@@ -112,54 +241,93 @@ class OpenAILLM(LLM):
                 reasoning=content["reasoning"],
                 confidence_score=content["confidence_score"],
                 input_msg=user_prompt,
+                cached_tokens=cached_tokens,
+                uncached_tokens=usage.prompt_tokens - cached_tokens if usage else 0,
+                completion_tokens=usage.completion_tokens if usage else 0,
             )
         else:
             raise RuntimeError(
                 f"Unable to generate response for {user_prompt}. model={self.model}, llm_provider={self.llm_provider}"
             )
 
+    def create(self, kwargs: dict[str, Any]) -> Any:
+        return self.client.chat.completions.with_raw_response.create(**kwargs)
+
+    async def acreate(self, kwargs: dict[str, Any]) -> Any:
+        client = await self.aclient()
+        return await client.chat.completions.with_raw_response.create(**kwargs)
+
 
 class AnthropicLLM(LLM):
     def __init__(self, model: str):
         super().__init__(model=model, llm_provider=LLMProvider.ANTHROPIC)
-        self.client = Anthropic(api_key=self.api_key)
 
-    def create_prompt(self, user_prompt: str) -> Prompt:
-        user_content = PromptContent(type="text", text=user_prompt)
-        return Prompt(messages=[PromptMessages(role="user", content=[user_content])])
+    def make_client(self, api_key: str, asynchronous: bool) -> Any:
+        from anthropic import Anthropic, AsyncAnthropic
+
+        client_class = AsyncAnthropic if asynchronous else Anthropic
+        return client_class(api_key=api_key, max_retries=0)
 
     def response_format(self) -> dict[str, Any]:
+        return self.request_template["tools"][0]
+
+    def build_template(self, prompts: PromptVersion) -> dict[str, Any]:
+        # the cache breakpoint on the system prompt makes the tools and the system
+        # prompt (i.e. the static part of every request) a cached prefix
+        system_content = PromptContent(
+            type="text",
+            text=prompts.system_prompt,
+            cache_control={"type": "ephemeral"},
+        )
         return {
-            "name": "compliance_response",
-            "description": "Returns the compliance response for the given input in a structured json format",
-            "input_schema": self.properties.model_dump(),
+            "model": self.model,
+            "max_tokens": 1024,
+            "system": [system_content.model_dump(exclude_none=True)],
+            "tools": [
+                {
+                    "name": "compliance_response",
+                    "description": "Returns the compliance response for the given input in a structured json format",
+                    "input_schema": prompts.properties.model_dump(),
+                }
+            ],
+            "tool_choice": {"type": "tool", "name": "compliance_response"},
         }
 
-    def chat(self, user_prompt: str) -> LLMResponse:
-        llm_prompt = self.create_prompt(user_prompt=user_prompt)
-        response = self.client.messages.create(
-            model=self.model,
-            max_tokens=1024,
-            messages=[x.model_dump() for x in llm_prompt.messages],
-            tools=[self.response_format()],
-            tool_choice={"type": "tool", "name": "compliance_response"},
-        )
+    def request_kwargs(self, user_prompt: str) -> dict[str, Any]:
+        user_message = {
+            "role": "user",
+            "content": [{"type": "text", "text": user_prompt}],
+        }
+        return {**self.request_template, "messages": [user_message]}
 
+    def parse_response(self, response: Any, user_prompt: str) -> LLMResponse:
         c = [x.input for x in response.content if x.type == "tool_use"]
         if c:
+            usage = response.usage
+            cache_creation = getattr(usage, "cache_creation_input_tokens", 0) or 0
             return LLMResponse(
                 model=self.model,
                 llm_provider=self.llm_provider,
-                is_compliant=c["is_compliant"],
-                reasoning=c["reasoning"],
-                confidence_score=c["confidence_score"],
+                is_compliant=c[0]["is_compliant"],
+                reasoning=c[0]["reasoning"],
+                confidence_score=c[0]["confidence_score"],
                 input_msg=user_prompt,
+                cached_tokens=getattr(usage, "cache_read_input_tokens", 0) or 0,
+                uncached_tokens=usage.input_tokens + cache_creation,
+                completion_tokens=usage.output_tokens,
             )
         else:
             raise RuntimeError(
                 f"Unable to generate response for {user_prompt}. model={self.model}, llm_provider={self.llm_provider}"
             )
 
+    def create(self, kwargs: dict[str, Any]) -> Any:
+        return self.client.messages.with_raw_response.create(**kwargs)
+
+    async def acreate(self, kwargs: dict[str, Any]) -> Any:
+        client = await self.aclient()
+        return await client.messages.with_raw_response.create(**kwargs)
+
 
 class AzureLLM(LLM):
     def __init__(self, model: str):
@@ -0,0 +1,308 @@
+"""Lightweight metrics (counters, gauges and histograms) rendered in the
+Prometheus text format.
+
+Recording is meant for the hot path: the child of a label combination is created
+once and cached, an observation is then a bisect and a few additions under a
+lock. Gauges can be backed by a function, evaluated only when the metrics are
+scraped.
+
+Usage:
+    with span("fetch"):
+        ...
+    LLM_TOKENS.labels("openai", "gpt-4o", "completion").inc(42)
+"""
+
+import math
+import threading
+import time
+from bisect import bisect_left
+from typing import Callable, Iterator
+
+# seconds, from sub millisecond steps (parsing, prompt building) to slow llm calls
+LATENCY_BUCKETS = (
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+    60.0,
+)
+SIZE_BUCKETS = tuple(float(4**i * 1024) for i in range(9))  # 1KB .. 64MB
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: tuple[str, ...], values: tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Metric:
+    type = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._children: dict[tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+
+    def _new_child(self) -> object:
+        raise NotImplementedError
+
+    def labels(self, *values: str):
+        """child of the metric for a combination of label values"""
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}")
+            with self._lock:
+                child = self._children.setdefault(
+                    tuple(str(v) for v in values), self._new_child()
+                )
+        return child
+
+    def samples(self) -> Iterator[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        header = (
+            f"# HELP {self.name} {self.documentation}\n# TYPE {self.name} {self.type}\n"
+        )
+        return header + "".join(f"{line}\n" for line in self.samples())
+
+
+class _CounterChild:
+    __slots__ = ("value", "_lock")
+
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0) -> None:
+        with self._lock:
+            self.value += amount
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def _new_child(self) -> _CounterChild:
+        return _CounterChild()
+
+    def inc(self, amount: float = 1.0) -> None:
+        self.labels().inc(amount)
+
+    def samples(self) -> Iterator[str]:
+        for values, child in list(self._children.items()):
+            yield f"{self.name}{_labels(self.labelnames, values)} {_number(child.value)}"  # type: ignore
+
+
+class _GaugeChild:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0.0
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+
+class Gauge(Metric):
+    """gauge set explicitly, or read from `function` when the metrics are
+    scraped. `function` returns the value, or a dict of label values to value for
+    a labelled gauge"""
+
+    type = "gauge"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: tuple[str, ...] = (),
+        function: Callable[[], float | dict[tuple[str, ...], float]] | None = None,
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.function = function
+
+    def _new_child(self) -> _GaugeChild:
+        return _GaugeChild()
+
+    def set(self, value: float) -> None:
+        self.labels().set(value)
+
+    def samples(self) -> Iterator[str]:
+        if self.function is not None:
+            values = self.function()
+            if not isinstance(values, dict):
+                values = {(): values}
+        else:
+            values = {k: c.value for k, c in list(self._children.items())}  # type: ignore
+        for labels, value in values.items():
+            yield f"{self.name}{_labels(self.labelnames, labels)} {_number(value)}"
+
+
+class _HistogramChild:
+    __slots__ = ("buckets", "counts", "sum", "_lock")
+
+    def __init__(self, buckets: tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        i = bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[i] += 1
+            self.sum += value
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = LATENCY_BUCKETS,
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self) -> _HistogramChild:
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value: float) -> None:
+        self.labels().observe(value)
+
+    def samples(self) -> Iterator[str]:
+        for values, child in list(self._children.items()):
+            with child._lock:  # type: ignore
+                counts, total = list(child.counts), child.sum  # type: ignore
+            cumulative = 0
+            for bound, count in zip((*self.buckets, math.inf), counts):
+                cumulative += count
+                le = f'le="{_number(bound)}"'
+                yield f"{self.name}_bucket{_labels(self.labelnames, values, le)} {cumulative}"
+            labels = _labels(self.labelnames, values)
+            yield f"{self.name}_sum{labels} {_number(total)}"
+            yield f"{self.name}_count{labels} {cumulative}"
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: dict[str, Metric] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: Metric) -> Metric:
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"metric {metric.name} is already registered")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def unregister(self, name: str) -> None:
+        with self._lock:
+            self._metrics.pop(name, None)
+
+    def get(self, name: str) -> Metric | None:
+        return self._metrics.get(name)
+
+    def render(self) -> str:
+        """all the metrics in the Prometheus text exposition format"""
+        return "".join(metric.render() for metric in list(self._metrics.values()))
+
+
+REGISTRY = Registry()
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def counter(name: str, documentation: str, labelnames: tuple[str, ...] = ()) -> Counter:
+    return REGISTRY.register(Counter(name, documentation, labelnames))  # type: ignore
+
+
+def histogram(
+    name: str,
+    documentation: str,
+    labelnames: tuple[str, ...] = (),
+    buckets: tuple[float, ...] = LATENCY_BUCKETS,
+) -> Histogram:
+    return REGISTRY.register(Histogram(name, documentation, labelnames, buckets))  # type: ignore
+
+
+def gauge(
+    name: str,
+    documentation: str,
+    labelnames: tuple[str, ...] = (),
+    function: Callable[[], float | dict[tuple[str, ...], float]] | None = None,
+) -> Gauge:
+    """registers a gauge, replacing a previous gauge of the same name (gauges
+    backed by a function are registered by the objects they report on)"""
+    REGISTRY.unregister(name)
+    return REGISTRY.register(Gauge(name, documentation, labelnames, function))  # type: ignore
+
+
+STAGE_SECONDS = histogram(
+    "seiright_stage_duration_seconds",
+    "Duration of each stage of a compliance check",
+    ("stage",),
+)
+PAGE_BYTES = histogram(
+    "seiright_page_size_bytes",
+    "Size of the html downloaded per page",
+    buckets=SIZE_BUCKETS,
+)
+PAGE_TEXT_CHARS = histogram(
+    "seiright_page_text_chars",
+    "Number of characters of text extracted per page",
+    buckets=SIZE_BUCKETS,
+)
+LLM_TOKENS = counter(
+    "seiright_llm_tokens_total",
+    "Tokens used by the llm calls, kind is one of cached, uncached and completion",
+    ("provider", "model", "kind"),
+)
+LLM_CALLS = counter(
+    "seiright_llm_calls_total",
+    "Number of llm calls, by outcome",
+    ("provider", "model", "outcome"),
+)
+
+
+class span:
+    """records the duration of the block in the `stage` histogram (also when the
+    block raises). A plain class rather than a generator based context manager,
+    it is entered on every stage of every check"""
+
+    __slots__ = ("_child", "_start")
+
+    def __init__(self, stage: str):
+        self._child = STAGE_SECONDS.labels(stage)
+
+    def __enter__(self) -> None:
+        self._start = time.perf_counter()
+
+    def __exit__(self, *exc_info) -> None:
+        self._child.observe(time.perf_counter() - self._start)
@@ -0,0 +1,285 @@
+"""Near duplicate pages.
+
+Locale mirrors, print versions and pages reachable under several urls carry the
+same text. Every checked page is summarised by a MinHash signature of its word
+shingles: the share of equal values of two signatures estimates the Jaccard
+similarity of the shingles of the pages. Signatures are split in bands indexed in
+buckets (LSH), so that a lookup only compares the pages sharing at least one band
+with the new one instead of every page seen.
+
+The signatures and the key of the verdict of every page are persisted (sqlite),
+the index keeps the `max_pages` pages indexed last.
+"""
+
+import asyncio
+import sqlite3
+import threading
+import zlib
+from dataclasses import dataclass
+from pathlib import Path
+
+import numpy as np
+
+from .metrics import counter
+from .urls import page_key
+
+SHINGLE_SIZE = 3
+# shingles hashed at once by `signature`, bounds its memory to a few MB per page
+SIGNATURE_CHUNK = 4096
+# the hash functions are multiply-shift: the high 32 bits of (a * x + b) mod 2**64
+_SHIFT = np.uint64(32)
+_MIX = np.uint64(0x9E3779B97F4A7C15)
+_LOW_BITS = np.uint64(0xFFFFFFFF)
+
+REUSED = counter(
+    "seiright_near_duplicate_reuses_total",
+    "Verdicts reused from a near duplicate page instead of calling the llm",
+)
+
+
+def shingles(text: str) -> np.ndarray:
+    """32 bits hashes of the (lower cased) word shingles of a text, combined from
+    the crc32 of their words"""
+    words = text.lower().split()
+    if not words:
+        return np.empty(0, dtype=np.uint64)
+    hashes = np.fromiter(
+        map(zlib.crc32, map(str.encode, words)), dtype=np.uint64, count=len(words)
+    )
+    n = max(1, len(words) - SHINGLE_SIZE + 1)
+    combined = hashes[:n].copy()
+    for i in range(1, min(SHINGLE_SIZE, len(words))):
+        combined = combined * _MIX + hashes[i : i + n]
+    return np.unique((combined ^ (combined >> _SHIFT)) & _LOW_BITS)
+
+
+@dataclass
+class NearDuplicate:
+    page: str
+    key: str
+    similarity: float
+
+
+class NearDuplicateIndex:
+    """MinHash / LSH index of the text of the checked pages
+
+    Args:
+        threshold: estimated Jaccard similarity above which two pages are
+            duplicates
+        num_perm: number of hash functions (values) of a signature
+        bands: number of bands the signatures are indexed by, two pages are
+            compared when one of their bands is identical
+        db_path: path of the sqlite file, `":memory:"` for a non persistent index
+        seed: seed of the hash functions, changing it invalidates stored signatures
+        max_pages: number of pages kept, the pages indexed first are evicted
+            beyond it
+
+    Usage:
+        index = NearDuplicateIndex(threshold=0.95)
+        signature = index.signature(text)
+        match = index.query(signature, scope=model, exclude=url)
+        ...
+        index.add(url, signature, key=verdict_key, scope=model)
+
+        # from the event loop
+        signature = await index.asignature(text)
+        match = await index.aquery(signature, scope=model, exclude=url)
+        await index.aadd(url, signature, key=verdict_key, scope=model)
+    """
+
+    def __init__(
+        self,
+        threshold: float = 0.95,
+        num_perm: int = 64,
+        bands: int = 8,
+        db_path: str | Path = ":memory:",
+        seed: int = 1,
+        max_pages: int = 100_000,
+    ):
+        if num_perm % bands:
+            raise ValueError("num_perm must be a multiple of bands")
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.bands = bands
+        self.max_pages = max_pages
+        rng = np.random.default_rng(seed)
+        self._a = rng.integers(0, 1 << 64, size=num_perm, dtype=np.uint64) | 1
+        self._b = rng.integers(0, 1 << 64, size=num_perm, dtype=np.uint64)
+
+        self._signatures = np.empty((1024, num_perm), dtype=np.uint32)
+        self._entries: list[tuple[str, str, str] | None] = []  # page, scope, key
+        # in the order the pages were indexed, the first ones are evicted first
+        self._ids: dict[tuple[str, str], int] = {}
+        self._buckets: dict[bytes, list[int]] = {}
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(str(db_path), check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS near_duplicates ("
+            "page TEXT NOT NULL, scope TEXT NOT NULL, key TEXT NOT NULL, "
+            "signature BLOB NOT NULL, PRIMARY KEY (page, scope))"
+        )
+        # a replaced page is deleted and inserted again, the rowids are in the
+        # order the pages were indexed
+        evicted = []
+        for page, scope, key, signature in self._db.execute(
+            "SELECT page, scope, key, signature FROM near_duplicates ORDER BY rowid"
+        ).fetchall():
+            signature = np.frombuffer(signature, dtype=np.uint32)
+            if len(signature) == num_perm:
+                evicted += self._insert(page, scope, key, signature)
+        self._delete(evicted)
+        self._db.commit()
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def signature(self, text: str) -> np.ndarray | None:
+        """MinHash signature of a text, `None` when it has no words"""
+        hashes = shingles(text)
+        if not len(hashes):
+            return None
+        minimum = np.full(self.num_perm, np.iinfo(np.uint64).max, dtype=np.uint64)
+        for start in range(0, len(hashes), SIGNATURE_CHUNK):
+            chunk = hashes[start : start + SIGNATURE_CHUNK]
+            values = (np.outer(chunk, self._a) + self._b) >> _SHIFT
+            np.minimum(minimum, values.min(axis=0), out=minimum)
+        return minimum.astype(np.uint32)
+
+    async def asignature(self, text: str) -> np.ndarray | None:
+        """`signature` in a thread, hashing a long page takes a while"""
+        return await asyncio.to_thread(self.signature, text)
+
+    def _band_keys(self, signature: np.ndarray) -> list[bytes]:
+        raw = signature.tobytes()
+        size = len(raw) // self.bands
+        return [
+            bytes((band,)) + raw[band * size : (band + 1) * size]
+            for band in range(self.bands)
+        ]
+
+    def _remove(self, i: int) -> None:
+        page, scope, _ = self._entries[i]  # type: ignore
+        del self._ids[page, scope]
+        self._entries[i] = None
+        for band in self._band_keys(self._signatures[i]):
+            bucket = self._buckets[band]
+            bucket.remove(i)
+            if not bucket:
+                del self._buckets[band]
+
+    def _compact(self) -> None:
+        """drops the removed entries from the signatures and the buckets"""
+        kept = [i for i in self._ids.values()]
+        entries = [self._entries[i] for i in kept]
+        signatures = self._signatures[kept]
+        self._signatures = np.empty(
+            (max(1024, 2 * len(kept)), self.num_perm), dtype=np.uint32
+        )
+        self._entries, self._ids, self._buckets = [], {}, {}
+        for entry, signature in zip(entries, signatures):
+            self._insert(*entry, signature)  # type: ignore
+
+    def _insert(
+        self, page: str, scope: str, key: str, signature: np.ndarray
+    ) -> list[tuple[str, str]]:
+        """indexes a page in memory
+
+        Returns:
+            pages and scopes evicted to make room for it
+        """
+        previous = self._ids.get((page, scope))
+        if previous is not None:
+            self._remove(previous)
+        evicted = []
+        while len(self._ids) >= self.max_pages:
+            oldest = next(iter(self._ids))
+            self._remove(self._ids[oldest])
+            evicted.append(oldest)
+        if len(self._entries) >= 2 * max(len(self._ids), 1024):
+            self._compact()
+        i = len(self._entries)
+        if i == len(self._signatures):
+            grown = np.empty((2 * i, self.num_perm), dtype=np.uint32)
+            grown[:i] = self._signatures
+            self._signatures = grown
+        self._signatures[i] = signature
+        self._entries.append((page, scope, key))
+        self._ids[page, scope] = i
+        for band in self._band_keys(signature):
+            self._buckets.setdefault(band, []).append(i)
+        return evicted
+
+    def _delete(self, pages: list[tuple[str, str]]) -> None:
+        self._db.executemany(
+            "DELETE FROM near_duplicates WHERE page = ? AND scope = ?", pages
+        )
+
+    def add(self, page: str, signature: np.ndarray, key: str, scope: str = "") -> None:
+        """indexes a checked page
+
+        Args:
+            page: url of the page
+            signature: `signature` of the text of the page
+            key: key of the verdict of the page (`verdict_key`)
+            scope: what the verdict depends on besides the text (provider, model
+                and prompts version), only pages of the same scope are matched
+        """
+        page = page_key(page)
+        with self._lock:
+            self._delete(self._insert(page, scope, key, signature))
+            self._db.execute(
+                "INSERT OR REPLACE INTO near_duplicates (page, scope, key, signature) "
+                "VALUES (?, ?, ?, ?)",
+                (page, scope, key, signature.tobytes()),
+            )
+            self._db.commit()
+
+    async def aadd(
+        self, page: str, signature: np.ndarray, key: str, scope: str = ""
+    ) -> None:
+        await asyncio.to_thread(self.add, page, signature, key, scope)
+
+    def query(
+        self, signature: np.ndarray, scope: str = "", exclude: str | None = None
+    ) -> NearDuplicate | None:
+        """most similar indexed page above the threshold
+
+        Args:
+            signature: `signature` of the text of the new page
+            scope: scope of the verdicts looked for
+            exclude: url of the new page, its own previous checks are not matches
+
+        Returns:
+            the most similar page, or `None` when no page is similar enough
+        """
+        excluded = page_key(exclude) if exclude is not None else None
+        with self._lock:
+            candidates = {
+                i
+                for band in self._band_keys(signature)
+                for i in self._buckets.get(band, ())
+            }
+            candidates = [
+                i
+                for i in candidates
+                if (entry := self._entries[i]) is not None
+                and entry[1] == scope
+                and entry[0] != excluded
+            ]
+            if not candidates:
+                return None
+            similarities = (self._signatures[candidates] == signature).mean(axis=1)
+            best = int(similarities.argmax())
+            if similarities[best] < self.threshold:
+                return None
+            page, _, key = self._entries[candidates[best]]  # type: ignore
+        return NearDuplicate(page=page, key=key, similarity=float(similarities[best]))
+
+    async def aquery(
+        self, signature: np.ndarray, scope: str = "", exclude: str | None = None
+    ) -> NearDuplicate | None:
+        return await asyncio.to_thread(self.query, signature, scope, exclude)
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
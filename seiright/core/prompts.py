@@ -1,12 +1,28 @@
 """Abstraction over how llms consume prompts"""
 
+import hashlib
+import logging
+import os
+import threading
+from dataclasses import dataclass, field
 from pathlib import Path
-from typing import cast
+from time import monotonic
+from types import MappingProxyType
+from typing import Any, Callable, Hashable, Mapping, cast
 
-from ._types import PromptRoles
+import yaml
+
+from ._types import LLMResponseSchema, PromptRoles, SchemaProperty
+
+logger = logging.getLogger(__name__)
+
+PROMPT_FILES = ("system.txt", "properties.yaml")
 
 
 def prompts_dir() -> Path:
+    directory = os.getenv("SEIRIGHT_PROMPTS_DIR")
+    if directory:
+        return Path(directory)
     return Path(__file__).parent.joinpath("prompts")
 
 
@@ -16,5 +32,146 @@ def get_prompt(role: PromptRoles) -> str:
         return f.read()
 
 
-class SeiPrompts:
-    system_prompt: str = get_prompt("system")
+def parse_properties(raw: str) -> LLMResponseSchema:
+    props = yaml.safe_load(raw)
+    _r = {}
+    for prop in props:
+        _r[prop["name"]] = SchemaProperty(
+            type=prop["type"], description=prop["description"]
+        )
+    return LLMResponseSchema(type="object", properties=_r)
+
+
+@dataclass(frozen=True)
+class PromptVersion:
+    """One immutable version of the prompt files, along with the request templates
+    compiled from it.
+
+    `version` is the sha256 of the system prompt and the response properties.
+    Anything derived from an llm response (e.g. cached verdicts) is only valid for
+    the version it was produced with, so it doubles as a cache key.
+    """
+
+    version: str
+    system_prompt: str
+    properties: LLMResponseSchema
+    _templates: dict = field(default_factory=dict, repr=False, compare=False)
+    _lock: threading.Lock = field(
+        default_factory=threading.Lock, repr=False, compare=False
+    )
+
+    def template(
+        self, key: Hashable, build: Callable[["PromptVersion"], dict[str, Any]]
+    ) -> Mapping[str, Any]:
+        """returns the request template `key` (e.g. provider and model), building
+        it with `build` the first time it is asked for this version
+
+        Args:
+            key: key of the template
+            build: builds the template out of this version
+
+        Returns:
+            read only template
+        """
+        template = self._templates.get(key)
+        if template is None:
+            with self._lock:
+                template = self._templates.get(key)
+                if template is None:
+                    template = MappingProxyType(build(self))
+                    self._templates[key] = template
+        return template
+
+
+class PromptRegistry:
+    """Loads the prompt files once and serves the current `PromptVersion`.
+
+    The files are checked for changes (a `stat` per file) at most every
+    `check_interval` seconds. A changed version is loaded and swapped in
+    atomically, requests in flight keep the version they started with. A version
+    which fails to load is logged and the previous one is kept.
+
+    Args:
+        directory: directory of the prompt files, defaults to `prompts_dir()`
+        check_interval: minimum number of seconds between two checks for changes,
+            `None` disables hot reloading
+    """
+
+    def __init__(
+        self, directory: Path | None = None, check_interval: float | None = 1.0
+    ):
+        self.directory = directory or prompts_dir()
+        self.check_interval = check_interval
+        self._reload_lock = threading.Lock()
+        self._signature_seen = self._signature()
+        self._current = self._load()
+        self._checked_at = monotonic()
+
+    def _signature(self) -> tuple:
+        stats = [self.directory.joinpath(f).stat() for f in PROMPT_FILES]
+        return tuple((s.st_mtime_ns, s.st_size) for s in stats)
+
+    def _load(self) -> PromptVersion:
+        system_raw, properties_raw = (
+            self.directory.joinpath(f).read_bytes() for f in PROMPT_FILES
+        )
+        digest = hashlib.sha256()
+        digest.update(system_raw)
+        digest.update(properties_raw)
+        return PromptVersion(
+            version=digest.hexdigest(),
+            system_prompt=system_raw.decode("utf-8"),
+            properties=parse_properties(properties_raw.decode("utf-8")),
+        )
+
+    def current(self) -> PromptVersion:
+        if self.check_interval is not None:
+            now = monotonic()
+            if now - self._checked_at >= self.check_interval:
+                self._checked_at = now
+                self.reload_if_changed()
+        return self._current
+
+    def reload_if_changed(self) -> bool:
+        """reloads the prompt files if they changed on disk
+
+        Returns:
+            whether a new version was swapped in
+        """
+        if not self._reload_lock.acquire(blocking=False):
+            return False
+        try:
+            signature = self._signature()
+            if signature == self._signature_seen:
+                return False
+            self._signature_seen = signature
+            new = self._load()
+            if new.version == self._current.version:
+                return False
+            logger.info(
+                f"prompts changed, version {self._current.version[:12]} -> {new.version[:12]}"
+            )
+            self._current = new
+            return True
+        except Exception:
+            logger.exception("unable to reload prompts, keeping the current version")
+            return False
+        finally:
+            self._reload_lock.release()
+
+
+prompt_registry = PromptRegistry()
+
+
+class _SeiPromptsMeta(type):
+    @property
+    def system_prompt(cls) -> str:
+        return prompt_registry.current().system_prompt
+
+    @property
+    def version(cls) -> str:
+        return prompt_registry.current().version
+
+
+class SeiPrompts(metaclass=_SeiPromptsMeta):
+    """current prompts, backed by `prompt_registry`"""
@@ -0,0 +1,496 @@
+"""Client side rate limiting of the llm calls.
+
+Every provider/model pair has a requests per minute and a tokens per minute
+token bucket. A call reserves one request and an estimate of its tokens before it
+is sent, calls which have to wait are queued by priority (interactive requests
+go ahead of batch ones). The buckets adapt to the rate limit headers of the
+responses, and a 429 pauses every call to the model for its `Retry-After` instead
+of each caller retrying on its own.
+"""
+
+import asyncio
+import heapq
+import itertools
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Iterator, Mapping, TypeVar
+
+from ._types import LLMProvider
+from .metrics import span
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+INTERACTIVE = 0
+BATCH = 10
+
+MAX_ATTEMPTS = 4
+DEFAULT_RETRY_AFTER = 1.0
+
+request_priority: ContextVar[int] = ContextVar("request_priority", default=INTERACTIVE)
+# called when a call leaves the queue and is sent to the provider, e.g. the
+# router times its calls from there rather than from their wait for budget
+sent_callback: ContextVar[Callable[[], None] | None] = ContextVar(
+    "sent_callback", default=None
+)
+
+# name of the (limit, remaining) headers of each bucket, for each provider
+RATE_LIMIT_HEADERS = {
+    "requests": [
+        ("x-ratelimit-limit-requests", "x-ratelimit-remaining-requests"),
+        (
+            "anthropic-ratelimit-requests-limit",
+            "anthropic-ratelimit-requests-remaining",
+        ),
+    ],
+    "tokens": [
+        ("x-ratelimit-limit-tokens", "x-ratelimit-remaining-tokens"),
+        ("anthropic-ratelimit-tokens-limit", "anthropic-ratelimit-tokens-remaining"),
+        (
+            "anthropic-ratelimit-input-tokens-limit",
+            "anthropic-ratelimit-input-tokens-remaining",
+        ),
+    ],
+}
+
+
+@contextmanager
+def priority(level: int) -> Iterator[None]:
+    """runs the llm calls made within the block (and the tasks it creates) with
+    the priority `level`, lower is more urgent"""
+    token = request_priority.set(level)
+    try:
+        yield
+    finally:
+        request_priority.reset(token)
+
+
+@contextmanager
+def on_sent(callback: Callable[[], None]) -> Iterator[None]:
+    """calls `callback` every time an llm call made within the block is sent,
+    once it got its budget (and again for every retry)"""
+    token = sent_callback.set(callback)
+    try:
+        yield
+    finally:
+        sent_callback.reset(token)
+
+
+def _sent() -> None:
+    callback = sent_callback.get()
+    if callback is not None:
+        callback()
+
+
+class TokenBucket:
+    """Token bucket refilled continuously at `per_minute` tokens a minute, up to
+    `per_minute` tokens. `None` means unlimited. The level may go negative when
+    a call used more than it reserved, later calls then wait for the debt.
+
+    `level` and `updated` restore a bucket saved elsewhere (e.g. shared between
+    processes), a new bucket is full.
+    """
+
+    def __init__(
+        self,
+        per_minute: float | None = None,
+        level: float | None = None,
+        updated: float | None = None,
+    ):
+        self.per_minute = per_minute
+        self.level = (per_minute or 0.0) if level is None else level
+        self._updated = time.monotonic() if updated is None else updated
+
+    @property
+    def updated(self) -> float:
+        """time of the last refill"""
+        return self._updated
+
+    def refill(self, now: float) -> None:
+        if self.per_minute is not None:
+            elapsed = max(0.0, now - self._updated)
+            self.level = min(
+                self.per_minute, self.level + elapsed * self.per_minute / 60
+            )
+        self._updated = now
+
+    def wait(self, amount: float, now: float) -> float:
+        """seconds until `amount` tokens are available"""
+        if self.per_minute is None:
+            return 0.0
+        self.refill(now)
+        deficit = min(amount, self.per_minute) - self.level
+        return max(0.0, deficit * 60 / self.per_minute)
+
+    def consume(self, amount: float) -> None:
+        if self.per_minute is not None:
+            self.level -= amount
+
+    def set_limit(self, per_minute: float | None, now: float) -> None:
+        self.refill(now)
+        if per_minute is None:
+            self.per_minute = None
+            return
+        if self.per_minute is None:
+            self.level = per_minute
+        self.per_minute = per_minute
+        self.level = min(self.level, per_minute)
+
+
+class _Ticket:
+    """place of a call in the queue, `wake` interrupts the wait of its caller"""
+
+    __slots__ = ("priority", "seq", "tokens", "wake")
+
+    def __init__(self, priority: int, seq: int, tokens: int, wake: Callable[[], None]):
+        self.priority = priority
+        self.seq = seq
+        self.tokens = tokens
+        self.wake = wake
+
+    def __lt__(self, other: "_Ticket") -> bool:
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+
+def _waker(loop: asyncio.AbstractEventLoop, event: asyncio.Event) -> Callable[[], None]:
+    def wake() -> None:
+        try:
+            loop.call_soon_threadsafe(event.set)
+        except RuntimeError:
+            # the loop of the waiter is closed
+            pass
+
+    return wake
+
+
+class ModelLimiter:
+    """requests and tokens budget of one provider/model pair
+
+    Waiting calls are queued by priority, then in arrival order. Only the head of
+    the queue waits on the buckets, for the exact time they need to refill; the
+    others sleep until the calls ahead of them are granted. The head is woken
+    early when the budget grows (refunds, new limits) or the queue changes.
+
+    Args:
+        rpm: requests per minute, `None` until learnt from the rate limit headers
+        tpm: tokens per minute, `None` until learnt from the rate limit headers
+    """
+
+    def __init__(self, rpm: float | None = None, tpm: float | None = None):
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self._waiting: list[_Ticket] = []
+        self._seq = itertools.count()
+        self._blocked_until = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def waiting(self) -> int:
+        return len(self._waiting)
+
+    def _enqueue(self, tokens: int, priority: int, wake: Callable[[], None]) -> _Ticket:
+        ticket = _Ticket(priority, next(self._seq), tokens, wake)
+        with self._lock:
+            heapq.heappush(self._waiting, ticket)
+        return ticket
+
+    def _wake_head(self) -> None:
+        # called with the lock held
+        if self._waiting:
+            self._waiting[0].wake()
+
+    def _poll(self, ticket: _Ticket) -> float | None:
+        """grants the ticket if it is at the head of the queue and the budget
+        allows it (0), otherwise returns the number of seconds to wait, `None`
+        until woken up when the ticket isn't at the head"""
+        with self._lock:
+            if self._waiting[0] is not ticket:
+                return None
+            now = time.monotonic()
+            if now < self._blocked_until:
+                return self._blocked_until - now
+            wait = max(self.requests.wait(1, now), self.tokens.wait(ticket.tokens, now))
+            if wait > 0:
+                return wait
+            self.requests.consume(1)
+            self.tokens.consume(ticket.tokens)
+            heapq.heappop(self._waiting)
+            self._wake_head()
+            return 0.0
+
+    def _cancel(self, ticket: _Ticket) -> None:
+        with self._lock:
+            if ticket in self._waiting:
+                head = self._waiting[0] is ticket
+                self._waiting.remove(ticket)
+                heapq.heapify(self._waiting)
+                if head:
+                    self._wake_head()
+
+    def acquire(self, tokens: int, priority: int = INTERACTIVE) -> None:
+        woken = threading.Event()
+        ticket = self._enqueue(tokens, priority, woken.set)
+        try:
+            while True:
+                woken.clear()
+                wait = self._poll(ticket)
+                if wait == 0:
+                    return
+                woken.wait(wait)
+        except BaseException:
+            self._cancel(ticket)
+            raise
+
+    async def aacquire(self, tokens: int, priority: int = INTERACTIVE) -> None:
+        woken = asyncio.Event()
+        ticket = self._enqueue(
+            tokens, priority, _waker(asyncio.get_running_loop(), woken)
+        )
+        try:
+            while True:
+                woken.clear()
+                wait = self._poll(ticket)
+                if wait == 0:
+                    return
+                try:
+                    await asyncio.wait_for(woken.wait(), wait)
+                except asyncio.TimeoutError:
+                    pass
+        except BaseException:
+            self._cancel(ticket)
+            raise
+
+    def settle(self, reserved: int, used: int) -> None:
+        """charges (or refunds) the difference between the tokens reserved for a
+        call and the tokens it used"""
+        with self._lock:
+            self.tokens.consume(used - reserved)
+            if used < reserved:
+                self._wake_head()
+
+    def configure(self, rpm: float | None = None, tpm: float | None = None) -> None:
+        """sets the known limits, `None` leaves a limit as it is"""
+        with self._lock:
+            now = time.monotonic()
+            if rpm is not None:
+                self.requests.set_limit(rpm, now)
+            if tpm is not None:
+                self.tokens.set_limit(tpm, now)
+            self._wake_head()
+
+    def observe(self, headers: Mapping[str, str]) -> None:
+        """adapts the buckets to the rate limit headers of a response"""
+        with self._lock:
+            now = time.monotonic()
+            for name, bucket in (("requests", self.requests), ("tokens", self.tokens)):
+                for limit_header, remaining_header in RATE_LIMIT_HEADERS[name]:
+                    limit = _number(headers.get(limit_header))
+                    if limit is None:
+                        continue
+                    bucket.set_limit(limit, now)
+                    remaining = _number(headers.get(remaining_header))
+                    if remaining is not None:
+                        bucket.level = min(bucket.level, remaining)
+                    break
+            # the limits may have grown
+            self._wake_head()
+
+    def throttle(self, retry_after: float | None) -> None:
+        """pauses every call to the model after a 429 and empties the buckets, so
+        that calls resume at the refill rate instead of all at once"""
+        with self._lock:
+            now = time.monotonic()
+            pause = retry_after if retry_after is not None else DEFAULT_RETRY_AFTER
+            self._blocked_until = max(self._blocked_until, now + pause)
+            for bucket in (self.requests, self.tokens):
+                bucket.refill(now)
+                bucket.level = min(bucket.level, 0.0)
+
+
+def _number(value: str | None) -> float | None:
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+def _status_code(error: Exception) -> int | None:
+    return getattr(error, "status_code", None)
+
+
+# errors of the sdks (and of httpx) raised when no response was received: the
+# connection failed, was reset or timed out
+CONNECTION_ERRORS = frozenset(
+    {"APIConnectionError", "APITimeoutError", "TransportError"}
+)
+
+
+def _is_connection_error(error: Exception) -> bool:
+    if isinstance(error, (ConnectionError, TimeoutError)):
+        return True
+    return any(cls.__name__ in CONNECTION_ERRORS for cls in type(error).__mro__)
+
+
+def _retry_after(error: Exception) -> float | None:
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    return _number(headers.get("retry-after"))
+
+
+class LLMScheduler:
+    """Shared scheduler of the llm calls, one `ModelLimiter` per provider/model.
+
+    The sdk clients are created without retries: rate limited (429), server
+    errors (5xx) and connection errors and timeouts are retried here, after every
+    caller of the model paused. The tokens reserved for a failed attempt are given
+    back before it is retried.
+
+    Args:
+        max_attempts: maximum number of attempts of a call
+    """
+
+    def __init__(self, max_attempts: int = MAX_ATTEMPTS):
+        self.max_attempts = max_attempts
+        self._limiters: dict[tuple[str, str], ModelLimiter] = {}
+        self._lock = threading.Lock()
+
+    def limiter(self, provider: LLMProvider | str, model: str) -> ModelLimiter:
+        key = (str(provider), model)
+        limiter = self._limiters.get(key)
+        if limiter is None:
+            with self._lock:
+                limiter = self._limiters.setdefault(key, ModelLimiter())
+        return limiter
+
+    def configure(
+        self,
+        provider: LLMProvider | str,
+        model: str,
+        rpm: float | None = None,
+        tpm: float | None = None,
+    ) -> None:
+        """sets the known limits of a model, they are still adapted to the rate
+        limit headers"""
+        self.limiter(provider, model).configure(rpm=rpm, tpm=tpm)
+
+    def waiting(self) -> dict[str, int]:
+        """number of calls waiting for budget, by `provider:model`"""
+        return {
+            f"{p}:{m}": limiter.waiting for (p, m), limiter in self._limiters.items()
+        }
+
+    def _retry_delay(
+        self, limiter: ModelLimiter, error: Exception, attempt: int
+    ) -> float | None:
+        """seconds to wait before retrying a failed call, `None` if it must not be
+        retried"""
+        if attempt >= self.max_attempts:
+            return None
+        status = _status_code(error)
+        if status == 429:
+            retry_after = _retry_after(error)
+            logger.warning(
+                f"rate limited, pausing for {retry_after or DEFAULT_RETRY_AFTER}s"
+            )
+            limiter.throttle(retry_after)
+            return 0.0
+        if (status is not None and status >= 500) or (
+            status is None and _is_connection_error(error)
+        ):
+            return min(8.0, 0.5 * 2**attempt)
+        return None
+
+    def run(
+        self,
+        provider: LLMProvider | str,
+        model: str,
+        tokens: int,
+        send: Callable[[], T],
+    ) -> T:
+        """sends a call once the budget of the model allows it
+
+        Args:
+            provider: provider of the model
+            model: model called
+            tokens: estimate of the tokens of the call
+            send: sends the call, returns the raw response of the sdk (its `headers`
+                are used to adapt the limits)
+
+        Returns:
+            the raw response
+        """
+        limiter = self.limiter(provider, model)
+        attempt = 0
+        while True:
+            with span("rate_limit"):
+                limiter.acquire(tokens, request_priority.get())
+            _sent()
+            try:
+                with span("llm"):
+                    response = send()
+            except Exception as e:
+                limiter.settle(tokens, 0)
+                attempt += 1
+                delay = self._retry_delay(limiter, e, attempt)
+                if delay is None:
+                    raise
+                time.sleep(delay)
+                continue
+            limiter.observe(_headers(response))
+            return response
+
+    async def arun(
+        self,
+        provider: LLMProvider | str,
+        model: str,
+        tokens: int,
+        send: Callable[[], Awaitable[T]],
+    ) -> T:
+        """async version of `run`"""
+        limiter = self.limiter(provider, model)
+        attempt = 0
+        while True:
+            with span("rate_limit"):
+                await limiter.aacquire(tokens, request_priority.get())
+            _sent()
+            try:
+                with span("llm"):
+                    response = await send()
+            except Exception as e:
+                limiter.settle(tokens, 0)
+                attempt += 1
+                delay = self._retry_delay(limiter, e, attempt)
+                if delay is None:
+                    raise
+                await asyncio.sleep(delay)
+                continue
+            limiter.observe(_headers(response))
+            return response
+
+
+def _headers(response: Any) -> Mapping[str, str]:
+    return getattr(response, "headers", None) or {}
+
+
+def parse_rate_limits(spec: str) -> list[tuple[LLMProvider, str, float, float]]:
+    """parses a comma separated list of `provider:model=rpm/tpm`, e.g.
+    `openai:gpt-4o=500/30000`"""
+    limits = []
+    for item in spec.split(","):
+        if item.strip():
+            member, _, rates = item.strip().partition("=")
+            provider, _, model = member.partition(":")
+            rpm, _, tpm = rates.partition("/")
+            if not (model and rpm and tpm):
+                raise ValueError(f"expected `provider:model=rpm/tpm`, got {item!r}")
+            limits.append(
+                (LLMProvider(provider.lower()), model, float(rpm), float(tpm))
+            )
+    return limits
+
+
+llm_scheduler = LLMScheduler()
@@ -0,0 +1,341 @@
+"""Routing of the llm calls over several provider/model pairs.
+
+Every route keeps a rolling window of its latencies and errors and a circuit
+breaker, opened after repeated failures. A call goes to the fastest healthy
+route, fails over to the next ones on errors and, when it is still running past
+a percentile of the usual latency of its route, a hedged duplicate is sent to the
+next route and whichever answer arrives first is kept. Latencies and hedging
+delays are timed from when the scheduler sends a call, the time it waited for the
+rate limits of its model is left out.
+"""
+
+import asyncio
+import logging
+import threading
+import time
+from collections import deque
+from typing import Literal
+
+from ._types import LLMProvider, LLMResponse, RouteStats
+from .llms import LLM
+from .ratelimit import on_sent
+
+logger = logging.getLogger(__name__)
+
+
+class NoRouteAvailableError(RuntimeError):
+    """raised when the circuit of every route is open"""
+
+
+class LatencyWindow:
+    """rolling window of the latency and outcome of the last `size` calls"""
+
+    def __init__(self, size: int = 100):
+        self._calls: deque[tuple[float, bool]] = deque(maxlen=size)
+
+    def record(self, latency: float, ok: bool) -> None:
+        self._calls.append((latency, ok))
+
+    def __len__(self) -> int:
+        return len(self._calls)
+
+    def percentile(self, q: float) -> float | None:
+        """`q`th percentile (0-100) of the latency of the successful calls"""
+        latencies = sorted(latency for latency, ok in list(self._calls) if ok)
+        if not latencies:
+            return None
+        index = min(len(latencies) - 1, int(round(q / 100 * (len(latencies) - 1))))
+        return latencies[index]
+
+    @property
+    def error_rate(self) -> float:
+        calls = list(self._calls)
+        return sum(not ok for _, ok in calls) / len(calls) if calls else 0.0
+
+
+class CircuitBreaker:
+    """Opens after `failure_threshold` consecutive failures. Once `reset_timeout`
+    seconds passed, a single trial call is let through (half open): the circuit
+    closes if it succeeds and opens again if it fails.
+
+    Args:
+        failure_threshold: number of consecutive failures opening the circuit
+        reset_timeout: number of seconds the circuit stays open
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at: float | None = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> Literal["closed", "open", "half_open"]:
+        if self._opened_at is None:
+            return "closed"
+        if time.monotonic() - self._opened_at < self.reset_timeout:
+            return "open"
+        return "half_open"
+
+    def allow(self) -> bool:
+        """whether a call may go through, reserves the trial call of a half open
+        circuit"""
+        with self._lock:
+            state = self.state
+            if state == "closed":
+                return True
+            if state == "half_open" and not self._probing:
+                self._probing = True
+                return True
+            return False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._probing = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            if self._probing or self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+            self._probing = False
+
+    def release(self) -> None:
+        """gives back the trial call of a call which was cancelled"""
+        with self._lock:
+            self._probing = False
+
+
+class Route:
+    def __init__(self, llm: LLM, window: int, breaker: CircuitBreaker):
+        self.llm = llm
+        self.latency = LatencyWindow(window)
+        self.breaker = breaker
+
+    def stats(self) -> RouteStats:
+        return RouteStats(
+            llm_provider=self.llm.llm_provider,
+            model=self.llm.model,
+            calls=len(self.latency),
+            p50=self.latency.percentile(50),
+            p95=self.latency.percentile(95),
+            error_rate=self.latency.error_rate,
+            circuit=self.breaker.state,
+        )
+
+
+class _Attempt:
+    """call of a route, `sent_at` is set when the scheduler sends it"""
+
+    def __init__(self, route: Route, deadline: float | None):
+        self.route = route
+        self.deadline = deadline
+        self.sent = asyncio.Event()
+        self.sent_at: float | None = None
+
+    def mark_sent(self) -> None:
+        self.sent_at = time.perf_counter()
+        self.sent.set()
+
+
+class LLMRouter:
+    """Routes the calls of a `ComplianceChecker` over several llms. It exposes the
+    same `chat`/`achat` interface as an `LLM`.
+
+    Args:
+        llms: llms to route over, in order of preference
+        hedge_percentile: latency percentile of a route past which a call is
+            hedged on the next route
+        default_hedge_delay: hedging delay used until a route has `min_samples`
+            calls, `None` to only hedge once the percentile is known
+        min_hedge_delay: lower bound of the hedging delay
+        min_samples: number of calls after which the latency of a route is used to
+            rank it and compute its hedging delay
+        window: number of calls the latency and error rate are computed over
+        failure_threshold: number of consecutive failures opening the circuit of
+            a route
+        reset_timeout: number of seconds the circuit of a route stays open
+    """
+
+    def __init__(
+        self,
+        llms: list[LLM],
+        hedge_percentile: float = 95,
+        default_hedge_delay: float | None = 30.0,
+        min_hedge_delay: float = 0.5,
+        min_samples: int = 20,
+        window: int = 100,
+        failure_threshold: int = 5,
+        reset_timeout: float = 30.0,
+    ):
+        if not llms:
+            raise ValueError("the router needs at least one llm")
+        self.routes = [
+            Route(llm, window, CircuitBreaker(failure_threshold, reset_timeout))
+            for llm in llms
+        ]
+        self.hedge_percentile = hedge_percentile
+        self.default_hedge_delay = default_hedge_delay
+        self.min_hedge_delay = min_hedge_delay
+        self.min_samples = min_samples
+
+    @property
+    def llm_provider(self) -> LLMProvider:
+        return self.routes[0].llm.llm_provider
+
+    @property
+    def model(self) -> str:
+        return self.routes[0].llm.model
+
+    def ranked(self) -> list[Route]:
+        """routes whose circuit is not open, the fastest (by median latency) first.
+        Routes without enough calls yet keep their order of preference: only the
+        routes with `min_samples` calls swap places between themselves"""
+        routes = [route for route in self.routes if route.breaker.state != "open"]
+        slots = [
+            i
+            for i, route in enumerate(routes)
+            if len(route.latency) >= self.min_samples
+        ]
+        by_latency = sorted(
+            (routes[i] for i in slots),
+            key=lambda route: route.latency.percentile(50) or float("inf"),
+        )
+        for i, route in zip(slots, by_latency):
+            routes[i] = route
+        return routes
+
+    def hedge_delay(self, route: Route) -> float | None:
+        if len(route.latency) < self.min_samples:
+            return self.default_hedge_delay
+        delay = route.latency.percentile(self.hedge_percentile)
+        if delay is None:
+            return self.default_hedge_delay
+        return max(self.min_hedge_delay, delay)
+
+    def stats(self) -> list[RouteStats]:
+        return [route.stats() for route in self.routes]
+
+    def chat(self, user_prompt: str) -> LLMResponse:
+        error: Exception | None = None
+        for route in self.ranked():
+            if not route.breaker.allow():
+                continue
+            attempt = _Attempt(route, deadline=None)
+            try:
+                with on_sent(attempt.mark_sent):
+                    response = route.llm.chat(user_prompt=user_prompt)
+            except Exception as e:
+                self._record(attempt, ok=False)
+                logger.warning(f"{self._name(route)} failed: {e!r}")
+                error = e
+                continue
+            self._record(attempt, ok=True)
+            return response
+        raise error or NoRouteAvailableError("the circuit of every llm is open")
+
+    async def achat(self, user_prompt: str) -> LLMResponse:
+        candidates = self.ranked()
+        pending: dict[asyncio.Task, _Attempt] = {}
+        error: Exception | None = None
+
+        def start_next() -> bool:
+            while candidates:
+                route = candidates.pop(0)
+                if route.breaker.allow():
+                    attempt = _Attempt(route, self.hedge_delay(route))
+                    task = asyncio.create_task(self._acall(attempt, user_prompt))
+                    pending[task] = attempt
+                    return True
+            return False
+
+        try:
+            start_next()
+            while pending:
+                timeout = None
+                if len(pending) == 1 and candidates:
+                    attempt = next(iter(pending.values()))
+                    if attempt.sent_at is None:
+                        # the hedging delay runs from when the call is sent, not
+                        # while it waits for the rate limits of its model
+                        sent = asyncio.ensure_future(attempt.sent.wait())
+                        try:
+                            await asyncio.wait(
+                                {*pending, sent}, return_when=asyncio.FIRST_COMPLETED
+                            )
+                        finally:
+                            sent.cancel()
+                        if not any(task.done() for task in pending):
+                            continue
+                    elif attempt.deadline is not None:
+                        elapsed = time.perf_counter() - attempt.sent_at
+                        timeout = max(0.0, attempt.deadline - elapsed)
+                done, _ = await asyncio.wait(
+                    pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    attempt = next(iter(pending.values()))
+                    if start_next():
+                        logger.info(
+                            f"{self._name(attempt.route)} slower than "
+                            f"{attempt.deadline:.2f}s, hedging"
+                        )
+                    continue
+                for task in done:
+                    route = pending.pop(task).route
+                    try:
+                        return task.result()
+                    except Exception as e:
+                        logger.warning(f"{self._name(route)} failed: {e!r}")
+                        error = e
+                if not pending:
+                    start_next()
+        finally:
+            for task in pending:
+                task.cancel()
+        raise error or NoRouteAvailableError("the circuit of every llm is open")
+
+    async def _acall(self, attempt: _Attempt, user_prompt: str) -> LLMResponse:
+        route = attempt.route
+        try:
+            with on_sent(attempt.mark_sent):
+                response = await route.llm.achat(user_prompt=user_prompt)
+        except asyncio.CancelledError:
+            route.breaker.release()
+            # a call losing to its hedge would have taken at least this long,
+            # leaving it out would trim the tail the hedging delay is computed from
+            if attempt.sent_at is not None and attempt.deadline is not None:
+                elapsed = time.perf_counter() - attempt.sent_at
+                if elapsed >= attempt.deadline:
+                    route.latency.record(elapsed, ok=True)
+            raise
+        except Exception:
+            self._record(attempt, ok=False)
+            raise
+        self._record(attempt, ok=True)
+        return response
+
+    def _record(self, attempt: _Attempt, ok: bool) -> None:
+        """records the time the provider took to answer (since the last send),
+        a call failing before it was sent only counts as a failure"""
+        route = attempt.route
+        sent_at = attempt.sent_at
+        route.latency.record(
+            time.perf_counter() - sent_at if sent_at is not None else 0.0, ok
+        )
+        if ok:
+            route.breaker.record_success()
+        else:
+            route.breaker.record_failure()
+
+    @staticmethod
+    def _name(route: Route) -> str:
+        return f"{route.llm.llm_provider}:{route.llm.model}"
+
+    async def aclose(self) -> None:
+        for route in self.routes:
+            await route.llm.aclose()
@@ -0,0 +1,73 @@
+"""Coalescing of identical concurrent calls: while a call for a key is in flight,
+other callers with the same key wait for it and share its result instead of
+repeating the work."""
+
+import asyncio
+import threading
+from concurrent.futures import Future
+from typing import Awaitable, Callable, Hashable, TypeVar
+
+T = TypeVar("T")
+
+
+class SingleFlight:
+    """Runs at most one call per key at a time, `do` for blocking calls and `ado`
+    for coroutines. Nothing is kept once a call finished, so callers arriving
+    afterwards start a new call and never get a stale result.
+
+    Usage:
+        group = SingleFlight()
+        response = await group.ado(url, lambda: check(url))
+    """
+
+    def __init__(self):
+        self.coalesced = 0
+        self._calls: dict[Hashable, Future] = {}
+        self._tasks: dict[Hashable, asyncio.Task] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._calls) + len(self._tasks)
+
+    def do(self, key: Hashable, fn: Callable[[], T]) -> T:
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if call is None:
+                call = self._calls[key] = Future()
+            else:
+                self.coalesced += 1
+        if not leader:
+            return call.result()
+        try:
+            result = fn()
+        except BaseException as e:
+            call.set_exception(e)
+            raise
+        else:
+            call.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+    async def ado(self, key: Hashable, fn: Callable[[], Awaitable[T]]) -> T:
+        """the call runs in its own task: a caller which is cancelled doesn't
+        cancel it for the other callers"""
+        task = self._tasks.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._tasks[key] = task
+            task.add_done_callback(lambda done: self._done(key, done))
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(task)
+
+    def _done(self, key: Hashable, task: asyncio.Task) -> None:
+        if self._tasks.get(key) is task:
+            del self._tasks[key]
+        if not task.cancelled():
+            # retrieved here so that a failure every caller gave up on isn't
+            # reported as never retrieved
+            task.exception()
@@ -0,0 +1,307 @@
+"""Crawls a whole site, starting from a root url. Pages are discovered from the
+sitemap(s) and from same origin links, robots.txt and per host politeness limits
+are honoured."""
+
+import asyncio
+import logging
+import xml.etree.ElementTree as ET
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
+from urllib.robotparser import RobotFileParser
+
+import httpx
+
+from ._types import CrawledPage, ExtractorConfig
+from .urls import canonicalize_url, origin, page_key, strip_tracking
+from .web_crawler import astream_extract, async_http_client
+
+logger = logging.getLogger(__name__)
+
+USER_AGENT = "seiright"
+MAX_SITEMAPS = 20
+SKIPPED_EXTENSIONS = (
+    ".pdf",
+    ".jpg",
+    ".jpeg",
+    ".png",
+    ".gif",
+    ".svg",
+    ".webp",
+    ".zip",
+    ".gz",
+    ".mp4",
+    ".css",
+    ".js",
+    ".json",
+    ".xml",
+)
+
+
+class HostPoliteness:
+    """Limits the number of concurrent requests to a host and spaces them at
+    least `delay` seconds apart
+
+    Args:
+        concurrency: maximum number of requests in flight to the host
+        delay: minimum delay, in seconds, between two requests to the host
+    """
+
+    def __init__(self, concurrency: int, delay: float):
+        self.delay = delay
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._lock = asyncio.Lock()
+        self._next_request = 0.0
+
+    @asynccontextmanager
+    async def slot(self):
+        async with self._semaphore:
+            if self.delay > 0:
+                async with self._lock:
+                    now = asyncio.get_running_loop().time()
+                    wait = self._next_request - now
+                    self._next_request = max(now, self._next_request) + self.delay
+                if wait > 0:
+                    await asyncio.sleep(wait)
+            yield
+
+
+def site_of(url: str) -> str:
+    """origin of a url, the bare and `www.` hosts being the same site"""
+    scheme, netloc = origin(url).split("://", 1)
+    return f"{scheme}://{netloc.removeprefix('www.')}"
+
+
+def page_links(hrefs: list[str], base_url: str) -> list[str]:
+    links = []
+    for href in hrefs:
+        href = href.strip()
+        if href and not href.startswith(("mailto:", "tel:", "javascript:", "#")):
+            links.append(strip_tracking(href, base_url=base_url))
+    return links
+
+
+def sitemap_locations(xml: str) -> tuple[list[str], bool]:
+    """parses a sitemap
+
+    Args:
+        xml: content of the sitemap
+
+    Returns:
+        urls listed in the sitemap and whether the sitemap is a sitemap index (i.e.
+        the urls are other sitemaps)
+    """
+    root = ET.fromstring(xml)
+    locations = [
+        el.text.strip()
+        for el in root.iter()
+        if el.tag.rsplit("}", 1)[-1] == "loc" and el.text and el.text.strip()
+    ]
+    return locations, root.tag.rsplit("}", 1)[-1] == "sitemapindex"
+
+
+class SiteCrawler:
+    """Concurrent, polite crawler of a single site
+
+    Args:
+        client: http client, defaults to the shared async client
+        max_pages: maximum number of pages crawled
+        max_depth: maximum number of links followed from the root url
+        concurrency: maximum number of pages fetched concurrently
+        per_host_concurrency: maximum number of requests in flight to one host
+        per_host_delay: minimum delay between two requests to one host. A larger
+            `Crawl-delay` in robots.txt takes precedence
+        respect_robots: whether to honour robots.txt
+        use_sitemap: whether to seed the crawl with the urls of the sitemap(s)
+        extractor_config: parser backend and size limits of the page extraction
+
+    The crawler keeps the politeness state of every host it has crawled, crawls
+    running on the same event loop can share an instance to stay polite across them.
+    """
+
+    def __init__(
+        self,
+        client: httpx.AsyncClient | None = None,
+        max_pages: int = 500,
+        max_depth: int = 3,
+        concurrency: int = 16,
+        per_host_concurrency: int = 4,
+        per_host_delay: float = 0.0,
+        respect_robots: bool = True,
+        use_sitemap: bool = True,
+        extractor_config: ExtractorConfig | None = None,
+    ):
+        self.client = client
+        self.max_pages = max_pages
+        self.max_depth = max_depth
+        self.concurrency = concurrency
+        self.per_host_concurrency = per_host_concurrency
+        self.per_host_delay = per_host_delay
+        self.respect_robots = respect_robots
+        self.use_sitemap = use_sitemap
+        self.extractor_config = extractor_config
+        self._hosts: dict[str, HostPoliteness] = {}
+
+    @property
+    def http_client(self) -> httpx.AsyncClient:
+        return self.client or async_http_client()
+
+    def politeness(self, url: str, delay: float) -> HostPoliteness:
+        host = origin(url)
+        if host not in self._hosts:
+            self._hosts[host] = HostPoliteness(self.per_host_concurrency, delay)
+        self._hosts[host].delay = max(self._hosts[host].delay, delay)
+        return self._hosts[host]
+
+    async def get(self, url: str, delay: float) -> httpx.Response:
+        async with self.politeness(url, delay).slot():
+            return await self.http_client.get(url, headers={"User-Agent": USER_AGENT})
+
+    async def resolve(self, url: str) -> str:
+        """url `url` redirects to (e.g. http to https, or to the `www.` host), so
+        that the site is the one its pages are served from"""
+        try:
+            async with self.politeness(url, self.per_host_delay).slot():
+                response = await self.http_client.head(
+                    url, headers={"User-Agent": USER_AGENT}, follow_redirects=True
+                )
+        except httpx.HTTPError as e:
+            logger.warning(f"unable to resolve {url}: {e!r}")
+            return url
+        return canonicalize_url(str(response.url))
+
+    async def robots(self, site: str) -> RobotFileParser:
+        parser = RobotFileParser(f"{site}/robots.txt")
+        if not self.respect_robots:
+            parser.allow_all = True
+            return parser
+        try:
+            response = await self.get(f"{site}/robots.txt", self.per_host_delay)
+        except httpx.HTTPError as e:
+            # unreachable robots.txt, nothing may be crawled (RFC 9309)
+            logger.warning(f"unable to fetch robots.txt of {site}: {e!r}")
+            parser.disallow_all = True
+            return parser
+        if response.status_code in (401, 403) or response.status_code >= 500:
+            if response.status_code >= 500:
+                logger.warning(
+                    f"robots.txt of {site} unavailable ({response.status_code}), "
+                    "not crawling"
+                )
+            parser.disallow_all = True
+        elif response.status_code >= 400:
+            parser.allow_all = True
+        else:
+            parser.parse(response.text.splitlines())
+        return parser
+
+    async def sitemap_urls(self, site: str, robots: RobotFileParser) -> list[str]:
+        pending = list(robots.site_maps() or []) or [f"{site}/sitemap.xml"]
+        fetched: set[str] = set()
+        urls: list[str] = []
+        while pending and len(fetched) < MAX_SITEMAPS and len(urls) < self.max_pages:
+            sitemap = pending.pop(0)
+            if sitemap in fetched:
+                continue
+            fetched.add(sitemap)
+            try:
+                response = await self.get(sitemap, self.per_host_delay)
+                if response.status_code >= 400:
+                    continue
+                locations, is_index = sitemap_locations(response.text)
+            except (httpx.HTTPError, ET.ParseError) as e:
+                logger.warning(f"unable to read sitemap {sitemap}: {e!r}")
+                continue
+            if is_index:
+                pending.extend(locations)
+            else:
+                urls.extend(locations)
+        return urls
+
+    async def crawl(self, root_url: str) -> AsyncIterator[CrawledPage]:
+        """crawls the site of `root_url`, yielding pages as soon as they are fetched
+
+        Args:
+            root_url: url to start the crawl from
+
+        Yields:
+            crawled pages, pages which failed to load have their `error` set
+        """
+        root_url = await self.resolve(canonicalize_url(root_url))
+        site = origin(root_url)
+        robots = await self.robots(site)
+        delay = max(self.per_host_delay, float(robots.crawl_delay(USER_AGENT) or 0))
+
+        frontier: asyncio.Queue[tuple[str, int]] = asyncio.Queue()
+        results: asyncio.Queue[CrawledPage | None] = asyncio.Queue()
+        seen: set[str] = set()  # `page_key`s
+
+        def enqueue(url: str, depth: int) -> None:
+            url = strip_tracking(url)
+            if (
+                page_key(url) in seen
+                or len(seen) >= self.max_pages
+                or depth > self.max_depth
+                or site_of(url) != site_of(site)
+                or url.lower().endswith(SKIPPED_EXTENSIONS)
+                or not robots.can_fetch(USER_AGENT, url)
+            ):
+                return
+            seen.add(page_key(url))
+            frontier.put_nowait((url, depth))
+
+        enqueue(root_url, 0)
+        if self.use_sitemap:
+            for url in await self.sitemap_urls(site, robots):
+                enqueue(url, 1)
+
+        async def fetch(url: str, depth: int) -> CrawledPage | None:
+            async with self.politeness(url, delay).slot():
+                response, extractor = await astream_extract(
+                    url,
+                    client=self.http_client,
+                    headers={"User-Agent": USER_AGENT},
+                    config=self.extractor_config,
+                    collect_links=True,
+                    html_only=True,
+                )
+            if extractor is None:
+                return None
+            page_url = canonicalize_url(str(response.url))
+            collector = extractor.collector
+            if collector.canonical is not None:
+                canonical = page_key(
+                    canonicalize_url(collector.canonical, base_url=page_url)
+                )
+                if canonical != page_key(url):
+                    if canonical in seen:
+                        return None
+                    seen.add(canonical)
+            for link in page_links(collector.links, page_url):
+                enqueue(link, depth + 1)
+            page = extractor.page()
+            return CrawledPage(url=url, depth=depth, page=page, title=page.title)
+
+        async def worker() -> None:
+            while True:
+                url, depth = await frontier.get()
+                try:
+                    page = await fetch(url, depth)
+                except Exception as e:
+                    logger.warning(f"unable to crawl {url}: {e!r}")
+                    page = CrawledPage(url=url, depth=depth, error=repr(e))
+                if page is not None:
+                    results.put_nowait(page)
+                frontier.task_done()
+
+        async def close_when_done() -> None:
+            await frontier.join()
+            results.put_nowait(None)
+
+        tasks = [asyncio.create_task(worker()) for _ in range(self.concurrency)]
+        tasks.append(asyncio.create_task(close_when_done()))
+        try:
+            while (page := await results.get()) is not None:
+                yield page
+        finally:
+            for task in tasks:
+                task.cancel()
@@ -0,0 +1,96 @@
+"""Helpers to normalise urls, so that trivially different urls of the same page
+are crawled and checked only once"""
+
+from urllib.parse import (
+    parse_qsl,
+    unquote_plus,
+    urlencode,
+    urljoin,
+    urlsplit,
+    urlunsplit,
+)
+
+DEFAULT_PORTS = {"http": 80, "https": 443}
+
+
+def canonicalize_url(url: str, base_url: str | None = None) -> str:
+    """normalises a url: resolves it against `base_url`, lower cases the scheme and
+    host, drops default ports and the fragment and uses `/` for an empty path
+
+    Args:
+        url: url to normalise
+        base_url: url of the page the url was found on, to resolve relative urls
+
+    Returns:
+        canonical url
+    """
+    if base_url is not None:
+        url = urljoin(base_url, url)
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or "").lower()
+    if ":" in host:
+        # ipv6 literal
+        host = f"[{host}]"
+    netloc = host
+    if parts.port and parts.port != DEFAULT_PORTS.get(scheme):
+        netloc = f"{host}:{parts.port}"
+    path = parts.path or "/"
+    return urlunsplit((scheme, netloc, path, parts.query, ""))
+
+
+def origin(url: str) -> str:
+    """scheme and host (with non default port) of a url"""
+    parts = urlsplit(canonicalize_url(url))
+    return f"{parts.scheme}://{parts.netloc}"
+
+
+# query parameters added by analytics and ad platforms, they don't change the page
+TRACKING_PARAMS = frozenset(
+    {
+        "dclid",
+        "fbclid",
+        "gbraid",
+        "gclid",
+        "gclsrc",
+        "igshid",
+        "mc_cid",
+        "mc_eid",
+        "msclkid",
+        "_ga",
+        "_gl",
+        "_hsenc",
+        "_hsmi",
+        "wbraid",
+        "yclid",
+    }
+)
+
+
+def _is_tracking(name: str) -> bool:
+    name = name.lower()
+    return name.startswith("utm_") or name in TRACKING_PARAMS
+
+
+def strip_tracking(url: str, base_url: str | None = None) -> str:
+    """canonical url (`canonicalize_url`) without its tracking query parameters
+    (`utm_*`, `gclid`, ...). It is the url of the page which is fetched: the other
+    parameters are kept as they are, byte for byte"""
+    parts = urlsplit(canonicalize_url(url, base_url=base_url))
+    query = [
+        pair
+        for pair in parts.query.split("&")
+        if pair and not _is_tracking(unquote_plus(pair.partition("=")[0]))
+    ]
+    return urlunsplit(parts._replace(query="&".join(query)))
+
+
+def page_key(url: str) -> str:
+    """identity of a page: the url without tracking parameters, `www.`, trailing
+    slash, and with its query parameters sorted. Urls with the same key are
+    checked once"""
+    parts = urlsplit(strip_tracking(url))
+    netloc = parts.netloc.removeprefix("www.")
+    path = parts.path.rstrip("/") or "/"
+    query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+    return urlunsplit((parts.scheme, netloc, path, query, ""))
@@ -1,42 +1,432 @@
-import textwrap
-from typing import Optional, cast
+import asyncio
+import sqlite3
+import threading
+from pathlib import Path
+from time import perf_counter, time
+from typing import TYPE_CHECKING, Any, Callable, Mapping, Optional
 
+import httpx
 import requests
-from bs4 import BeautifulSoup, Tag
 
+from ._types import CachedPage, ExtractorConfig
+from .blocks import ExtractedPage, title_banner, wrap_line
+from .extractor import StreamingExtractor, content_type_encoding, extract_html
+from .metrics import PAGE_BYTES, PAGE_TEXT_CHARS, STAGE_SECONDS, span
 
-def extract_text_from_url(url: str) -> tuple[str, str | None]:
-    response = requests.get(url)
-    response.raise_for_status()
+if TYPE_CHECKING:
+    from .workers import ExtractionPool
 
-    soup = BeautifulSoup(response.text, "html.parser")
-    title_tag = soup.find("title")
-    if isinstance(title_tag, Tag):
-        title = title_tag.get_text(strip=True) or None
-    else:
-        title = None
+_async_client: httpx.AsyncClient | None = None
 
-    text_elements = soup.find_all(["p", "h1", "h2", "h3", "h4", "h5", "h6", "li"])
+CONNECTION_STAGES = {"connection.connect_tcp": "connect", "connection.start_tls": "tls"}
 
-    extracted_text = []
-    for element in text_elements:
-        text = element.get_text(strip=True)
-        if text:
-            if element.name.startswith("h"):
-                extracted_text.append(f"\n{'#' * int(element.name[1:])} {text}\n")
-            else:
-                extracted_text.append(text)
 
-    return cast(str, "\n".join(extracted_text)), title
+def async_http_client() -> httpx.AsyncClient:
+    """returns the process wide async http client, so that all the crawls share
+    a single connection pool
 
+    Returns:
+        async http client
+    """
+    global _async_client
+    if _async_client is None or _async_client.is_closed:
+        _async_client = httpx.AsyncClient(
+            follow_redirects=True,
+            timeout=httpx.Timeout(30.0, connect=10.0),
+            limits=httpx.Limits(max_connections=100, max_keepalive_connections=20),
+        )
+    return _async_client
+
+
+async def aclose_http_client() -> None:
+    """closes the shared async http client, if it was ever created"""
+    global _async_client
+    if _async_client is not None:
+        await _async_client.aclose()
+        _async_client = None
+
+
+def parse_html(
+    html: str | bytes, config: ExtractorConfig | None = None
+) -> tuple[str, str | None]:
+    return extract_html(html, config=config).result()
+
+
+class PageCache:
+    """Persistent (sqlite) cache of crawled pages, used to revalidate pages with
+    conditional GETs. Along with its validators (`ETag` and `Last-Modified`), the
+    extracted text and title of a page are stored so that a `304 Not Modified`
+    skips both the download and the html parsing. The async paths use `aget`,
+    `aset` and `atouch`, which run the sqlite queries off the event loop.
+
+    Args:
+        db_path: path of the sqlite file, `":memory:"` for a non persistent cache
+    """
+
+    def __init__(self, db_path: str | Path = ":memory:"):
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(str(db_path), check_same_thread=False)
+        columns = {row[1] for row in self._db.execute("PRAGMA table_info(pages)")}
+        if "body" in columns:
+            # caches of previous versions stored the (truncated) body, nothing
+            # read it back
+            self._db.execute("DROP TABLE pages")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS pages ("
+            "url TEXT PRIMARY KEY, etag TEXT, last_modified TEXT, "
+            "text TEXT NOT NULL, title TEXT, fetched_at REAL NOT NULL)"
+        )
+        self._db.commit()
+
+    def get(self, url: str) -> CachedPage | None:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT url, etag, last_modified, text, title, fetched_at "
+                "FROM pages WHERE url = ?",
+                (url,),
+            ).fetchone()
+        if row is None:
+            return None
+        fields = ("url", "etag", "last_modified", "text", "title", "fetched_at")
+        return CachedPage(**dict(zip(fields, row)))
+
+    def set(self, page: CachedPage) -> None:
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO pages "
+                "(url, etag, last_modified, text, title, fetched_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    page.url,
+                    page.etag,
+                    page.last_modified,
+                    page.text,
+                    page.title,
+                    page.fetched_at,
+                ),
+            )
+            self._db.commit()
+
+    def touch(self, url: str) -> None:
+        with self._lock:
+            self._db.execute(
+                "UPDATE pages SET fetched_at = ? WHERE url = ?", (time(), url)
+            )
+            self._db.commit()
+
+    async def aget(self, url: str) -> CachedPage | None:
+        return await asyncio.to_thread(self.get, url)
+
+    async def aset(self, page: CachedPage) -> None:
+        await asyncio.to_thread(self.set, page)
+
+    async def atouch(self, url: str) -> None:
+        await asyncio.to_thread(self.touch, url)
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+
+def conditional_headers(cached: CachedPage | None) -> dict[str, str]:
+    """request headers to revalidate a cached page"""
+    headers = {}
+    if cached is not None:
+        if cached.etag:
+            headers["If-None-Match"] = cached.etag
+        if cached.last_modified:
+            headers["If-Modified-Since"] = cached.last_modified
+    return headers
+
+
+def _cache_page(
+    page_cache: PageCache,
+    url: str,
+    headers: Mapping[str, str],
+    result: Callable[[], ExtractedPage],
+) -> None:
+    etag = headers.get("ETag")
+    last_modified = headers.get("Last-Modified")
+    if etag or last_modified:
+        page = result()
+        page_cache.set(
+            CachedPage(
+                url=url,
+                etag=etag,
+                last_modified=last_modified,
+                text=page.render(),
+                title=page.title,
+                fetched_at=time(),
+            )
+        )
+
+
+async def _acache_page(
+    page_cache: PageCache,
+    url: str,
+    headers: Mapping[str, str],
+    result: Callable[[], ExtractedPage],
+) -> None:
+    await asyncio.to_thread(_cache_page, page_cache, url, headers, result)
+
+
+def _record_download(extractor: StreamingExtractor, started: float) -> None:
+    # parsing runs interleaved with the download, it is reported on its own
+    elapsed = perf_counter() - started
+    STAGE_SECONDS.labels("fetch").observe(elapsed - extractor.parse_seconds)
+    STAGE_SECONDS.labels("parse").observe(extractor.parse_seconds)
+    PAGE_BYTES.observe(extractor.bytes_read)
+
+
+def _connect_tracer() -> Any:
+    """httpx trace hook recording the time spent opening new connections: dns
+    resolution and tcp connection (`connect`) and tls handshake (`tls`)"""
+    started: dict[str, float] = {}
+
+    async def trace(event_name: str, info: Mapping[str, Any]) -> None:
+        step, _, phase = event_name.rpartition(".")
+        if step in CONNECTION_STAGES:
+            if phase == "started":
+                started[step] = perf_counter()
+            elif phase == "complete" and step in started:
+                elapsed = perf_counter() - started.pop(step)
+                STAGE_SECONDS.labels(CONNECTION_STAGES[step]).observe(elapsed)
+
+    return trace
+
+
+def _is_html(headers: Mapping[str, str]) -> bool:
+    return "html" in headers.get("Content-Type", "text/html")
 
-def reformat_extracted_text(text: str, title: Optional[str] = None) -> str:
-    result = ""
-    if title:
-        x = f"Title: {title}"
-        result = f"{x:=^100}\n"
 
-    wrapped_text = textwrap.fill(
-        text, width=80, break_long_words=False, replace_whitespace=False
+def stream_extract(
+    url: str,
+    headers: Mapping[str, str] | None = None,
+    config: ExtractorConfig | None = None,
+    page_cache: PageCache | None = None,
+) -> tuple[requests.Response, StreamingExtractor | None]:
+    """downloads a page in chunks and feeds them to a streaming extractor, the
+    download stops as soon as an extraction limit is reached
+
+    Args:
+        url: url of the page
+        headers: extra request headers
+        config: parser backend and size limits
+        page_cache: if given, the extracted page is cached
+
+    Returns:
+        the (closed) response and the extractor, `None` for a 304 response
+    """
+    started = perf_counter()
+    with requests.get(url, headers=headers, stream=True) as response:
+        if response.status_code == 304:
+            return response, None
+        response.raise_for_status()
+        extractor = StreamingExtractor(
+            config=config,
+            encoding=content_type_encoding(response.headers.get("Content-Type")),
+        )
+        for chunk in response.iter_content(chunk_size=extractor.config.chunk_size):
+            extractor.feed(chunk)
+            if extractor.done:
+                break
+    _record_download(extractor, started)
+    if page_cache is not None:
+        _cache_page(page_cache, url, response.headers, extractor.page)
+    return response, extractor
+
+
+async def astream_extract(
+    url: str,
+    client: httpx.AsyncClient | None = None,
+    headers: Mapping[str, str] | None = None,
+    config: ExtractorConfig | None = None,
+    page_cache: PageCache | None = None,
+    collect_links: bool = False,
+    html_only: bool = False,
+) -> tuple[httpx.Response, StreamingExtractor | None]:
+    """async version of `stream_extract`
+
+    Args:
+        url: url of the page
+        client: http client, defaults to the shared async client
+        headers: extra request headers
+        config: parser backend and size limits
+        page_cache: if given, the extracted page is cached
+        collect_links: whether the extractor collects links
+        html_only: whether to skip (without downloading) non html responses
+
+    Returns:
+        the (closed) response and the extractor, `None` for a 304 or a skipped
+        response
+    """
+    client = client or async_http_client()
+    started = perf_counter()
+    async with client.stream(
+        "GET", url, headers=headers, extensions={"trace": _connect_tracer()}
+    ) as response:
+        if response.status_code == 304:
+            return response, None
+        response.raise_for_status()
+        if html_only and not _is_html(response.headers):
+            return response, None
+        extractor = StreamingExtractor(
+            config=config,
+            encoding=content_type_encoding(response.headers.get("Content-Type")),
+            collect_links=collect_links,
+        )
+        async for chunk in response.aiter_bytes(extractor.config.chunk_size):
+            extractor.feed(chunk)
+            if extractor.done:
+                break
+    _record_download(extractor, started)
+    if page_cache is not None:
+        await _acache_page(page_cache, url, response.headers, extractor.page)
+    return response, extractor
+
+
+async def apool_extract(
+    url: str,
+    pool: "ExtractionPool",
+    client: httpx.AsyncClient | None = None,
+    headers: Mapping[str, str] | None = None,
+    config: ExtractorConfig | None = None,
+    page_cache: PageCache | None = None,
+) -> tuple[httpx.Response, ExtractedPage | None]:
+    """downloads a page (up to `config.max_bytes`) and extracts its blocks with an
+    extraction pool, so that parsing a large page doesn't block the event loop
+
+    Returns:
+        the (closed) response and the blocks of the page, `None` for a 304
+    """
+    config = config or ExtractorConfig()
+    client = client or async_http_client()
+    started = perf_counter()
+    async with client.stream(
+        "GET", url, headers=headers, extensions={"trace": _connect_tracer()}
+    ) as response:
+        if response.status_code == 304:
+            return response, None
+        response.raise_for_status()
+        body: list[bytes] = []
+        size = 0
+        async for chunk in response.aiter_bytes(config.chunk_size):
+            body.append(chunk[: config.max_bytes - size])
+            size += len(body[-1])
+            if size >= config.max_bytes:
+                break
+    STAGE_SECONDS.labels("fetch").observe(perf_counter() - started)
+    PAGE_BYTES.observe(size)
+    page, parse_seconds = await pool.aextract(
+        b"".join(body),
+        content_type_encoding(response.headers.get("Content-Type")),
+        config,
     )
-    return result + wrapped_text
+    STAGE_SECONDS.labels("parse").observe(parse_seconds)
+    PAGE_TEXT_CHARS.observe(len(page.buffer))
+    if page_cache is not None:
+        await _acache_page(page_cache, url, response.headers, lambda: page)
+    return response, page
+
+
+def _extracted_page(extractor: StreamingExtractor) -> ExtractedPage:
+    page = extractor.page()
+    PAGE_TEXT_CHARS.observe(len(page.buffer))
+    return page
+
+
+def _revalidated(
+    url: str, page_cache: PageCache | None, cached: CachedPage | None
+) -> ExtractedPage:
+    """page of a 304 response, from the page cache"""
+    if cached is None:
+        raise RuntimeError(f"Unexpected 304 response for {url}, nothing is cached")
+    page_cache.touch(url)  # type: ignore
+    return ExtractedPage.from_text(cached.text, cached.title)
+
+
+async def _arevalidated(
+    url: str, page_cache: PageCache | None, cached: CachedPage | None
+) -> ExtractedPage:
+    if cached is None:
+        raise RuntimeError(f"Unexpected 304 response for {url}, nothing is cached")
+    await page_cache.atouch(url)  # type: ignore
+    return ExtractedPage.from_text(cached.text, cached.title)
+
+
+def extract_page_from_url(
+    url: str,
+    page_cache: PageCache | None = None,
+    config: ExtractorConfig | None = None,
+) -> ExtractedPage:
+    """downloads a page and extracts its blocks, revalidating it when it is in the
+    page cache"""
+    cached = page_cache.get(url) if page_cache is not None else None
+    _, extractor = stream_extract(
+        url, headers=conditional_headers(cached), config=config, page_cache=page_cache
+    )
+    if extractor is None:
+        return _revalidated(url, page_cache, cached)
+    return _extracted_page(extractor)
+
+
+async def aextract_page_from_url(
+    url: str,
+    client: httpx.AsyncClient | None = None,
+    page_cache: PageCache | None = None,
+    config: ExtractorConfig | None = None,
+    pool: "ExtractionPool | None" = None,
+) -> ExtractedPage:
+    """async version of `extract_page_from_url`, the page is parsed by `pool` when
+    there is one"""
+    cached = await page_cache.aget(url) if page_cache is not None else None
+    if pool is not None:
+        _, page = await apool_extract(
+            url,
+            pool,
+            client=client,
+            headers=conditional_headers(cached),
+            config=config,
+            page_cache=page_cache,
+        )
+        if page is None:
+            return await _arevalidated(url, page_cache, cached)
+        return page
+    _, extractor = await astream_extract(
+        url,
+        client=client,
+        headers=conditional_headers(cached),
+        config=config,
+        page_cache=page_cache,
+    )
+    if extractor is None:
+        return await _arevalidated(url, page_cache, cached)
+    return _extracted_page(extractor)
+
+
+def extract_text_from_url(
+    url: str,
+    page_cache: PageCache | None = None,
+    config: ExtractorConfig | None = None,
+) -> tuple[str, str | None]:
+    page = extract_page_from_url(url, page_cache=page_cache, config=config)
+    return page.render(), page.title
+
+
+async def aextract_text_from_url(
+    url: str,
+    client: httpx.AsyncClient | None = None,
+    page_cache: PageCache | None = None,
+    config: ExtractorConfig | None = None,
+    pool: "ExtractionPool | None" = None,
+) -> tuple[str, str | None]:
+    page = await aextract_page_from_url(
+        url, client=client, page_cache=page_cache, config=config, pool=pool
+    )
+    return page.render(), page.title
+
+
+def reformat_extracted_text(text: str, title: Optional[str] = None) -> str:
+    """text of a page sent to the llm, the same as `ExtractedPage.render_prompt`"""
+    with span("reformat"):
+        return title_banner(title) + "\n".join(map(wrap_line, text.split("\n")))
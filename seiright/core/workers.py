@@ -0,0 +1,173 @@
+"""Process pool for the cpu bound stages of a check.
+
+Parsing the html of a page and formatting its text are pure python and hold the
+GIL: a few huge pages stall the event loop, and every other request with it.
+`ExtractionPool` runs them in worker processes instead. Small pages are still
+handled in the calling process, a round trip to a worker costs more than they do.
+
+The workers are spawned (not forked, the service runs threads) when the pool
+starts, and kept for the following tasks. Only the downloaded bytes are sent to a
+worker and only the extracted page (its text buffer and block arrays) comes
+back, never the parser state.
+"""
+
+import asyncio
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from time import perf_counter
+
+from ._types import ExtractorConfig
+from .blocks import ExtractedPage
+from .extractor import StreamingExtractor
+from .metrics import STAGE_SECONDS, counter
+
+logger = logging.getLogger(__name__)
+
+TASKS = counter(
+    "seiright_extraction_tasks_total",
+    "Extraction and formatting tasks, by stage and where they ran",
+    ("stage", "where"),
+)
+
+
+def extract_page(
+    body: bytes, encoding: str | None, config: ExtractorConfig
+) -> tuple[ExtractedPage, float]:
+    """blocks of a downloaded page, and the seconds spent parsing it"""
+    extractor = StreamingExtractor(config=config, encoding=encoding)
+    for start in range(0, len(body), config.chunk_size):
+        extractor.feed(body[start : start + config.chunk_size])
+        if extractor.done:
+            break
+    return extractor.page(), extractor.parse_seconds
+
+
+def render_page(page: ExtractedPage) -> tuple[str, float]:
+    """text of a page sent to the llm, and the seconds spent rendering it"""
+    started = perf_counter()
+    return page.render_prompt(), perf_counter() - started
+
+
+def _warm_up(_: object = None) -> int:
+    # unpickling the task imports this module and the modules of the tasks with
+    # it, so the first real task doesn't pay for it
+    return os.getpid()
+
+
+class ExtractionPool:
+    """Runs the parsing and the formatting of large pages in worker processes
+
+    Args:
+        workers: number of worker processes, defaults to the number of cpus
+        min_bytes: pages smaller than this are parsed in the calling process
+        min_chars: pages with less text than this are rendered in the calling process
+        timeout: seconds a task may wait and run in the pool, `TimeoutError`
+            beyond it. The workers are then replaced, a worker can't be stopped in
+            the middle of a task otherwise. Parsing itself is bounded by
+            `ExtractorConfig.max_parse_seconds`
+        max_tasks_per_child: tasks after which a worker is replaced, to give its
+            memory back (`None` to keep the workers)
+
+    Usage:
+        pool = ExtractionPool(workers=4)
+        pool.start()
+        page, parse_seconds = await pool.aextract(body, encoding, config)
+        text = await pool.arender(page)
+        pool.close()
+    """
+
+    def __init__(
+        self,
+        workers: int | None = None,
+        min_bytes: int = 256 * 1024,
+        min_chars: int = 64 * 1024,
+        timeout: float = 30,
+        max_tasks_per_child: int | None = 1000,
+    ):
+        self.workers = workers or os.cpu_count() or 1
+        self.min_bytes = min_bytes
+        self.min_chars = min_chars
+        self.timeout = timeout
+        self.max_tasks_per_child = max_tasks_per_child
+        self._executor: ProcessPoolExecutor | None = None
+        self._start_lock = threading.Lock()
+
+    def start(self) -> None:
+        """spawns the workers and waits until they are ready"""
+        with self._start_lock:
+            if self._executor is not None:
+                return
+            executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                max_tasks_per_child=self.max_tasks_per_child,
+            )
+            started = perf_counter()
+            pids = set(executor.map(_warm_up, [None] * self.workers))  # type: ignore
+            self._executor = executor
+        logger.info(
+            f"{len(pids)} extraction workers ready in {perf_counter() - started:.2f}s"
+        )
+
+    async def _run(self, fn, *args, retry: bool = True):
+        if self._executor is None:
+            # spawning the workers blocks, the pool is usually started at startup
+            await asyncio.to_thread(self.start)
+        executor = self._executor
+        loop = asyncio.get_running_loop()
+        try:
+            return await asyncio.wait_for(
+                loop.run_in_executor(executor, fn, *args), self.timeout
+            )
+        except TimeoutError:
+            logger.warning(f"extraction task timed out after {self.timeout}s")
+            self._recycle(executor)
+            raise
+        except BrokenProcessPool:
+            # the pool was recycled because of another task
+            self._recycle(executor)
+            if not retry:
+                raise
+            return await self._run(fn, *args, retry=False)
+
+    def _recycle(self, executor: ProcessPoolExecutor | None) -> None:
+        """kills the workers of `executor`, the next task starts new ones"""
+        with self._start_lock:
+            if executor is None or self._executor is not executor:
+                return
+            self._executor = None
+        # the executor has no api to stop a running task
+        processes = list((getattr(executor, "_processes", None) or {}).values())
+        executor.shutdown(wait=False, cancel_futures=True)
+        for process in processes:
+            process.terminate()
+
+    async def aextract(
+        self, body: bytes, encoding: str | None, config: ExtractorConfig
+    ) -> tuple[ExtractedPage, float]:
+        """`extract_page`, in a worker for pages of at least `min_bytes`"""
+        if len(body) < self.min_bytes:
+            TASKS.labels("parse", "inline").inc()
+            return extract_page(body, encoding, config)
+        TASKS.labels("parse", "pool").inc()
+        return await self._run(extract_page, body, encoding, config)
+
+    async def arender(self, page: ExtractedPage) -> str:
+        """`render_page`, in a worker for pages of at least `min_chars` characters"""
+        if len(page.buffer) < self.min_chars:
+            TASKS.labels("reformat", "inline").inc()
+            return render_page(page)[0]
+        TASKS.labels("reformat", "pool").inc()
+        text, seconds = await self._run(render_page, page)
+        # the span of the worker is recorded in the metrics of the worker
+        STAGE_SECONDS.labels("reformat").observe(seconds)
+        return text
+
+    def close(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
@@ -1,11 +1,11 @@
-import hashlib
+import asyncio
+import inspect
 import logging
 import os
+import threading
 from functools import wraps
 from time import time
-from typing import Any, Optional
-
-import boto3
+from typing import Any, Optional, Protocol
 
 logger = logging.getLogger(__name__)
 
@@ -28,6 +28,18 @@ def get_env_var(
 
 def timer(f):
 
+    if inspect.iscoroutinefunction(f):
+
+        @wraps(f)
+        async def _awrap(*args, **kwargs):
+            t0 = time()
+            result = await f(*args, **kwargs)
+            t1 = time()
+            logger.info(f"Function {f.__name__!r} executed in {(t1-t0):.4f}s")
+            return result
+
+        return _awrap
+
     @wraps(f)
     def _wrap(*args, **kwargs):
         t0 = time()
@@ -39,26 +51,155 @@ def timer(f):
     return _wrap
 
 
-def cache(func):
-    @wraps(func)
-    def _wrap(*args, **kwargs):
-        args_hash = hashlib.sha1(
-            str(args).encode("utf-8") + str(kwargs).encode("utf-8")
-        ).hexdigest()
-        cache_key = f"CACHE_{func.__name__}_{args_hash}"
-        value = os.getenv(cache_key)
-        if value:
-            return value
-        value = func(*args, **kwargs)
-        os.environ[cache_key] = value
+class SecretsBackend(Protocol):
+    def fetch(self, name: str) -> str: ...
+
+
+class AWSSecretsBackend:
+    """AWS Secrets Manager, boto3 is imported on the first fetch"""
+
+    def __init__(self, region_name: str | None = None):
+        self.region_name = region_name or os.getenv("AWS_REGION", "ap-south-1")
+        self._client: Any = None
+
+    def fetch(self, name: str) -> str:
+        if self._client is None:
+            import boto3
+
+            self._client = boto3.client("secretsmanager", region_name=self.region_name)
+        return self._client.get_secret_value(SecretId=name)["SecretString"]
+
+
+class SecretCache:
+    """In process cache of secrets with TTL. `run` loads the secrets of the
+    service in the background at startup and refreshes them before they expire, a
+    secret missing from the cache is fetched on first use.
+
+    An expired secret is fetched again by `get` at most once every
+    `refetch_interval` seconds, and never while another fetch is running: the
+    stale value is returned meanwhile, so that a degraded backend doesn't block
+    every caller for its whole timeout. `aget` is the same for the event loop:
+    its fetches run in a thread, a missing secret is awaited (one fetch shared
+    by every caller) and an expired one is refreshed in the background.
+
+    Args:
+        backend: where the secrets are fetched from
+        ttl: seconds a secret is used before it is fetched again
+        refetch_interval: minimum seconds between two fetches of an expired
+            secret by `get`
+
+    Usage:
+        secret_cache = SecretCache(AWSSecretsBackend())
+        task = asyncio.create_task(secret_cache.run(["openai-api-key"]))
+        ...
+        api_key = secret_cache.get("openai-api-key")
+        api_key = await secret_cache.aget("openai-api-key")  # on the event loop
+    """
+
+    def __init__(
+        self,
+        backend: SecretsBackend | None = None,
+        ttl: float = 3600,
+        refetch_interval: float = 60,
+    ):
+        self.backend: SecretsBackend = backend or AWSSecretsBackend()
+        self.ttl = ttl
+        self.refetch_interval = refetch_interval
+        self.loaded = False
+        self.error: Exception | None = None
+        self._secrets: dict[str, tuple[float, str]] = {}
+        self._refetched: dict[str, float] = {}
+        self._refreshes: dict[str, asyncio.Task] = {}
+        self._lock = threading.Lock()
+
+    def get(self, name: str) -> str:
+        entry = self._secrets.get(name)
+        if entry is None:
+            return self.fetch(name)
+        now = time()
+        if now - entry[0] < self.ttl:
+            return entry[1]
+        refetched = self._refetched.get(name)
+        if refetched is not None and now - refetched < self.refetch_interval:
+            return entry[1]
+        if not self._lock.acquire(blocking=False):
+            # being fetched by another caller
+            return entry[1]
+        self._refetched[name] = now
+        try:
+            return self._fetch(name)
+        except Exception as e:
+            # a stale secret beats no secret while the backend is unavailable
+            logger.warning(f"unable to refresh the secret {name!r}: {e!r}")
+            return entry[1]
+        finally:
+            self._lock.release()
+
+    async def aget(self, name: str) -> str:
+        entry = self._secrets.get(name)
+        if entry is None:
+            # shielded, a cancelled caller doesn't cancel the fetch of the others
+            return await asyncio.shield(self._refresh(name))
+        now = time()
+        if now - entry[0] < self.ttl:
+            return entry[1]
+        refetched = self._refetched.get(name)
+        if refetched is None or now - refetched >= self.refetch_interval:
+            self._refetched[name] = now
+            self._refresh(name).add_done_callback(
+                lambda task: self._log_refresh(name, task)
+            )
+        return entry[1]
+
+    def _refresh(self, name: str) -> "asyncio.Task[str]":
+        """fetch of `name` in a thread, shared with the callers already waiting"""
+        loop = asyncio.get_running_loop()
+        task = self._refreshes.get(name)
+        if task is None or task.done() or task.get_loop() is not loop:
+            task = loop.create_task(asyncio.to_thread(self.fetch, name))
+            self._refreshes[name] = task
+        return task
+
+    @staticmethod
+    def _log_refresh(name: str, task: asyncio.Task) -> None:
+        if not task.cancelled() and task.exception() is not None:
+            # a stale secret beats no secret while the backend is unavailable
+            logger.warning(
+                f"unable to refresh the secret {name!r}: {task.exception()!r}"
+            )
+
+    def fetch(self, name: str) -> str:
+        with self._lock:
+            return self._fetch(name)
+
+    def _fetch(self, name: str) -> str:
+        value = self.backend.fetch(name)
+        self._secrets[name] = (time(), value)
         return value
 
-    return _wrap
+    async def run(self, names: list[str], retry_interval: float = 5) -> None:
+        """loads `names`, retrying until they are all fetched, then refreshes them
+        every half ttl"""
+        while True:
+            try:
+                for name in names:
+                    await asyncio.to_thread(self.fetch, name)
+                self.loaded, self.error = True, None
+                await asyncio.sleep(self.ttl / 2)
+            except Exception as e:
+                logger.warning(f"unable to load the secrets {names}: {e!r}")
+                self.error = e
+                await asyncio.sleep(retry_interval)
+
+
+secret_cache = SecretCache()
+
+
+def secret(secret_string: str) -> str:
+    """value of a secret, from the process wide `secret_cache`"""
+    return secret_cache.get(secret_string)
 
 
-@cache
-def secret(secret_string: str, region_name: str = "ap-south-1") -> str:
-    client = boto3.client("secretsmanager", region_name=region_name)
-    response = client.get_secret_value(SecretId=secret_string)
-    secret = response["SecretString"]
-    return secret
+async def asecret(secret_string: str) -> str:
+    """`secret`, for the event loop"""
+    return await secret_cache.aget(secret_string)
@@ -0,0 +1,188 @@
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from seiright.core._types import LLMProvider, LLMResponse
+from seiright.core.assemble import ComplianceChecker
+
+
+@pytest.fixture
+def checker(mocker):
+    mocker.patch.dict(os.environ, {"OPENAI_API_KEY": "some-key"})
+    return ComplianceChecker(llm_provider=LLMProvider.OPENAI, model="gpt-4o")
+
+
+def llm_response(text: str) -> LLMResponse:
+    return LLMResponse(
+        model="gpt-4o",
+        llm_provider=LLMProvider.OPENAI,
+        is_compliant=True,
+        reasoning=text,
+        input_msg=text,
+        confidence_score=0.9,
+    )
+
+
+class TestChatMany:
+    def test_failure_does_not_abort_batch(self, checker, mocker):
+        async def awebpage(url):
+            if url.rstrip("/") == "https://bad.test":
+                raise RuntimeError("boom")
+            await asyncio.sleep(0.01 if url.rstrip("/") == "https://slow.test" else 0)
+            return url
+
+        async def acheck_text(text):
+            return llm_response(text)
+
+        mocker.patch.object(checker, "awebpage", side_effect=awebpage)
+        mocker.patch.object(checker, "acheck_text", side_effect=acheck_text)
+
+        async def run():
+            urls = ["https://slow.test", "https://bad.test", "https://fast.test"]
+            return [r async for r in checker.achat_many(urls)]
+
+        results = asyncio.run(run())
+        assert [url for url, _ in results][-1] == "https://slow.test"
+        errors = {url: r for url, r in results if isinstance(r, Exception)}
+        assert list(errors) == ["https://bad.test"]
+
+    def test_limits_llm_concurrency(self, checker, mocker):
+        # every page is checked in 3 chunks
+        checker.max_chunk_tokens = 300
+        page = "".join(f"# Section {i}\n" + "word " * 200 + "\n" for i in range(3))
+        in_flight = 0
+        peak = 0
+
+        async def awebpage(url):
+            return page + url
+
+        async def achat(user_prompt):
+            nonlocal in_flight, peak
+            in_flight += 1
+            peak = max(peak, in_flight)
+            await asyncio.sleep(0.01)
+            in_flight -= 1
+            return llm_response(user_prompt)
+
+        mocker.patch.object(checker, "awebpage", side_effect=awebpage)
+        mocker.patch.object(checker.llm, "achat", side_effect=achat)
+
+        async def run():
+            urls = [f"https://{i}.test" for i in range(10)]
+            return [r async for r in checker.achat_many(urls, max_llm_calls=3)]
+
+        assert len(asyncio.run(run())) == 10
+        assert checker.llm.achat.call_count > 10
+        assert peak == 3
+
+    def test_tracking_variants_checked_once(self, checker, mocker):
+        async def awebpage(url):
+            await asyncio.sleep(0.01)
+            return url
+
+        async def acheck_text(text):
+            return llm_response(text)
+
+        mocker.patch.object(checker, "awebpage", side_effect=awebpage)
+        mocker.patch.object(checker, "acheck_text", side_effect=acheck_text)
+
+        async def run():
+            urls = ["https://a.test/?utm_source=x", "https://a.test/?gclid=y"]
+            return [r async for r in checker.achat_many(urls)]
+
+        results = asyncio.run(run())
+        assert sorted(url for url, _ in results) == [
+            "https://a.test/?gclid=y",
+            "https://a.test/?utm_source=x",
+        ]
+        assert checker.awebpage.call_count == 1
+        assert checker.acheck_text.call_count == 1
+
+
+class TestChunkedCheck:
+    def test_long_text_is_checked_per_chunk(self, checker, mocker):
+        checker.max_chunk_tokens = 300
+        checker.max_chunk_calls = 2
+        in_flight = 0
+        peak = 0
+
+        async def achat(user_prompt):
+            nonlocal in_flight, peak
+            in_flight += 1
+            peak = max(peak, in_flight)
+            await asyncio.sleep(0.01)
+            in_flight -= 1
+            return llm_response(user_prompt)
+
+        mocker.patch.object(checker.llm, "achat", side_effect=achat)
+        text = "".join(f"# Section {i}\n" + "word " * 200 + "\n" for i in range(6))
+        result = asyncio.run(checker.acheck_text(text))
+        assert checker.llm.achat.call_count == 6
+        assert peak == 2
+        assert result.is_compliant is True
+
+
+class TestSingleFlight:
+    def test_concurrent_checks_of_a_page_are_coalesced(self, checker, mocker):
+        async def awebpage(url):
+            await asyncio.sleep(0.01)
+            return url
+
+        async def acheck_text(text):
+            return llm_response(text)
+
+        mocker.patch.object(checker, "awebpage", side_effect=awebpage)
+        mocker.patch.object(checker, "acheck_text", side_effect=acheck_text)
+
+        async def run():
+            urls = [
+                "https://Mercury.com",
+                "https://mercury.com/#pricing",
+                "https://a.test",
+            ]
+            return await asyncio.gather(*(checker.achat(url) for url in urls))
+
+        first, second, other = asyncio.run(run())
+        assert first is second
+        assert other.input_msg == "https://a.test/"
+        assert checker.awebpage.call_count == 2
+        assert checker.inflight.coalesced == 1 and checker.inflight.in_flight == 0
+
+    def test_failure_is_shared(self, checker, mocker):
+        mocker.patch.object(checker, "awebpage", side_effect=RuntimeError("boom"))
+
+        async def run():
+            return await asyncio.gather(
+                checker.achat("https://a.test"),
+                checker.achat("https://a.test"),
+                return_exceptions=True,
+            )
+
+        results = asyncio.run(run())
+        assert [type(r) for r in results] == [RuntimeError, RuntimeError]
+        assert checker.awebpage.call_count == 1
+
+    def test_sync_checks_are_coalesced(self, checker, mocker):
+        started = threading.Event()
+        release = threading.Event()
+
+        def webpage(url):
+            started.set()
+            release.wait(timeout=5)
+            return url
+
+        mocker.patch.object(checker, "webpage", side_effect=webpage)
+        mocker.patch.object(checker, "check_text", side_effect=llm_response)
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            first = executor.submit(checker.chat, "https://a.test")
+            started.wait(timeout=5)
+            second = executor.submit(checker.chat, "https://a.test/")
+            while checker.inflight.coalesced == 0:
+                time.sleep(0.001)
+            release.set()
+            assert first.result() is second.result()
+        assert checker.webpage.call_count == 1
@@ -0,0 +1,67 @@
+import pickle
+
+from seiright.core._types import ExtractorConfig
+from seiright.core.blocks import ExtractedPage, content_hash
+from seiright.core.extractor import extract_html
+from seiright.core.web_crawler import reformat_extracted_text
+
+LONG = " ".join(["Harbor savings accounts earn 4% APY with no monthly fees."] * 4)
+HTML = (
+    "<title>Harbor</title><h1>Savings</h1><p>{}</p><ul><li>No fees</li></ul>"
+    "<h3>Rates</h3><p>Rates may change.</p>"
+).format(LONG)
+
+
+class TestExtractedPage:
+    def test_blocks(self):
+        page = extract_html(HTML).page()
+        assert page.title == "Harbor"
+        assert [(b.tag, b.level) for b in page] == [
+            ("h1", 1),
+            ("p", 0),
+            ("li", 0),
+            ("h3", 3),
+            ("p", 0),
+        ]
+        block = page[2]
+        assert page.buffer[block.start : block.end] == page.block_text(2) == "No fees"
+        assert block.hash == content_hash("No fees")
+        assert page.line(3) == "### Rates"
+
+    def test_render(self):
+        page = extract_html(HTML).page()
+        assert (
+            page.render()
+            == f"\n# Savings\n\n{LONG}\nNo fees\n\n### Rates\n\nRates may change."
+        )
+        prompt = page.render_prompt()
+        assert prompt == reformat_extracted_text(page.render(), page.title)
+        assert prompt.startswith("=" * 43 + "Title: Harbor")
+        assert max(len(line) for line in prompt.splitlines()[1:]) <= 80
+
+    def test_from_text_round_trip(self):
+        page = extract_html(HTML).page()
+        parsed = ExtractedPage.from_text(page.render(), page.title)
+        assert parsed.render() == page.render()
+        assert list(parsed.hashes) == list(page.hashes)
+
+    def test_select_and_head(self):
+        page = extract_html(HTML).page()
+        selected = page.select([0, 2])
+        assert selected.buffer is page.buffer
+        assert selected.render() == "\n# Savings\n\nNo fees"
+        assert len(page.head(10)) == 2
+        assert page.head(10**6) is page
+
+    def test_positions(self):
+        html = "<p>a</p>" + " " * 100 + "<p>b</p>"
+        page = extract_html(html).page()
+        assert [b.position for b in page] == [0, 0]
+        page = extract_html(html, config=ExtractorConfig(chunk_size=50)).page()
+        assert [b.position for b in page] == [0, 100]
+
+    def test_pickle(self):
+        page = extract_html(HTML).page()
+        unpickled = pickle.loads(pickle.dumps(page))
+        assert unpickled.render_prompt() == page.render_prompt()
+        assert list(unpickled) == list(page)
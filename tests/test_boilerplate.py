@@ -0,0 +1,110 @@
+from seiright.core.blocks import ExtractedPage
+from seiright.core.boilerplate import BoilerplateFilter, normalize_block, simhash
+
+NAV = "Home\nPricing\nAbout us\nLog in"
+FOOTER = "Copyright {year} Harbor Technologies, Inc. All rights reserved."
+TOPICS = ["savings", "checking", "cards", "pricing", "treasury"]
+
+
+def page(i: int) -> str:
+    return (
+        f"{NAV}\n\n# {TOPICS[i].title()}\n\n"
+        f"All about our {TOPICS[i]} products, their rates and their fees\n"
+        f"{FOOTER.format(year=2020 + i)}"
+    )
+
+
+def test_simhash_near_duplicates():
+    a = simhash(
+        normalize_block("We use cookies to improve your experience on our site")
+    )
+    b = simhash(
+        normalize_block("We use cookies to improve your experience on this site")
+    )
+    c = simhash(normalize_block("Open a business checking account in minutes"))
+    assert (a ^ b).bit_count() < (a ^ c).bit_count()
+    assert normalize_block("Copyright  2024") == normalize_block("copyright 2025")
+    assert normalize_block("4.5% APY") != normalize_block("3.5% APY")
+
+
+class TestBoilerplateFilter:
+    def test_repeated_blocks_are_dropped(self):
+        boilerplate = BoilerplateFilter(min_pages=3)
+        for i in range(2):
+            assert boilerplate.strip(f"https://harbor.com/{i}", page(i)) == page(i)
+        stripped = boilerplate.strip("https://www.harbor.com/2", page(2))
+        assert "Log in" not in stripped
+        assert "Copyright" not in stripped
+        assert "# Cards" in stripped
+        assert "All about our cards products" in stripped
+
+        [stats] = boilerplate.stats()
+        assert (stats.domain, stats.pages) == ("harbor.com", 3)
+        assert stats.boilerplate_blocks == 5
+        assert 0 < stats.tokens_saved < stats.tokens_seen
+
+    def test_pages_are_counted_once(self):
+        boilerplate = BoilerplateFilter(min_pages=2)
+        for _ in range(3):
+            boilerplate.strip("https://harbor.com/", page(0))
+        assert boilerplate.stats()[0].pages == 1
+        assert boilerplate.strip("https://harbor.com/", page(0)) == page(0)
+
+    def test_state_is_persisted(self, tmp_path):
+        db_path = tmp_path / "boilerplate.db"
+        boilerplate = BoilerplateFilter(db_path=db_path, min_pages=3)
+        for i in range(3):
+            boilerplate.strip(f"https://harbor.com/{i}", page(i))
+        saved = boilerplate.stats()[0].tokens_saved
+        boilerplate.close()
+
+        reopened = BoilerplateFilter(db_path=db_path, min_pages=3)
+        assert "Log in" not in reopened.strip("https://harbor.com/3", page(3))
+        assert reopened.stats()[0].tokens_saved > saved
+
+    def test_strip_page(self):
+        boilerplate = BoilerplateFilter(min_pages=3)
+        by_text = BoilerplateFilter(min_pages=3)
+        for i in range(3):
+            blocks = ExtractedPage.from_text(page(i))
+            stripped = boilerplate.strip_page(f"https://harbor.com/{i}", blocks)
+            text = by_text.strip(f"https://harbor.com/{i}", page(i))
+        assert stripped.buffer is blocks.buffer
+        assert stripped.render().strip("\n") == text
+        [stats], [text_stats] = boilerplate.stats(), by_text.stats()
+        assert stats.boilerplate_blocks == text_stats.boilerplate_blocks
+        assert stats.tokens_saved == text_stats.tokens_saved
+
+    def test_disclosures_are_kept(self):
+        boilerplate = BoilerplateFilter(min_pages=3)
+        disclosure = "Banking services provided by Choice Bank, Member FDIC."
+        for i in range(4):
+            stripped = boilerplate.strip(
+                f"https://harbor.com/{i}", f"{page(i)}\n{disclosure}"
+            )
+        assert "Log in" not in stripped
+        assert disclosure in stripped
+
+    def test_numbers_must_match_exactly(self):
+        boilerplate = BoilerplateFilter(min_pages=3)
+        for i in range(3):
+            boilerplate.strip(f"https://harbor.com/{i}", f"{page(i)}\nEarn 4.50% back")
+        stripped = boilerplate.strip(
+            "https://harbor.com/3", f"{page(3)}\nEarn 3.25% back"
+        )
+        assert "Earn 3.25% back" in stripped
+        stripped = boilerplate.strip(
+            "https://harbor.com/4", f"{page(4)}\nEarn 4.50% back"
+        )
+        assert "Earn 4.50% back" not in stripped
+
+    def test_pages_are_capped(self):
+        boilerplate = BoilerplateFilter(min_pages=2, max_pages=2)
+        for i in range(2):
+            boilerplate.strip(f"https://harbor.com/{i}", page(i))
+        blocks = boilerplate.stats()[0].blocks
+        for i in range(2, 5):
+            boilerplate.strip(f"https://harbor.com/{i}", page(i))
+        [stats] = boilerplate.stats()
+        assert (stats.pages, stats.blocks) == (2, blocks)
+        assert "Log in" not in boilerplate.strip("https://harbor.com/5", page(0))
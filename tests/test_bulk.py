@@ -0,0 +1,122 @@
+import asyncio
+import json
+import os
+
+import pytest
+
+from seiright.core._types import LLMProvider, LLMResponse, PageVerdict
+from seiright.core.assemble import ComplianceChecker
+from seiright.core.bulk import JsonlWriter, open_writer, read_urls, run_bulk
+
+URLS = [f"https://{i}.test" for i in range(20)]
+
+
+@pytest.fixture
+def checker(mocker):
+    mocker.patch.dict(os.environ, {"OPENAI_API_KEY": "some-key"})
+    checker = ComplianceChecker(llm_provider=LLMProvider.OPENAI, model="gpt-4o")
+
+    async def awebpage(url):
+        if url.rstrip("/") == "https://bad.test":
+            raise RuntimeError("boom")
+        return url
+
+    async def acheck_text(text):
+        return LLMResponse(
+            model="gpt-4o",
+            llm_provider=LLMProvider.OPENAI,
+            is_compliant=True,
+            reasoning="ok",
+            input_msg=text,
+            confidence_score=0.9,
+        )
+
+    mocker.patch.object(checker, "awebpage", side_effect=awebpage)
+    mocker.patch.object(checker, "acheck_text", side_effect=acheck_text)
+    return checker
+
+
+def lines(path):
+    return [json.loads(line) for line in path.read_text().splitlines()]
+
+
+class TestReadUrls:
+    def test_text(self, tmp_path):
+        path = tmp_path / "urls.txt"
+        path.write_text(
+            "https://a.test\n# comment\n\n https://b.test \nhttps://a.test\n"
+        )
+        assert read_urls(path) == ["https://a.test", "https://b.test"]
+
+    def test_csv(self, tmp_path):
+        path = tmp_path / "urls.csv"
+        path.write_text("name,url\nA,https://a.test\nB,https://b.test\n")
+        assert read_urls(path) == ["https://a.test", "https://b.test"]
+        assert read_urls(path, column="name") == ["A", "B"]
+        path.write_text("https://a.test,x\nhttps://b.test,y\n")
+        assert read_urls(path) == ["https://a.test", "https://b.test"]
+        with pytest.raises(ValueError):
+            read_urls(path, column="site")
+
+
+class TestRunBulk:
+    def test_results_and_failures(self, checker, tmp_path):
+        output = tmp_path / "verdicts.jsonl"
+        writer = open_writer(output)
+        summary = asyncio.run(
+            run_bulk(checker, URLS[:3] + ["https://bad.test"], writer)
+        )
+        writer.close()
+        assert (summary.urls, summary.checked, summary.failed) == (4, 3, 1)
+        rows = {row["url"]: row for row in lines(output)}
+        assert rows["https://0.test"]["is_compliant"] is True
+        assert rows["https://bad.test"]["error"] == "RuntimeError: boom"
+
+    def test_resume(self, checker, tmp_path):
+        output = tmp_path / "verdicts.jsonl"
+        writer = JsonlWriter(output)
+        for url in URLS[:5]:
+            writer.write(PageVerdict(url=url, is_compliant=True))
+        writer.write(PageVerdict(url="https://bad.test", error="RuntimeError: boom"))
+        writer.close()
+        # a line cut short by a kill
+        with open(output, "a") as f:
+            f.write('{"url": "https://5.te')
+
+        writer = JsonlWriter(output)
+        summary = asyncio.run(run_bulk(checker, URLS + ["https://bad.test"], writer))
+        writer.close()
+        assert (summary.skipped, summary.checked) == (6, 15)
+        assert checker.awebpage.call_count == 15
+        assert sorted(row["url"] for row in lines(output)) == sorted(
+            URLS + ["https://bad.test"]
+        )
+
+        writer = JsonlWriter(output)
+        summary = asyncio.run(
+            run_bulk(checker, ["https://bad.test"], writer, retry_failed=True)
+        )
+        writer.close()
+        assert summary.failed == 1
+        assert [row["url"] for row in lines(output)].count("https://bad.test") == 2
+
+    def test_parquet(self, checker, tmp_path):
+        pandas = pytest.importorskip("pandas")
+        pytest.importorskip("pyarrow")
+        output = tmp_path / "verdicts.parquet"
+        writer = open_writer(output, batch_size=4)
+        asyncio.run(run_bulk(checker, URLS[:10] + ["https://bad.test"], writer))
+        writer.close()
+        assert len(list(output.glob("part-*.parquet"))) == 3
+
+        writer = open_writer(output, batch_size=4)
+        summary = asyncio.run(run_bulk(checker, URLS, writer))
+        writer.close()
+        assert (summary.skipped, summary.checked) == (10, 10)
+        frame = pandas.read_parquet(output)
+        assert sorted(frame["url"]) == sorted(URLS + ["https://bad.test"])
+        assert frame["error"].notna().sum() == 1
+
+        urls = tmp_path / "urls.parquet"
+        pandas.DataFrame({"site": URLS[:2]}).to_parquet(urls)
+        assert read_urls(urls) == URLS[:2]
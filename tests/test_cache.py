@@ -0,0 +1,76 @@
+import asyncio
+
+import pytest
+
+from seiright.core._types import LLMProvider, LLMResponse
+from seiright.core.cache import VerdictCache, verdict_key
+
+
+@pytest.fixture
+def response():
+    return LLMResponse(
+        model="gpt-4o",
+        llm_provider=LLMProvider.OPENAI,
+        is_compliant=True,
+        reasoning="ok",
+        input_msg="text",
+        confidence_score=0.9,
+    )
+
+
+class TestVerdictKey:
+    def test_key_depends_on_inputs(self):
+        key = verdict_key("text", LLMProvider.OPENAI, "gpt-4o", prompts_version="v1")
+        assert key == verdict_key("text", LLMProvider.OPENAI, "gpt-4o", "v1")
+        assert key != verdict_key("other", LLMProvider.OPENAI, "gpt-4o", "v1")
+        assert key != verdict_key("text", LLMProvider.ANTHROPIC, "gpt-4o", "v1")
+        assert key != verdict_key("text", LLMProvider.OPENAI, "gpt-4o", "v2")
+
+
+class TestVerdictCache:
+    def test_hit_and_miss(self, response):
+        cache = VerdictCache()
+        assert cache.get("k") is None
+        cache.set("k", response)
+        assert cache.get("k") == response
+        stats = cache.stats()
+        assert (stats.hits, stats.misses, stats.size) == (1, 1, 1)
+
+    def test_lru_eviction(self, response):
+        cache = VerdictCache(maxsize=2)
+        cache.set("a", response)
+        cache.set("b", response)
+        cache.get("a")
+        cache.set("c", response)
+        assert cache.get("b") is None
+        assert cache.get("a") is not None
+
+    def test_ttl(self, response, mocker):
+        cache = VerdictCache(ttl=10)
+        mocker.patch("seiright.core.cache.time", return_value=100.0)
+        cache.set("k", response)
+        mocker.patch("seiright.core.cache.time", return_value=111.0)
+        assert cache.get("k") is None
+
+    def test_survives_restart(self, response, tmp_path):
+        db_path = tmp_path / "verdicts.sqlite"
+        cache = VerdictCache(db_path=db_path)
+        cache.set("k", response)
+        cache.close()
+
+        cache = VerdictCache(db_path=db_path)
+        assert cache.get("k") == response
+        assert cache.stats().disk_hits == 1
+
+    def test_async_sqlite_tier_in_a_thread(self, response, tmp_path, mocker):
+        cache = VerdictCache(db_path=tmp_path / "verdicts.sqlite")
+        to_thread = mocker.spy(asyncio, "to_thread")
+
+        async def run():
+            await cache.aset("k", response)
+            cache._memory.clear()
+            return await cache.aget("k")
+
+        assert asyncio.run(run()) == response
+        assert to_thread.call_count == 2
+        assert cache.stats().disk_hits == 1
@@ -0,0 +1,74 @@
+import pytest
+
+from seiright.core._types import LLMProvider, LLMResponse
+from seiright.core.chunking import (
+    chunk_text,
+    count_tokens,
+    reduce_verdicts,
+    split_sections,
+)
+from seiright.core.web_crawler import reformat_extracted_text
+
+TEXT = "intro\n\n# Savings\n\nEarn 5% APY.\n\n## Fees\n\nNo fees\n"
+
+
+def verdict(is_compliant: bool, confidence_score: float, reasoning: str = ""):
+    return LLMResponse(
+        model="gpt-4o",
+        llm_provider=LLMProvider.OPENAI,
+        is_compliant=is_compliant,
+        reasoning=reasoning,
+        input_msg=reasoning,
+        confidence_score=confidence_score,
+    )
+
+
+class TestChunkText:
+    def test_split_sections(self):
+        assert split_sections(TEXT) == [
+            "intro\n\n",
+            "# Savings\n\nEarn 5% APY.\n\n",
+            "## Fees\n\nNo fees\n",
+        ]
+
+    def test_short_text_is_one_chunk(self):
+        assert chunk_text(TEXT, max_tokens=1000) == [TEXT]
+
+    def test_chunks_respect_budget_and_keep_text(self):
+        sections = [f"# Section {i}\n\n" + "word " * 200 + "\n" for i in range(10)]
+        text = reformat_extracted_text("".join(sections), title="Bank")
+        chunks = chunk_text(text, max_tokens=600)
+        assert len(chunks) > 1
+        assert all(count_tokens(chunk) <= 600 for chunk in chunks)
+        assert all(chunk.startswith("=") for chunk in chunks)
+        assert all("# Section" in chunk.split("\n", 1)[1][:20] for chunk in chunks)
+
+    def test_oversized_section_is_split(self):
+        chunks = chunk_text("# Huge\n" + "word " * 2000, max_tokens=300)
+        assert len(chunks) > 1
+        assert all(count_tokens(chunk) <= 300 for chunk in chunks)
+
+
+class TestReduceVerdicts:
+    def test_any_non_compliant(self):
+        result = reduce_verdicts(
+            [verdict(True, 0.9, "a"), verdict(False, 0.6, "b"), verdict(False, 0.8)]
+        )
+        assert result.is_compliant is False
+        assert result.confidence_score == 0.8
+        assert "[part 2/3] b" in result.reasoning
+        assert "[part 1/3]" not in result.reasoning
+
+    def test_all_compliant_takes_weakest_confidence(self):
+        result = reduce_verdicts([verdict(True, 0.9), verdict(True, 0.7)])
+        assert result.is_compliant is True
+        assert result.confidence_score == 0.7
+
+    def test_confidence_weighted(self):
+        result = reduce_verdicts(
+            [verdict(True, 0.9), verdict(False, 0.5)],
+            weights=[3, 1],
+            rule="confidence_weighted",
+        )
+        assert result.is_compliant is True
+        assert result.confidence_score == pytest.approx((2.7 - 0.5) / 3.2)
@@ -0,0 +1,81 @@
+import asyncio
+import os
+
+import pytest
+
+from seiright.core._types import LLMProvider, LLMResponse
+from seiright.core.ensemble import EnsembleChecker, parse_members
+
+
+def llm_response(model: str, is_compliant: bool) -> LLMResponse:
+    return LLMResponse(
+        model=model,
+        llm_provider=LLMProvider.OPENAI,
+        is_compliant=is_compliant,
+        reasoning=model,
+        input_msg="text",
+        confidence_score=0.8,
+    )
+
+
+@pytest.fixture
+def ensemble(mocker):
+    mocker.patch.dict(os.environ, {"OPENAI_API_KEY": "some-key"})
+    models = {"fast": (0, True), "medium": (0.01, True), "slow": (5, False)}
+    ensemble = EnsembleChecker.from_models(
+        [(LLMProvider.OPENAI, model) for model in models]
+    )
+    for member in ensemble.members:
+        delay, is_compliant = models[member.model]
+
+        async def acheck_text(text, delay=delay, model=member.model, c=is_compliant):
+            await asyncio.sleep(delay)
+            return llm_response(model, c)
+
+        mocker.patch.object(member, "acheck_text", side_effect=acheck_text)
+    return ensemble
+
+
+class TestEnsembleChecker:
+    def test_quorum_cancels_outstanding_calls(self, ensemble):
+        verdict = asyncio.run(ensemble.acheck_text("text"))
+        assert verdict.is_compliant is True
+        assert verdict.quorum == 2 and verdict.quorum_reached
+        assert verdict.latency < 1
+        statuses = {m.model: m.status for m in verdict.members}
+        assert statuses == {
+            "fast": "succeeded",
+            "medium": "succeeded",
+            "slow": "cancelled",
+        }
+
+    def test_compare_waits_for_every_member(self, ensemble, mocker):
+        mocker.patch("asyncio.sleep", return_value=None)
+        verdict = asyncio.run(ensemble.acheck_text("text", compare=True))
+        assert verdict.is_compliant is True
+        assert verdict.agreement == pytest.approx(2 / 3)
+        assert all(m.status == "succeeded" for m in verdict.members)
+
+    def test_failures_without_quorum(self, ensemble, mocker):
+        mocker.patch.object(
+            ensemble.members[1], "acheck_text", side_effect=RuntimeError("boom")
+        )
+        mocker.patch("asyncio.sleep", return_value=None)
+        verdict = asyncio.run(ensemble.acheck_text("text"))
+        assert not verdict.quorum_reached
+        # a tie is reported as non compliant
+        assert verdict.is_compliant is False
+        assert verdict.members[1].status == "failed"
+
+    def test_invalid_quorum(self, ensemble):
+        with pytest.raises(ValueError):
+            EnsembleChecker(ensemble.members, quorum=4)
+
+
+def test_parse_members():
+    assert parse_members("openai:gpt-4o, anthropic:claude-3-5-sonnet") == [
+        (LLMProvider.OPENAI, "gpt-4o"),
+        (LLMProvider.ANTHROPIC, "claude-3-5-sonnet"),
+    ]
+    with pytest.raises(ValueError):
+        parse_members("openai")
@@ -0,0 +1,64 @@
+import pytest
+
+from seiright.core._types import ExtractorConfig
+from seiright.core.extractor import StreamingExtractor, extract_html
+
+HTML = """<html><head><title> Acme  Bank </title><style>p { color: red }</style>
+<link rel="canonical" href="/home"></head>
+<body>
+  <nav><ul><li>Home</li><li>About</li></ul></nav>
+  <h2>Savings <b>account</b></h2>
+  <p>Earn 5% APY, café &amp; more.</p>
+  <script>document.write("<p>hidden</p>")</script>
+  <ul><li>No fees <p>Nested</p> tail</li></ul>
+  <a href="/pricing">pricing</a>
+</body></html>"""
+
+
+@pytest.fixture(params=["html.parser", "lxml"])
+def config(request):
+    if request.param == "lxml":
+        pytest.importorskip("lxml")
+    return ExtractorConfig(backend=request.param)
+
+
+class TestStreamingExtractor:
+    def test_blocks(self, config):
+        extractor = extract_html(HTML, config=config, collect_links=True)
+        assert extractor.title == "Acme Bank"
+        assert extractor.blocks == [
+            ("h2", "Savings account"),
+            ("p", "Earn 5% APY, café & more."),
+            ("li", "No fees"),
+            ("p", "Nested"),
+            ("li", "tail"),
+        ]
+        assert extractor.collector.links == ["/pricing"]
+        assert extractor.collector.canonical == "/home"
+
+    def test_result_format(self, config):
+        text, title = extract_html("<h1>A</h1><p>b</p>", config=config).result()
+        assert text == "\n# A\n\nb"
+
+    def test_byte_by_byte(self, config):
+        extractor = StreamingExtractor(config=config, encoding="utf-8")
+        for byte in HTML.encode("utf-8"):
+            extractor.feed(bytes([byte]))
+        assert extractor.result() == extract_html(HTML, config=config).result()
+
+    def test_max_bytes(self, config):
+        config = config.model_copy(update={"max_bytes": 100, "chunk_size": 10})
+        extractor = extract_html("<p>x</p>" * 1000, config=config)
+        assert extractor.truncated
+        assert extractor.bytes_read == 100
+
+    def test_max_text_chars(self, config):
+        config = config.model_copy(update={"max_text_chars": 50})
+        text, _ = extract_html("<p>0123456789</p>" * 100, config=config).result()
+        assert len(text.replace("\n", "")) == 50
+
+    def test_max_parse_seconds(self, config):
+        config = config.model_copy(update={"max_parse_seconds": 0, "chunk_size": 100})
+        extractor = extract_html("<p>0123456789</p>" * 1000, config=config)
+        assert extractor.truncated
+        assert extractor.bytes_read == 100
@@ -0,0 +1,38 @@
+from seiright.cli import parser
+from seiright.core import factory
+from seiright.core._types import LLMProvider
+from seiright.core.router import LLMRouter
+
+
+class TestBuildChecker:
+    def test_defaults(self, monkeypatch):
+        monkeypatch.delenv("LLM_FALLBACKS", raising=False)
+        monkeypatch.delenv("INCREMENTAL_CHECKS", raising=False)
+        monkeypatch.delenv("REUSE_NEAR_DUPLICATES", raising=False)
+        checker = factory.build_checker()
+        assert (checker.llm_provider, checker.model) == (LLMProvider.OPENAI, "gpt4o")
+        assert isinstance(checker.llm, LLMRouter)
+        assert checker.block_store is None and checker.boilerplate is None
+        assert checker.near_duplicates is None
+        factory.close_checker(checker)
+
+    def test_from_the_environment(self, monkeypatch, tmp_path):
+        monkeypatch.setenv("LLM_FALLBACKS", "anthropic:claude-3-5-sonnet")
+        monkeypatch.setenv("INCREMENTAL_CHECKS", "true")
+        monkeypatch.setenv("BLOCK_STORE_DB", str(tmp_path / "blocks.sqlite"))
+        monkeypatch.setenv("MAX_CHUNK_CALLS", "2")
+        checker = factory.build_checker(LLMProvider.OPENAI, "gpt-4o-mini")
+        assert [route.llm.model for route in checker.llm.routes] == [
+            "gpt-4o-mini",
+            "claude-3-5-sonnet",
+        ]
+        assert checker.block_store is not None
+        assert checker.max_chunk_calls == 2
+        factory.close_checker(checker)
+
+    def test_cli_defaults_to_the_service_model(self):
+        args = parser().parse_args(["check", "urls.txt", "-o", "out.jsonl"])
+        assert (LLMProvider(args.provider), args.model) == (
+            factory.DEFAULT_PROVIDER,
+            factory.DEFAULT_MODEL,
+        )
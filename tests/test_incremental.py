@@ -0,0 +1,112 @@
+import asyncio
+import os
+
+import pytest
+
+from seiright.core._types import LLMProvider, LLMResponse
+from seiright.core.assemble import ComplianceChecker
+from seiright.core.incremental import BlockStore, block_hash, plan_recheck
+from seiright.core.web_crawler import reformat_extracted_text
+
+SECTIONS = [
+    "# Savings\n\nEarn 4% APY on your savings.\n\n",
+    "# Cards\n\nCorporate cards with no fees.\n\n",
+    "# Loans\n\nLoans for growing businesses.\n\n",
+]
+
+
+def page(sections: list[str]) -> str:
+    return reformat_extracted_text("".join(sections), title="Harbor")
+
+
+def verdict(text: str) -> LLMResponse:
+    return LLMResponse(
+        model="gpt-4o",
+        llm_provider=LLMProvider.OPENAI,
+        is_compliant="guaranteed" not in text,
+        reasoning=text,
+        input_msg=text,
+        confidence_score=0.9,
+    )
+
+
+@pytest.fixture
+def checker(mocker):
+    mocker.patch.dict(os.environ, {"OPENAI_API_KEY": "some-key"})
+    return ComplianceChecker(
+        llm_provider=LLMProvider.OPENAI,
+        model="gpt-4o",
+        block_store=BlockStore(),
+        block_tokens=60,
+    )
+
+
+def test_block_hash_ignores_wrapping():
+    assert block_hash("Earn 4% APY\non savings") == block_hash("Earn 4% APY on savings")
+
+
+def test_plan_without_previous_check_judges_the_whole_page():
+    plan = plan_recheck(page(SECTIONS), None, max_tokens=1000)
+    assert plan.banner.startswith("=")
+    assert plan.whole_page
+    assert plan.changed == [0, 1, 2]
+
+
+class TestCheckPage:
+    def test_only_changed_blocks_are_sent(self, checker, mocker):
+        sent = []
+
+        async def acheck_text(text):
+            sent.append(text)
+            return verdict(text)
+
+        mocker.patch.object(checker, "acheck_text", side_effect=acheck_text)
+        url = "https://harbor.com/"
+        first = asyncio.run(checker.acheck_page(url, page(SECTIONS)))
+        assert first.is_compliant is True
+        assert sent == [page(SECTIONS)]
+
+        sent.clear()
+        edited = [
+            SECTIONS[0],
+            "# Cards\n\nguaranteed returns on cards.\n\n",
+            SECTIONS[2],
+        ]
+        second = asyncio.run(checker.acheck_page(url, page(edited)))
+        assert len(sent) == 1 and "guaranteed" in sent[0]
+        assert second.is_compliant is False
+
+        sent.clear()
+        third = asyncio.run(checker.acheck_page(url, page(SECTIONS)))
+        # the non compliant cards block is judged again, with its neighbours
+        assert len(sent) == 1 and "Corporate cards" in sent[0]
+        assert "Earn 4%" in sent[0] and "Loans for" in sent[0]
+        assert third.is_compliant is True
+
+        sent.clear()
+        asyncio.run(checker.acheck_page(url, page(SECTIONS + SECTIONS[:1])))
+        assert len(sent) == 1
+        assert "Corporate cards" not in sent[0] and "Loans for" in sent[0]
+
+    def test_large_changes_judge_the_whole_page(self, checker, mocker):
+        mocker.patch.object(checker, "acheck_text", side_effect=verdict)
+        url = "https://harbor.com/"
+        asyncio.run(checker.acheck_page(url, page(SECTIONS)))
+        checker.block_tokens = 1
+        edited = [SECTIONS[0], "# Cards\n\nCards with cashback.\n\n", SECTIONS[2]]
+        asyncio.run(checker.acheck_page(url, page(edited)))
+        assert checker.acheck_text.call_args.args == (page(edited),)
+
+    def test_prompts_are_not_stored(self, checker, mocker):
+        mocker.patch.object(checker, "check_text", side_effect=verdict)
+        response = checker.check_page("https://harbor.com/", page(SECTIONS))
+        assert response.input_msg == page(SECTIONS)
+        stored = checker.block_store.get("https://harbor.com/", checker.block_key())
+        assert [a.response.input_msg for a in stored.assessments] == [""]
+
+    def test_other_model_does_not_reuse(self, checker, mocker):
+        mocker.patch.object(checker, "check_text", side_effect=verdict)
+        checker.check_page("https://harbor.com/", page(SECTIONS))
+        checker.model = "gpt-4o-mini"
+        checker.check_page("https://harbor.com/", page(SECTIONS))
+        assert checker.check_text.call_count == 2
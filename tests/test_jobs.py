@@ -0,0 +1,188 @@
+import asyncio
+import json
+import os
+import socket
+
+import httpx
+import pytest
+
+from seiright.core._types import JobStatus, LLMProvider, LLMResponse
+from seiright.core.assemble import ComplianceChecker
+from seiright.core.jobs import (
+    JobQueue,
+    JobStore,
+    QueueFullError,
+    UnsafeWebhookError,
+    acheck_webhook_url,
+)
+
+
+@pytest.fixture
+def checker(mocker):
+    mocker.patch.dict(os.environ, {"OPENAI_API_KEY": "some-key"})
+    checker = ComplianceChecker(llm_provider=LLMProvider.OPENAI, model="gpt-4o")
+
+    async def achat(url):
+        if url == "https://bad.test":
+            raise RuntimeError("boom")
+        return LLMResponse(
+            model="gpt-4o",
+            llm_provider=LLMProvider.OPENAI,
+            is_compliant=True,
+            reasoning="ok",
+            input_msg=url,
+            confidence_score=0.9,
+        )
+
+    mocker.patch.object(checker, "achat", side_effect=achat)
+    return checker
+
+
+async def wait_finished(queue: JobQueue) -> None:
+    await asyncio.wait_for(queue._queue.join(), timeout=5)
+
+
+class TestJobQueue:
+    def test_jobs_run_in_background(self, checker):
+        async def run():
+            queue = JobQueue(checker, JobStore(), workers=2)
+            queue.start()
+            ok = await queue.asubmit("https://good.test", user="monte")
+            bad = await queue.asubmit("https://bad.test", user="monte")
+            assert ok.status == JobStatus.QUEUED
+            await wait_finished(queue)
+            await queue.aclose()
+            return await queue.aget(ok.id), await queue.aget(bad.id)
+
+        ok, bad = asyncio.run(run())
+        assert ok.status == JobStatus.SUCCEEDED
+        assert ok.result.is_compliant is True
+        assert bad.status == JobStatus.FAILED
+        assert "boom" in bad.error
+
+    def test_queue_full(self, checker):
+        queue = JobQueue(checker, JobStore(), max_queued=1)
+        queue.submit("https://good.test", user="monte")
+        with pytest.raises(QueueFullError):
+            queue.submit("https://good.test", user="monte")
+
+    def test_unfinished_jobs_resume(self, checker, tmp_path):
+        store = JobStore(tmp_path / "jobs.db")
+        job = JobQueue(checker, store).submit("https://good.test", user="monte")
+        store.close()
+
+        async def run():
+            queue = JobQueue(checker, JobStore(tmp_path / "jobs.db"))
+            queue.start()
+            await wait_finished(queue)
+            await queue.aclose()
+            return queue.get(job.id)
+
+        assert asyncio.run(run()).status == JobStatus.SUCCEEDED
+
+    def test_webhook(self, checker):
+        received = []
+
+        def handler(request: httpx.Request) -> httpx.Response:
+            received.append(json.loads(request.content))
+            return httpx.Response(200)
+
+        async def run():
+            client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+            queue = JobQueue(checker, JobStore(), client=client)
+            queue.start()
+            job = await queue.asubmit(
+                "https://good.test", user="monte", webhook_url="https://93.184.216.34"
+            )
+            await wait_finished(queue)
+            while queue._tasks and len(received) == 0:
+                await asyncio.sleep(0.01)
+            await queue.aclose()
+            return job
+
+        job = asyncio.run(run())
+        assert [r["id"] for r in received] == [job.id]
+        assert received[0]["status"] == "succeeded"
+
+    def test_webhook_to_internal_host(self, checker):
+        def handler(request: httpx.Request) -> httpx.Response:
+            raise AssertionError("posted to an internal host")
+
+        async def run():
+            client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+            queue = JobQueue(checker, JobStore(), client=client)
+            job = queue.submit(
+                "https://good.test",
+                user="monte",
+                webhook_url="http://169.254.169.254/latest/meta-data",
+            )
+            return await queue.notify(job)
+
+        assert asyncio.run(run()) is False
+
+    def test_webhook_posted_to_the_checked_address(self, checker, mocker):
+        async def getaddrinfo(self, host, port, **kwargs):
+            return [(socket.AF_INET, socket.SOCK_STREAM, 6, "", ("93.184.216.34", 443))]
+
+        mocker.patch.object(asyncio.BaseEventLoop, "getaddrinfo", getaddrinfo)
+        requests = []
+
+        def handler(request: httpx.Request) -> httpx.Response:
+            requests.append(request)
+            return httpx.Response(200)
+
+        async def run():
+            client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+            queue = JobQueue(checker, JobStore(), client=client)
+            job = queue.submit(
+                "https://good.test", user="monte", webhook_url="https://hooks.test/x"
+            )
+            return await queue.notify(job)
+
+        assert asyncio.run(run()) is True
+        assert requests[0].url == "https://93.184.216.34/x"
+        assert requests[0].headers["host"] == "hooks.test"
+        assert requests[0].extensions["sni_hostname"] == "hooks.test"
+
+    def test_webhook_redirects_not_followed(self, checker):
+        requests = []
+
+        def handler(request: httpx.Request) -> httpx.Response:
+            requests.append(request)
+            return httpx.Response(
+                307, headers={"location": "http://169.254.169.254/latest/meta-data"}
+            )
+
+        async def run():
+            client = httpx.AsyncClient(
+                transport=httpx.MockTransport(handler), follow_redirects=True
+            )
+            queue = JobQueue(checker, JobStore(), client=client)
+            job = queue.submit(
+                "https://good.test", user="monte", webhook_url="https://93.184.216.34"
+            )
+            return await queue.notify(job)
+
+        assert asyncio.run(run()) is False
+        assert len(requests) == 1
+
+
+class TestWebhookUrl:
+    @pytest.mark.parametrize(
+        "url",
+        [
+            "http://127.0.0.1:8000/hook",
+            "http://169.254.169.254/latest/meta-data",
+            "http://10.0.0.7/hook",
+            "http://[::1]/hook",
+            "http://[::ffff:192.168.0.1]/hook",
+            "http://localhost/hook",
+            "ftp://93.184.216.34/hook",
+        ],
+    )
+    def test_unsafe(self, url):
+        with pytest.raises(UnsafeWebhookError):
+            asyncio.run(acheck_webhook_url(url))
+
+    def test_public(self):
+        asyncio.run(acheck_webhook_url("https://93.184.216.34/hook"))
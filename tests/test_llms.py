@@ -0,0 +1,111 @@
+import asyncio
+import json
+import os
+from types import SimpleNamespace
+
+import pytest
+
+from seiright.core.llms import AnthropicLLM, OpenAILLM
+from seiright.core.prompts import SeiPrompts
+from seiright.core.ratelimit import LLMScheduler
+
+VERDICT = {"is_compliant": True, "reasoning": "ok", "confidence_score": 0.8}
+
+
+@pytest.fixture(autouse=True)
+def api_keys(mocker):
+    mocker.patch.dict(
+        os.environ, {"OPENAI_API_KEY": "some-key", "ANTHROPIC_API_KEY": "some-key"}
+    )
+
+
+class TestOpenAILLM:
+    def test_static_prefix_is_stable(self):
+        llm = OpenAILLM(model="gpt-4o")
+        first = llm.request_kwargs("page one")
+        second = llm.request_kwargs("page two")
+        assert first["messages"][0] == second["messages"][0]
+        assert first["messages"][0]["content"][0] == {
+            "type": "text",
+            "text": SeiPrompts.system_prompt,
+        }
+        assert json.dumps(first["response_format"]) == json.dumps(
+            second["response_format"]
+        )
+
+    def test_clients_are_built_on_first_use(self, mocker):
+        llm = OpenAILLM(model="gpt-4o")
+        assert llm._clients == {}
+        client = llm.client
+        assert client.api_key == "some-key" and llm.client is client
+
+        mocker.patch.dict(os.environ, {"OPENAI_API_KEY": ""})
+        mocker.patch("seiright.core.llms.secret", return_value="rotated-key")
+        assert llm.client.api_key == "rotated-key"
+
+    def test_async_client_key_off_the_event_loop(self, mocker):
+        mocker.patch.dict(os.environ, {"OPENAI_API_KEY": ""})
+        asecret = mocker.patch("seiright.core.llms.asecret", return_value="async-key")
+        secret = mocker.patch("seiright.core.llms.secret")
+        client = asyncio.run(OpenAILLM(model="gpt-4o").aclient())
+        assert client.api_key == "async-key"
+        asecret.assert_awaited_once_with("openai-api-key")
+        secret.assert_not_called()
+
+    def test_usage(self):
+        response = SimpleNamespace(
+            choices=[
+                SimpleNamespace(message=SimpleNamespace(content=json.dumps(VERDICT)))
+            ],
+            usage=SimpleNamespace(
+                prompt_tokens=3000,
+                completion_tokens=50,
+                prompt_tokens_details=SimpleNamespace(cached_tokens=2048),
+            ),
+        )
+        result = OpenAILLM(model="gpt-4o").parse_response(response, "page")
+        assert (result.cached_tokens, result.uncached_tokens) == (2048, 952)
+        assert result.completion_tokens == 50
+
+
+class TestAnthropicLLM:
+    def test_system_prompt_is_cacheable(self):
+        kwargs = AnthropicLLM(model="claude").request_kwargs("page")
+        assert kwargs["system"] == [
+            {
+                "type": "text",
+                "text": SeiPrompts.system_prompt,
+                "cache_control": {"type": "ephemeral"},
+            }
+        ]
+        assert [m["role"] for m in kwargs["messages"]] == ["user"]
+
+    def test_usage(self):
+        response = SimpleNamespace(
+            content=[SimpleNamespace(type="tool_use", input=VERDICT)],
+            usage=SimpleNamespace(
+                input_tokens=900,
+                output_tokens=40,
+                cache_read_input_tokens=2000,
+                cache_creation_input_tokens=100,
+            ),
+        )
+        result = AnthropicLLM(model="claude").parse_response(response, "page")
+        assert result.is_compliant is True
+        assert (result.cached_tokens, result.uncached_tokens) == (2000, 1000)
+        assert result.completion_tokens == 40
+
+    def test_async_raw_response(self, mocker):
+        mocker.patch("seiright.core.llms.llm_scheduler", LLMScheduler())
+        llm = AnthropicLLM(model="claude")
+        message = SimpleNamespace(
+            content=[SimpleNamespace(type="tool_use", input=VERDICT)],
+            usage=SimpleNamespace(input_tokens=900, output_tokens=40),
+        )
+
+        async def parse():
+            return message
+
+        raw = SimpleNamespace(headers={}, parse=parse)
+        mocker.patch.object(llm, "acreate", mocker.AsyncMock(return_value=raw))
+        assert asyncio.run(llm.achat("page")).is_compliant is True
@@ -0,0 +1,45 @@
+import pytest
+
+from seiright.core.metrics import (
+    STAGE_SECONDS,
+    Counter,
+    Gauge,
+    Histogram,
+    Registry,
+    span,
+)
+
+
+class TestMetrics:
+    def test_counter(self):
+        tokens = Counter("tokens_total", "Tokens", ("provider", "kind"))
+        tokens.labels("openai", "cached").inc(10)
+        tokens.labels("openai", "cached").inc(5)
+        assert 'tokens_total{provider="openai",kind="cached"} 15' in tokens.render()
+        with pytest.raises(ValueError):
+            tokens.labels("openai")
+
+    def test_histogram_buckets_are_cumulative(self):
+        latency = Histogram("latency_seconds", "Latency", buckets=(0.1, 1.0))
+        for value in (0.05, 0.5, 0.5, 5):
+            latency.observe(value)
+        lines = latency.render().splitlines()
+        assert 'latency_seconds_bucket{le="0.1"} 1' in lines
+        assert 'latency_seconds_bucket{le="1"} 3' in lines
+        assert 'latency_seconds_bucket{le="+Inf"} 4' in lines
+        assert "latency_seconds_sum 6.05" in lines
+        assert "latency_seconds_count 4" in lines
+
+    def test_gauge_function(self):
+        registry = Registry()
+        registry.register(
+            Gauge("waiting", "Waiting", ("model",), function=lambda: {('a"b',): 2})
+        )
+        assert 'waiting{model="a\\"b"} 2' in registry.render()
+
+    def test_span_records_failures(self):
+        before = sum(STAGE_SECONDS.labels("test").counts)
+        with pytest.raises(RuntimeError):
+            with span("test"):
+                raise RuntimeError()
+        assert sum(STAGE_SECONDS.labels("test").counts) == before + 1
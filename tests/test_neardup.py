@@ -0,0 +1,142 @@
+import asyncio
+import os
+
+import pytest
+
+from seiright.core._types import LLMProvider, LLMResponse
+from seiright.core.assemble import ComplianceChecker
+from seiright.core.cache import VerdictCache
+from seiright.core import neardup
+from seiright.core.neardup import NearDuplicateIndex
+
+PAGE = " ".join(
+    f"Harbor business accounts offer feature number {i} to small companies."
+    for i in range(40)
+)
+MIRROR = PAGE.replace("feature number 7 ", "feature number seven ")
+OTHER = " ".join(f"Read the story of our founders, chapter {i}." for i in range(40))
+
+
+def verdict(user_prompt: str) -> LLMResponse:
+    return LLMResponse(
+        model="gpt-4o",
+        llm_provider=LLMProvider.OPENAI,
+        is_compliant=True,
+        reasoning="ok",
+        input_msg=user_prompt,
+        confidence_score=0.9,
+    )
+
+
+class TestNearDuplicateIndex:
+    def test_near_duplicates_are_found(self):
+        index = NearDuplicateIndex(threshold=0.9)
+        index.add("https://harbor.com/en/", index.signature(PAGE), key="k")
+        match = index.query(index.signature(MIRROR))
+        assert (match.page, match.key) == ("https://harbor.com/en", "k")
+        assert 0.9 <= match.similarity < 1
+        assert index.query(index.signature(OTHER)) is None
+        assert index.signature("  ") is None
+
+    def test_scope_and_exclude(self):
+        index = NearDuplicateIndex(threshold=0.9)
+        index.add("https://harbor.com/en", index.signature(PAGE), key="k", scope="a")
+        signature = index.signature(MIRROR)
+        assert index.query(signature, scope="b") is None
+        assert (
+            index.query(signature, scope="a", exclude="https://www.harbor.com/en/")
+            is None
+        )
+        assert index.query(signature, scope="a", exclude="https://harbor.com/fr")
+
+    def test_readding_a_page_replaces_it(self, tmp_path):
+        db_path = tmp_path / "neardup.db"
+        index = NearDuplicateIndex(threshold=0.9, db_path=db_path)
+        index.add("https://harbor.com/en", index.signature(PAGE), key="k1")
+        index.add("https://harbor.com/en", index.signature(OTHER), key="k2")
+        assert index.query(index.signature(MIRROR)) is None
+        index.close()
+
+        reopened = NearDuplicateIndex(threshold=0.9, db_path=db_path)
+        assert len(reopened) == 1
+        assert reopened.query(reopened.signature(OTHER)).key == "k2"
+
+    def test_signature_in_chunks(self, mocker):
+        index = NearDuplicateIndex()
+        signature = index.signature(PAGE)
+        mocker.patch.object(neardup, "SIGNATURE_CHUNK", 7)
+        assert (index.signature(PAGE) == signature).all()
+
+    def test_readded_page_leaves_no_bands(self):
+        index = NearDuplicateIndex(threshold=0.9)
+        index.add("https://harbor.com/en", index.signature(PAGE), key="k1")
+        index.add("https://harbor.com/en", index.signature(OTHER), key="k2")
+        assert sorted(i for b in index._buckets.values() for i in b) == [1] * 8
+
+    def test_oldest_pages_evicted(self, tmp_path):
+        db_path = tmp_path / "neardup.db"
+        index = NearDuplicateIndex(threshold=0.9, db_path=db_path, max_pages=2)
+        index.add("https://harbor.com/en", index.signature(PAGE), key="k1")
+        index.add("https://harbor.com/about", index.signature(OTHER), key="k2")
+        index.add("https://harbor.com/en", index.signature(PAGE), key="k3")
+        index.add("https://harbor.com/fr", index.signature("bonjour " * 50), key="k4")
+        assert len(index) == 2
+        assert index.query(index.signature(OTHER)) is None
+        assert index.query(index.signature(MIRROR)).key == "k3"
+        index.close()
+
+        reopened = NearDuplicateIndex(threshold=0.9, db_path=db_path, max_pages=1)
+        assert len(reopened) == 1
+        assert reopened.query(reopened.signature(MIRROR)) is None
+        reopened.close()
+        assert len(NearDuplicateIndex(db_path=db_path)) == 1
+
+    def test_compaction(self):
+        index = NearDuplicateIndex(threshold=0.9, max_pages=3)
+        for i in range(3000):
+            index.add(f"https://harbor.com/{i % 5}", index.signature(PAGE), key=str(i))
+        assert len(index) == 3
+        assert len(index._entries) <= 2048
+        assert index.query(index.signature(MIRROR)).key in {"2997", "2998", "2999"}
+
+
+class TestReuse:
+    @pytest.fixture
+    def checker(self, mocker):
+        mocker.patch.dict(os.environ, {"OPENAI_API_KEY": "some-key"})
+        checker = ComplianceChecker(
+            llm_provider=LLMProvider.OPENAI,
+            model="gpt-4o",
+            verdict_cache=VerdictCache(),
+            near_duplicates=NearDuplicateIndex(threshold=0.9),
+        )
+        mocker.patch.object(checker.llm, "chat", side_effect=verdict)
+        return checker
+
+    def test_mirror_reuses_the_verdict(self, checker):
+        first = checker.check_page("https://harbor.com/en", PAGE)
+        assert first.reused_from is None
+
+        mirror = checker.check_page("https://harbor.com/en-gb", MIRROR)
+        assert checker.llm.chat.call_count == 1
+        assert mirror.reused_from == "https://harbor.com/en"
+        assert mirror.is_compliant is first.is_compliant
+
+        checker.check_page("https://harbor.com/about", OTHER)
+        assert checker.llm.chat.call_count == 2
+
+    def test_edited_page_is_checked_again(self, checker):
+        checker.check_page("https://harbor.com/en", PAGE)
+        edited = checker.check_page("https://harbor.com/en", MIRROR)
+        assert checker.llm.chat.call_count == 2
+        assert edited.reused_from is None
+
+    def test_async_mirror_reuses_the_verdict(self, checker, mocker):
+        mocker.patch.object(checker.llm, "achat", side_effect=verdict)
+
+        async def run():
+            await checker.acheck_page("https://harbor.com/en", PAGE)
+            return await checker.acheck_page("https://harbor.com/en-gb", MIRROR)
+
+        assert asyncio.run(run()).reused_from == "https://harbor.com/en"
+        assert checker.llm.achat.call_count == 1
@@ -0,0 +1,64 @@
+import os
+
+import pytest
+
+from seiright.core.prompts import PromptRegistry
+
+PROPERTIES = """- type: boolean
+  name: is_compliant
+  description: "compliant or not"
+"""
+
+
+@pytest.fixture
+def prompts(tmp_path):
+    tmp_path.joinpath("system.txt").write_text("You are a compliance officer.")
+    tmp_path.joinpath("properties.yaml").write_text(PROPERTIES)
+    return tmp_path
+
+
+def touch(path, content):
+    path.write_text(content)
+    stat = path.stat()
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+
+class TestPromptRegistry:
+    def test_loads_once(self, prompts):
+        registry = PromptRegistry(directory=prompts, check_interval=None)
+        version = registry.current()
+        assert version.system_prompt == "You are a compliance officer."
+        assert list(version.properties.properties) == ["is_compliant"]
+        touch(prompts / "system.txt", "changed")
+        assert registry.current() is version
+
+    def test_hot_reload(self, prompts):
+        registry = PromptRegistry(directory=prompts, check_interval=0)
+        old = registry.current()
+        touch(prompts / "system.txt", "You are a strict compliance officer.")
+        new = registry.current()
+        assert new.system_prompt == "You are a strict compliance officer."
+        assert new.version != old.version
+
+    def test_broken_file_keeps_current_version(self, prompts):
+        registry = PromptRegistry(directory=prompts, check_interval=0)
+        old = registry.current()
+        touch(prompts / "properties.yaml", "- [broken")
+        assert registry.current() is old
+
+    def test_templates_are_compiled_once_per_version(self, prompts):
+        registry = PromptRegistry(directory=prompts, check_interval=0)
+        calls = []
+
+        def build(version):
+            calls.append(version.version)
+            return {"system": version.system_prompt}
+
+        first = registry.current().template("openai", build)
+        assert registry.current().template("openai", build) is first
+        with pytest.raises(TypeError):
+            first["system"] = "mutated"  # type: ignore
+
+        touch(prompts / "system.txt", "changed")
+        assert registry.current().template("openai", build)["system"] == "changed"
+        assert len(calls) == 2
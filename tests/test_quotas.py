@@ -0,0 +1,145 @@
+import asyncio
+import multiprocessing
+import threading
+
+import pytest
+from fastapi import HTTPException
+
+from seiright.app import quotas
+from seiright.app.api_models import User, UserQuota, get_user
+from seiright.app.quotas import MemoryQuotaBackend, SQLiteQuotaBackend, UserQuotas
+
+
+class Clock:
+    def __init__(self, now: float = 1000.0):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(mocker):
+    clock = Clock()
+    mocker.patch.object(quotas.time, "monotonic", clock)
+    mocker.patch.object(quotas.time, "time", clock)
+    return clock
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def backend(request, tmp_path):
+    if request.param == "memory":
+        backend = MemoryQuotaBackend()
+    else:
+        backend = SQLiteQuotaBackend(tmp_path / "quotas.db")
+    yield backend
+    backend.close()
+
+
+def _acquire_many(db_path: str, n: int) -> int:
+    backend = SQLiteQuotaBackend(db_path)
+    granted = sum(backend.acquire("monte", 1, None, 0) == 0 for _ in range(n))
+    backend.close()
+    return granted
+
+
+class TestQuotaBackends:
+    def test_requests(self, backend, clock):
+        assert backend.acquire("monte", 2, None, 0) == 0
+        assert backend.acquire("monte", 2, None, 0) == 0
+        assert backend.acquire("monte", 2, None, 0) == pytest.approx(30)
+        # other users have their own budget
+        assert backend.acquire("johndoe", 2, None, 0) == 0
+        clock.now += 30
+        assert backend.acquire("monte", 2, None, 0) == 0
+
+    def test_tokens(self, backend, clock):
+        assert backend.acquire("monte", None, 6000, 4000) == 0
+        assert backend.acquire("monte", None, 6000, 4000) == pytest.approx(20)
+        # a rejected request takes nothing
+        assert backend.acquire("monte", 10, 6000, 2000) == 0
+        assert backend.acquire("monte", None, 6000, 1) > 0
+
+    def test_larger_than_the_bucket(self, backend, clock):
+        # waits for a full bucket and leaves it in debt
+        assert backend.acquire("monte", None, 1000, 3000) == 0
+        assert backend.acquire("monte", None, 1000, 1000) == pytest.approx(180)
+
+    def test_limit_changes(self, backend, clock):
+        assert backend.acquire("monte", 1, None, 0) == 0
+        assert backend.acquire("monte", 1, None, 0) > 0
+        assert backend.acquire("monte", None, None, 0) == 0
+        assert backend.acquire("monte", 60, None, 0) == 0
+
+
+class TestSQLiteQuotaBackend:
+    def test_shared_between_processes(self, tmp_path):
+        db_path = str(tmp_path / "quotas.db")
+        SQLiteQuotaBackend(db_path).close()
+        context = multiprocessing.get_context("spawn")
+        with context.Pool(2) as pool:
+            # the bucket holds one request, refilled in a minute
+            granted = pool.starmap(_acquire_many, [(db_path, 5), (db_path, 5)])
+        assert sum(granted) == 1
+
+
+class TestUserQuotas:
+    def test_limits(self):
+        user_quotas = UserQuotas(requests_per_minute=60, tokens_per_minute=10_000)
+        assert user_quotas.limits(User(username="monte")) == (60, 10_000)
+        user = User(username="monte", quota=UserQuota(tokens_per_minute=500))
+        assert user_quotas.limits(user) == (60, 500)
+
+    def test_unlimited(self, mocker):
+        backend = MemoryQuotaBackend()
+        acquire = mocker.spy(backend, "acquire")
+        user_quotas = UserQuotas(backend=backend)
+        for _ in range(100):
+            user_quotas.check(User(username="monte"), tokens=10**6)
+        acquire.assert_not_called()
+
+    def test_check(self, clock):
+        user_quotas = UserQuotas(requests_per_minute=1)
+        user = User(username="monte")
+        user_quotas.check(user)
+        with pytest.raises(HTTPException) as e:
+            user_quotas.check(user)
+        assert e.value.status_code == 429
+        assert e.value.headers == {"Retry-After": "60"}
+        clock.now += 59.5
+        with pytest.raises(HTTPException) as e:
+            user_quotas.check(user)
+        assert e.value.headers == {"Retry-After": "1"}
+
+    def test_acheck_off_the_event_loop(self, mocker, tmp_path):
+        backend = SQLiteQuotaBackend(tmp_path / "quotas.db")
+        threads = []
+        acquire = backend.acquire
+
+        def spy(*args):
+            threads.append(threading.current_thread())
+            return acquire(*args)
+
+        mocker.patch.object(backend, "acquire", spy)
+        user_quotas = UserQuotas(backend=backend, requests_per_minute=1)
+        user = User(username="monte")
+
+        async def run():
+            await user_quotas.acheck(user)
+            with pytest.raises(HTTPException) as e:
+                await user_quotas.acheck(user)
+            return e.value.status_code
+
+        assert asyncio.run(run()) == 429
+        assert len(threads) == 2
+        assert threading.main_thread() not in threads
+        user_quotas.close()
+
+    def test_quota_from_the_user_store(self):
+        entry = {
+            "username": "monte",
+            "hashed_password": "...",
+            "quota": {"requests_per_minute": 30, "tokens_per_minute": 20000},
+        }
+        user = get_user({"monte": entry}, "monte")
+        assert UserQuotas().limits(user) == (30, 20000)  # type: ignore
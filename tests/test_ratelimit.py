@@ -0,0 +1,199 @@
+import asyncio
+import json
+import os
+from types import SimpleNamespace
+
+import pytest
+
+from seiright.core.llms import OpenAILLM
+from seiright.core.ratelimit import (
+    BATCH,
+    INTERACTIVE,
+    LLMScheduler,
+    ModelLimiter,
+    TokenBucket,
+    parse_rate_limits,
+    priority,
+    request_priority,
+)
+
+
+class RateLimited(Exception):
+    status_code = 429
+    response = SimpleNamespace(headers={"retry-after": "0.01"})
+
+
+class TestTokenBucket:
+    def test_wait_and_refill(self):
+        bucket = TokenBucket(per_minute=60)
+        assert bucket.wait(60, now=bucket._updated) == 0
+        bucket.consume(60)
+        assert bucket.wait(30, now=bucket._updated) == pytest.approx(30)
+        assert bucket.wait(30, now=bucket._updated + 30) == 0
+
+    def test_unlimited(self):
+        bucket = TokenBucket()
+        bucket.consume(10**9)
+        assert bucket.wait(10**9, now=0) == 0
+
+
+class TestModelLimiter:
+    def test_interactive_goes_first(self):
+        limiter = ModelLimiter(rpm=6000)
+        limiter.requests.level = 0
+        order = []
+
+        async def call(name: str, level: int):
+            await limiter.aacquire(1, level)
+            order.append(name)
+
+        async def run():
+            batch = asyncio.create_task(call("batch", BATCH))
+            await asyncio.sleep(0)
+            interactive = asyncio.create_task(call("interactive", INTERACTIVE))
+            await asyncio.gather(batch, interactive)
+
+        asyncio.run(run())
+        assert order == ["interactive", "batch"]
+
+    def test_waiters_sleep_until_their_turn(self, mocker):
+        limiter = ModelLimiter(rpm=1200)  # one request every 50ms
+        limiter.requests.level = 0
+        poll = mocker.spy(limiter, "_poll")
+
+        async def run():
+            await asyncio.gather(*(limiter.aacquire(1) for _ in range(20)))
+
+        asyncio.run(asyncio.wait_for(run(), timeout=5))
+        assert limiter.waiting == 0
+        # each waiter polls when queued, at the head and once granted, instead
+        # of every few milliseconds while the ones ahead are served
+        assert poll.call_count <= 3 * 20
+
+    def test_refund_wakes_the_head(self):
+        limiter = ModelLimiter(tpm=60)  # a token a second
+        limiter.tokens.level = 0
+
+        async def run():
+            waiter = asyncio.create_task(limiter.aacquire(30))
+            await asyncio.sleep(0.01)
+            limiter.settle(reserved=40, used=0)
+            await waiter
+
+        asyncio.run(asyncio.wait_for(run(), timeout=1))
+
+    def test_threads_and_tasks_share_the_queue(self):
+        limiter = ModelLimiter(rpm=6000)
+        limiter.requests.level = 0
+
+        async def run():
+            threads = [asyncio.to_thread(limiter.acquire, 1) for _ in range(5)]
+            tasks = [limiter.aacquire(1) for _ in range(5)]
+            await asyncio.gather(*threads, *tasks)
+
+        asyncio.run(asyncio.wait_for(run(), timeout=5))
+        assert limiter.waiting == 0
+
+    def test_observe_headers(self):
+        limiter = ModelLimiter()
+        limiter.observe(
+            {
+                "x-ratelimit-limit-requests": "500",
+                "x-ratelimit-remaining-requests": "10",
+                "x-ratelimit-limit-tokens": "30000",
+            }
+        )
+        assert limiter.requests.per_minute == 500
+        assert limiter.requests.level == 10
+        assert limiter.tokens.per_minute == 30000
+
+
+class TestLLMScheduler:
+    def test_rate_limited_call_is_retried(self):
+        scheduler = LLMScheduler()
+        attempts = []
+
+        def send():
+            attempts.append(1)
+            if len(attempts) == 1:
+                raise RateLimited()
+            return SimpleNamespace(headers={})
+
+        scheduler.run("openai", "gpt-4o", 100, send)
+        assert len(attempts) == 2
+
+    def test_other_errors_are_not_retried(self):
+        scheduler = LLMScheduler()
+        attempts = []
+
+        def send():
+            attempts.append(1)
+            raise ValueError("bad request")
+
+        with pytest.raises(ValueError):
+            scheduler.run("openai", "gpt-4o", 100, send)
+        assert len(attempts) == 1
+
+    def test_connection_errors_are_retried_and_refunded(self, mocker):
+        sleep = mocker.patch("seiright.core.ratelimit.time.sleep")
+        scheduler = LLMScheduler()
+        scheduler.configure("openai", "gpt-4o", tpm=1000)
+        attempts = []
+
+        class APIConnectionError(Exception):
+            pass
+
+        def send():
+            attempts.append(1)
+            if len(attempts) < 3:
+                raise APIConnectionError("connection reset")
+            return SimpleNamespace(headers={})
+
+        scheduler.run("openai", "gpt-4o", 300, send)
+        assert len(attempts) == 3
+        assert sleep.call_count == 2
+        # only the attempt which went through kept its tokens
+        tokens = scheduler.limiter("openai", "gpt-4o").tokens
+        assert tokens.level == pytest.approx(700, abs=1)
+
+    def test_llm_calls_go_through_scheduler(self, mocker):
+        mocker.patch.dict(os.environ, {"OPENAI_API_KEY": "some-key"})
+        scheduler = mocker.patch("seiright.core.llms.llm_scheduler", LLMScheduler())
+        llm = OpenAILLM(model="gpt-4o")
+        completion = SimpleNamespace(
+            choices=[
+                SimpleNamespace(
+                    message=SimpleNamespace(
+                        content=json.dumps(
+                            {
+                                "is_compliant": True,
+                                "reasoning": "ok",
+                                "confidence_score": 1,
+                            }
+                        )
+                    )
+                )
+            ],
+            usage=None,
+        )
+        raw = SimpleNamespace(
+            headers={"x-ratelimit-limit-requests": "42"}, parse=lambda: completion
+        )
+        mocker.patch.object(llm, "create", return_value=raw)
+        assert llm.chat("page").is_compliant is True
+        assert scheduler.limiter("openai", "gpt-4o").requests.per_minute == 42
+
+
+def test_priority_context():
+    assert request_priority.get() == INTERACTIVE
+    with priority(BATCH):
+        assert request_priority.get() == BATCH
+    assert request_priority.get() == INTERACTIVE
+
+
+def test_parse_rate_limits():
+    assert parse_rate_limits("openai:gpt-4o=500/30000") == [
+        ("openai", "gpt-4o", 500.0, 30000.0)
+    ]
+    with pytest.raises(ValueError):
+        parse_rate_limits("openai:gpt-4o=500")
@@ -0,0 +1,155 @@
+import asyncio
+
+import pytest
+
+from seiright.core._types import LLMProvider, LLMResponse
+from seiright.core.ratelimit import LLMScheduler
+from seiright.core.router import (
+    CircuitBreaker,
+    LatencyWindow,
+    LLMRouter,
+    NoRouteAvailableError,
+)
+
+
+class FakeLLM:
+    """llm answering after `delay` seconds, its calls go through `scheduler` as
+    the calls of an `LLM` do"""
+
+    def __init__(
+        self,
+        model: str,
+        delay: float = 0,
+        fail: bool = False,
+        scheduler: LLMScheduler | None = None,
+    ):
+        self.model = model
+        self.scheduler = scheduler or LLMScheduler(max_attempts=1)
+        self.llm_provider = LLMProvider.OPENAI
+        self.delay = delay
+        self.fail = fail
+        self.calls = 0
+        self.cancelled = 0
+
+    def response(self) -> LLMResponse:
+        self.calls += 1
+        if self.fail:
+            raise RuntimeError(f"{self.model} is down")
+        return LLMResponse(
+            model=self.model,
+            llm_provider=self.llm_provider,
+            is_compliant=True,
+            reasoning="ok",
+            input_msg="prompt",
+            confidence_score=0.9,
+        )
+
+    def chat(self, user_prompt: str) -> LLMResponse:
+        return self.scheduler.run(self.llm_provider, self.model, 1, self.response)
+
+    async def achat(self, user_prompt: str) -> LLMResponse:
+        async def send() -> LLMResponse:
+            try:
+                await asyncio.sleep(self.delay)
+            except asyncio.CancelledError:
+                self.cancelled += 1
+                raise
+            return self.response()
+
+        return await self.scheduler.arun(self.llm_provider, self.model, 1, send)
+
+    async def aclose(self) -> None:
+        pass
+
+
+class TestLatencyWindow:
+    def test_percentiles_and_errors(self):
+        window = LatencyWindow(size=10)
+        for latency in range(1, 11):
+            window.record(latency, ok=True)
+        window.record(100, ok=False)
+        assert window.percentile(50) in (5, 6)
+        assert window.percentile(95) == 10
+        assert window.error_rate == pytest.approx(0.1)
+
+
+class TestCircuitBreaker:
+    def test_opens_and_half_opens(self, mocker):
+        now = mocker.patch("seiright.core.router.time.monotonic", return_value=0)
+        breaker = CircuitBreaker(failure_threshold=2, reset_timeout=10)
+        breaker.record_failure()
+        assert breaker.allow()
+        breaker.record_failure()
+        assert breaker.state == "open" and not breaker.allow()
+        now.return_value = 11
+        assert breaker.allow() and not breaker.allow()
+        breaker.record_success()
+        assert breaker.state == "closed"
+
+
+class TestLLMRouter:
+    def test_failover(self):
+        primary, fallback = FakeLLM("primary", fail=True), FakeLLM("fallback")
+        router = LLMRouter([primary, fallback], failure_threshold=1)  # type: ignore
+        assert asyncio.run(router.achat("prompt")).model == "fallback"
+        # the circuit of the primary is now open, it is skipped
+        assert router.chat("prompt").model == "fallback"
+        assert primary.calls == 1
+        assert [s.circuit for s in router.stats()] == ["open", "closed"]
+
+    def test_hedged_request(self):
+        slow, fast = FakeLLM("slow", delay=5), FakeLLM("fast")
+        router = LLMRouter(
+            [slow, fast], default_hedge_delay=0.01, min_hedge_delay=0  # type: ignore
+        )
+        response = asyncio.run(asyncio.wait_for(router.achat("prompt"), timeout=1))
+        assert response.model == "fast"
+        assert slow.cancelled == 1
+        # the cancelled slow call is kept as a lower bound of its latency
+        assert len(router.routes[0].latency) == 1
+        assert router.routes[0].latency.percentile(50) >= 0.01
+
+    def test_no_hedge_while_waiting_for_the_rate_limit(self):
+        scheduler = LLMScheduler()
+        # one request a second: the second call waits ~1s for its budget
+        scheduler.configure(LLMProvider.OPENAI, "primary", rpm=60)
+        scheduler.limiter(LLMProvider.OPENAI, "primary").requests.level = 1
+        primary = FakeLLM("primary", delay=0.05, scheduler=scheduler)
+        fallback = FakeLLM("fallback")
+        router = LLMRouter(
+            [primary, fallback], default_hedge_delay=0.5, min_hedge_delay=0  # type: ignore
+        )
+
+        async def run():
+            return await asyncio.gather(router.achat("one"), router.achat("two"))
+
+        responses = asyncio.run(asyncio.wait_for(run(), timeout=5))
+        assert [r.model for r in responses] == ["primary", "primary"]
+        assert fallback.calls == 0
+        # the wait for the budget isn't part of the latency of the route
+        assert router.routes[0].latency.percentile(95) < 0.5
+
+    def test_ranked_by_latency(self):
+        first, second = FakeLLM("first"), FakeLLM("second")
+        router = LLMRouter([first, second], min_samples=2)  # type: ignore
+        for latency in (1.0, 2.0):
+            router.routes[0].latency.record(latency, ok=True)
+            router.routes[1].latency.record(latency / 10, ok=True)
+        assert [r.llm.model for r in router.ranked()] == ["second", "first"]
+
+    def test_untried_routes_keep_their_place(self):
+        routes = [FakeLLM("primary"), FakeLLM("fallback"), FakeLLM("last")]
+        router = LLMRouter(routes)  # type: ignore
+        for _ in range(20):
+            router.routes[0].latency.record(2.0, ok=True)
+        assert [r.llm.model for r in router.ranked()] == ["primary", "fallback", "last"]
+        for _ in range(20):
+            router.routes[2].latency.record(0.5, ok=True)
+        assert [r.llm.model for r in router.ranked()] == ["last", "fallback", "primary"]
+
+    def test_no_route_available(self):
+        router = LLMRouter([FakeLLM("down", fail=True)], failure_threshold=1)  # type: ignore
+        with pytest.raises(RuntimeError):
+            router.chat("prompt")
+        with pytest.raises(NoRouteAvailableError):
+            router.chat("prompt")
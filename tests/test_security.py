@@ -1,13 +1,23 @@
+import json
 import os
+from datetime import timedelta
+from time import time
 
 import pytest
+from jose import JWTError
 
 from seiright.app.security import (
+    TokenCache,
     access_token_expire_time,
     algorithm,
     authenticate_user,
+    create_access_token,
+    oauth2_scheme,
+    pwd_context,
     secret_key,
+    verify_token,
 )
+from seiright.app.utils import UserStore
 
 
 @pytest.fixture
@@ -29,3 +39,58 @@ class TestSecurity:
 
     def test_authenticate_non_existing_user(self, db):
         assert authenticate_user(db, "new_user", "test") is False
+
+    def test_contexts_are_reused(self):
+        assert pwd_context() is pwd_context()
+        assert oauth2_scheme() is oauth2_scheme()
+
+
+class TestTokenCache:
+    def test_expired_token(self):
+        cache = TokenCache()
+        cache.set("valid", "monte", time() + 60)
+        cache.set("expired", "monte", time() - 1)
+        assert cache.get("valid") == "monte"
+        assert cache.get("expired") is None
+        assert len(cache) == 1
+
+    def test_bounded(self):
+        cache = TokenCache(maxsize=2)
+        for token in ("a", "b", "c"):
+            cache.set(token, token, time() + 60)
+        assert cache.get("a") is None
+        assert cache.get("c") == "c"
+
+    def test_verify_token(self, mocker):
+        mocker.patch.dict(os.environ, {"SECRET_KEY": "some-key", "ALGORITHM": "HS256"})
+        cache = TokenCache()
+        token = create_access_token({"sub": "monte"}, timedelta(minutes=5))
+        assert verify_token(token, cache) == "monte"
+        decode = mocker.patch("seiright.app.security.jwt.decode")
+        assert verify_token(token, cache) == "monte"
+        decode.assert_not_called()
+
+    def test_invalid_token_not_cached(self, mocker):
+        mocker.patch.dict(os.environ, {"SECRET_KEY": "some-key", "ALGORITHM": "HS256"})
+        cache = TokenCache()
+        with pytest.raises(JWTError):
+            verify_token("not-a-token", cache)
+        assert len(cache) == 0
+
+
+class TestUserStore:
+    def test_reload_on_change(self, tmp_path):
+        path = tmp_path / "db.json"
+        path.write_text(json.dumps({"monte": {"username": "monte"}}))
+        store = UserStore(str(path), check_interval=0)
+        assert list(store.users()) == ["monte"]
+        path.write_text(json.dumps({"monte": {}, "johndoe": {"username": "johndoe"}}))
+        os.utime(path, ns=(0, 0))
+        assert sorted(store.users()) == ["johndoe", "monte"]
+
+    def test_broken_file_keeps_users(self, tmp_path):
+        path = tmp_path / "db.json"
+        path.write_text(json.dumps({"monte": {"username": "monte"}}))
+        store = UserStore(str(path), check_interval=0)
+        path.write_text("{not json")
+        assert list(store.users()) == ["monte"]
@@ -0,0 +1,161 @@
+import asyncio
+import os
+
+import httpx
+import pytest
+
+from seiright.core._types import LLMProvider, LLMResponse, PageVerdict
+from seiright.core.assemble import ComplianceChecker, summarize_site
+from seiright.core.site_crawler import SiteCrawler, sitemap_locations
+
+SITE = {
+    "/robots.txt": "User-agent: *\nDisallow: /private\n",
+    "/sitemap.xml": """<?xml version="1.0" encoding="UTF-8"?>
+        <urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">
+          <url><loc>https://bank.test/a</loc></url>
+          <url><loc>https://bank.test/b</loc></url>
+        </urlset>""",
+    "/": """<html><head><title>Home</title></head><body>
+        <p>Welcome</p>
+        <a href="/c">c</a><a href="/a#top">a</a><a href="/private/x">x</a>
+        <a href="https://other.test/">other</a><a href="/deep/1">deep</a>
+        </body></html>""",
+    "/a": "<p>Page a</p>",
+    "/b": "<p>Page b</p>",
+    "/c": '<html><head><link rel="canonical" href="/a"></head><p>Copy of a</p></html>',
+    "/deep/1": '<p>Deep</p><a href="/deep/2">next</a>',
+    "/deep/2": "<p>Deeper</p>",
+}
+
+
+def serve(path: str) -> httpx.Response:
+    if path not in SITE:
+        return httpx.Response(404)
+    return httpx.Response(200, text=SITE[path], headers={"Content-Type": "text/html"})
+
+
+def handler(request: httpx.Request) -> httpx.Response:
+    assert request.url.host == "bank.test"
+    return serve(request.url.path)
+
+
+def redirecting_handler(request: httpx.Request) -> httpx.Response:
+    # the site is served from https://www.bank.test, the bare host redirects there
+    if request.url.host != "www.bank.test" or request.url.scheme != "https":
+        return httpx.Response(
+            301, headers={"Location": f"https://www.bank.test{request.url.path}"}
+        )
+    return serve(request.url.path)
+
+
+async def crawl(root_url="https://bank.test", handler=handler, **kwargs) -> dict:
+    async with httpx.AsyncClient(
+        transport=httpx.MockTransport(handler), follow_redirects=True
+    ) as client:
+        crawler = SiteCrawler(client=client, **kwargs)
+        return {page.url: page async for page in crawler.crawl(root_url)}
+
+
+class TestSiteCrawler:
+    def test_crawl(self):
+        pages = asyncio.run(crawl(max_depth=1))
+        assert set(pages) == {
+            "https://bank.test/",
+            "https://bank.test/a",
+            "https://bank.test/b",
+            "https://bank.test/deep/1",
+        }
+        assert pages["https://bank.test/"].title == "Home"
+
+    def test_max_depth(self):
+        pages = asyncio.run(crawl(max_depth=2))
+        assert "https://bank.test/deep/2" in pages
+
+    def test_max_pages(self):
+        assert len(asyncio.run(crawl(max_pages=2))) == 2
+
+    def test_root_redirects(self):
+        pages = asyncio.run(
+            crawl("http://bank.test", handler=redirecting_handler, max_depth=1)
+        )
+        assert "https://www.bank.test/" in pages
+        assert {"https://bank.test/a", "https://www.bank.test/deep/1"} <= set(pages)
+
+    def test_robots_unavailable(self):
+        def unavailable(request: httpx.Request) -> httpx.Response:
+            if request.url.path == "/robots.txt":
+                return httpx.Response(503)
+            return handler(request)
+
+        assert asyncio.run(crawl(handler=unavailable)) == {}
+
+
+class TestSitemap:
+    def test_sitemap_index(self):
+        xml = """<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">
+            <sitemap><loc>https://bank.test/s1.xml</loc></sitemap>
+        </sitemapindex>"""
+        assert sitemap_locations(xml) == (["https://bank.test/s1.xml"], True)
+
+
+class TestSiteCheck:
+    def test_fetches_do_not_hold_llm_slots(self, mocker):
+        mocker.patch.dict(os.environ, {"OPENAI_API_KEY": "some-key"})
+        checker = ComplianceChecker(llm_provider=LLMProvider.OPENAI, model="gpt-4o")
+        extracting = 0
+        overlaps = 0
+
+        async def apage_text(url, page):
+            nonlocal extracting
+            extracting += 1
+            await asyncio.sleep(0.05 if url.endswith("/a") else 0.01)
+            extracting -= 1
+            return url
+
+        async def achat(user_prompt):
+            nonlocal overlaps
+            overlaps += extracting > 0
+            await asyncio.sleep(0.01)
+            return LLMResponse(
+                model="gpt-4o",
+                llm_provider=LLMProvider.OPENAI,
+                is_compliant=True,
+                reasoning="ok",
+                input_msg=user_prompt,
+                confidence_score=0.9,
+            )
+
+        mocker.patch.object(checker, "apage_text", side_effect=apage_text)
+        mocker.patch.object(checker.llm, "achat", side_effect=achat)
+
+        async def run():
+            async with httpx.AsyncClient(
+                transport=httpx.MockTransport(handler), follow_redirects=True
+            ) as client:
+                crawler = SiteCrawler(client=client)
+                return await checker.acheck_site(
+                    "https://bank.test", crawler=crawler, max_llm_calls=1
+                )
+
+        report = asyncio.run(run())
+        assert report.summary.pages_checked == len(report.pages) > 1
+        # llm calls ran while other pages were still being extracted
+        assert overlaps > 0
+
+
+class TestSummarizeSite:
+    @pytest.fixture
+    def verdicts(self):
+        return [
+            PageVerdict(url="a", is_compliant=True, confidence_score=1.0),
+            PageVerdict(url="b", is_compliant=False, confidence_score=0.5),
+            PageVerdict(url="c", error="boom"),
+        ]
+
+    def test_summary(self, verdicts):
+        summary = summarize_site(verdicts)
+        assert summary.is_compliant is False
+        assert summary.pages_checked == 2
+        assert summary.failed_pages == 1
+        assert summary.non_compliant_urls == ["b"]
+        assert summary.mean_confidence_score == 0.75
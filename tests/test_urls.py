@@ -0,0 +1,43 @@
+from seiright.core.urls import canonicalize_url, origin, page_key, strip_tracking
+
+
+class TestCanonicalizeUrl:
+    def test_normalises(self):
+        assert canonicalize_url("HTTPS://Bank.Test:443#top") == "https://bank.test/"
+
+    def test_relative(self):
+        assert (
+            canonicalize_url("../b?x=1", base_url="https://bank.test/a/c")
+            == "https://bank.test/b?x=1"
+        )
+
+    def test_ipv6(self):
+        assert canonicalize_url("http://[::1]:8080/a") == "http://[::1]:8080/a"
+        assert origin("https://[2001:DB8::1]:443/a") == "https://[2001:db8::1]"
+
+    def test_origin(self):
+        assert origin("http://bank.test:8080/a") == "http://bank.test:8080"
+
+
+class TestPageKey:
+    def test_strip_tracking(self):
+        assert (
+            strip_tracking("https://Bank.test/a/?utm_source=x&b=2&gclid=1&a=1")
+            == "https://bank.test/a/?b=2&a=1"
+        )
+
+    def test_query_kept_as_is(self):
+        assert (
+            strip_tracking("https://bank.test/a?flag&b=a%20c&utm_medium=x&c=d+e")
+            == "https://bank.test/a?flag&b=a%20c&c=d+e"
+        )
+
+    def test_same_page(self):
+        urls = [
+            "https://www.bank.test/rates/?b=2&a=1",
+            "https://bank.test/rates?a=1&b=2&utm_campaign=spring#apy",
+            "HTTPS://BANK.TEST:443/rates?fbclid=x&b=2&a=1",
+        ]
+        assert {page_key(url) for url in urls} == {"https://bank.test/rates?a=1&b=2"}
+        assert page_key("https://bank.test") == "https://bank.test/"
+        assert page_key("https://bank.test/rates?a=2") != page_key(urls[0])
@@ -1,8 +1,11 @@
+import asyncio
 import os
+import threading
+import time
 
 import pytest
 
-from seiright.utils.utils import get_env_var
+from seiright.utils.utils import SecretCache, get_env_var, timer
 
 
 class TestGetEnvVar:
@@ -13,3 +16,109 @@ class TestGetEnvVar:
     def test_raise_error(self):
         with pytest.raises(KeyError):
             get_env_var("SECRET_KEY")
+
+
+class TestTimer:
+    def test_async_function(self):
+        @timer
+        async def add(a, b):
+            return a + b
+
+        assert asyncio.iscoroutinefunction(add)
+        assert asyncio.run(add(1, 2)) == 3
+
+
+class StubBackend:
+    def __init__(self, failures: int = 0):
+        self.failures = failures
+        self.fetches = 0
+
+    def fetch(self, name: str) -> str:
+        self.fetches += 1
+        if self.failures:
+            self.failures -= 1
+            raise RuntimeError("unavailable")
+        return f"{name}-{self.fetches}"
+
+
+class TestSecretCache:
+    def test_ttl(self, mocker):
+        backend = StubBackend()
+        secrets = SecretCache(backend, ttl=10)
+        mocker.patch("seiright.utils.utils.time", return_value=100.0)
+        assert secrets.get("key") == "key-1"
+        assert secrets.get("key") == "key-1"
+        mocker.patch("seiright.utils.utils.time", return_value=111.0)
+        assert secrets.get("key") == "key-2"
+
+    def test_stale_secret_while_backend_fails(self, mocker):
+        backend = StubBackend()
+        secrets = SecretCache(backend, ttl=10)
+        mocker.patch("seiright.utils.utils.time", return_value=100.0)
+        secrets.get("key")
+        backend.failures = 1
+        mocker.patch("seiright.utils.utils.time", return_value=111.0)
+        assert secrets.get("key") == "key-1"
+        with pytest.raises(RuntimeError):
+            SecretCache(StubBackend(failures=1)).get("key")
+
+    def test_expired_secret_is_refetched_once_per_interval(self, mocker):
+        backend = StubBackend()
+        secrets = SecretCache(backend, ttl=10, refetch_interval=30)
+        mocker.patch("seiright.utils.utils.time", return_value=100.0)
+        secrets.get("key")
+        backend.failures = 10
+        mocker.patch("seiright.utils.utils.time", return_value=111.0)
+        for _ in range(5):
+            assert secrets.get("key") == "key-1"
+        assert backend.fetches == 2
+        mocker.patch("seiright.utils.utils.time", return_value=141.0)
+        assert secrets.get("key") == "key-1"
+        assert backend.fetches == 3
+
+    def test_run_retries_until_loaded(self):
+        secrets = SecretCache(StubBackend(failures=2))
+
+        async def run():
+            task = asyncio.create_task(secrets.run(["key"], retry_interval=0))
+            while not secrets.loaded:
+                await asyncio.sleep(0)
+            task.cancel()
+
+        asyncio.run(asyncio.wait_for(run(), timeout=5))
+        assert secrets.error is None
+        assert secrets.get("key") == "key-3"
+
+    def test_aget_fetches_off_the_event_loop(self):
+        backend = StubBackend()
+        threads = []
+        fetch = backend.fetch
+
+        def slow_fetch(name: str) -> str:
+            threads.append(threading.current_thread())
+            time.sleep(0.05)
+            return fetch(name)
+
+        backend.fetch = slow_fetch  # type: ignore
+        secrets = SecretCache(backend)
+
+        async def run():
+            return await asyncio.gather(*(secrets.aget("key") for _ in range(5)))
+
+        assert asyncio.run(run()) == ["key-1"] * 5
+        assert backend.fetches == 1
+        assert threading.main_thread() not in threads
+
+    def test_aget_serves_the_stale_secret_while_refreshing(self, mocker):
+        backend = StubBackend()
+        secrets = SecretCache(backend, ttl=10)
+        mocker.patch("seiright.utils.utils.time", return_value=100.0)
+        secrets.get("key")
+        mocker.patch("seiright.utils.utils.time", return_value=111.0)
+
+        async def run():
+            stale = await secrets.aget("key")
+            await secrets._refreshes["key"]
+            return stale, await secrets.aget("key")
+
+        assert asyncio.run(run()) == ("key-1", "key-2")
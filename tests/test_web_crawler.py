@@ -0,0 +1,122 @@
+import asyncio
+import sqlite3
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import httpx
+import pytest
+
+from seiright.core.web_crawler import (
+    PageCache,
+    aextract_text_from_url,
+    extract_text_from_url,
+    parse_html,
+)
+
+HTML = """
+<html>
+  <head><title>Acme Bank</title></head>
+  <body>
+    <h1>Savings</h1>
+    <p>Earn 5% APY.</p>
+    <ul><li>No fees</li><li></li></ul>
+  </body>
+</html>
+"""
+
+
+class TestParseHtml:
+    def test_parse_html(self):
+        text, title = parse_html(HTML)
+        assert title == "Acme Bank"
+        assert text == "\n# Savings\n\nEarn 5% APY.\nNo fees"
+
+    def test_missing_title(self):
+        assert parse_html("<p>hello</p>") == ("hello", None)
+
+
+class TestAsyncExtract:
+    def test_aextract_text_from_url(self):
+        transport = httpx.MockTransport(lambda request: httpx.Response(200, text=HTML))
+
+        async def run():
+            async with httpx.AsyncClient(transport=transport) as client:
+                return await aextract_text_from_url("https://acme.test", client=client)
+
+        text, title = asyncio.run(run())
+        assert title == "Acme Bank"
+        assert "Earn 5% APY." in text
+
+
+class ConditionalHandler(BaseHTTPRequestHandler):
+    etag = '"v1"'
+    status_codes: list[int] = []
+
+    def do_GET(self):
+        if self.headers.get("If-None-Match") == self.etag:
+            self.status_codes.append(304)
+            self.send_response(304)
+            self.end_headers()
+            return
+        body = HTML.encode("utf-8")
+        self.status_codes.append(200)
+        self.send_response(200)
+        self.send_header("ETag", self.etag)
+        self.send_header("Content-Type", "text/html")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    ConditionalHandler.status_codes = []
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), ConditionalHandler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{httpd.server_port}/"
+    httpd.shutdown()
+    httpd.server_close()
+
+
+class TestPageCache:
+    def test_revalidates_with_etag(self, server, tmp_path):
+        page_cache = PageCache(db_path=tmp_path / "pages.sqlite")
+        first = extract_text_from_url(server, page_cache=page_cache)
+        second = extract_text_from_url(server, page_cache=page_cache)
+        assert first == second
+        assert ConditionalHandler.status_codes == [200, 304]
+        assert page_cache.get(server).etag == '"v1"'
+
+    def test_async_revalidates_with_etag(self, server):
+        page_cache = PageCache()
+
+        async def run():
+            async with httpx.AsyncClient() as client:
+                first = await aextract_text_from_url(
+                    server, client=client, page_cache=page_cache
+                )
+                second = await aextract_text_from_url(
+                    server, client=client, page_cache=page_cache
+                )
+                return first, second
+
+        first, second = asyncio.run(run())
+        assert first == second
+        assert ConditionalHandler.status_codes == [200, 304]
+
+    def test_drops_the_stored_bodies(self, server, tmp_path):
+        db_path = tmp_path / "pages.sqlite"
+        db = sqlite3.connect(db_path)
+        db.execute(
+            "CREATE TABLE pages (url TEXT PRIMARY KEY, etag TEXT, "
+            "last_modified TEXT, body TEXT NOT NULL, text TEXT NOT NULL, "
+            "title TEXT, fetched_at REAL NOT NULL)"
+        )
+        db.close()
+        page_cache = PageCache(db_path=db_path)
+        extract_text_from_url(server, page_cache=page_cache)
+        assert page_cache.get(server).etag == '"v1"'
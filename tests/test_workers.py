@@ -0,0 +1,70 @@
+import asyncio
+
+import httpx
+import pytest
+
+from seiright.core._types import ExtractorConfig
+from seiright.core.blocks import ExtractedPage
+from seiright.core.extractor import extract_html
+from seiright.core.web_crawler import aextract_text_from_url, parse_html
+from seiright.core.workers import ExtractionPool
+
+HTML = "<html><head><title>Harbor</title></head><body>{}</body></html>".format(
+    "<h2>Savings</h2>" + "<p>Earn 4% APY on your savings, with no fees.</p>" * 200
+)
+
+
+@pytest.fixture(scope="module")
+def pool():
+    pool = ExtractionPool(workers=1, min_bytes=1024, min_chars=1024)
+    pool.start()
+    yield pool
+    pool.close()
+
+
+class TestExtractionPool:
+    def test_same_result_as_in_process(self, pool):
+        page = extract_html(HTML).page()
+
+        async def run():
+            extracted = await pool.aextract(HTML.encode(), "utf-8", ExtractorConfig())
+            return extracted, await pool.arender(page)
+
+        (pool_page, parse_seconds), rendered = asyncio.run(run())
+        assert (pool_page.buffer, pool_page.title) == (page.buffer, page.title)
+        assert list(pool_page) == list(page)
+        assert parse_seconds > 0
+        assert rendered == page.render_prompt()
+
+    def test_aextract_text_from_url(self, pool):
+        transport = httpx.MockTransport(lambda request: httpx.Response(200, text=HTML))
+
+        async def run():
+            async with httpx.AsyncClient(transport=transport) as client:
+                return await aextract_text_from_url(
+                    "https://harbor.test", client=client, pool=pool
+                )
+
+        assert asyncio.run(run()) == parse_html(HTML)
+
+    def test_timeout(self, pool):
+        pool.timeout = 0
+
+        async def run():
+            return await pool.arender(ExtractedPage.from_text("x " * 1024))
+
+        processes = list(pool._executor._processes.values())
+        with pytest.raises(TimeoutError):
+            asyncio.run(run())
+        pool.timeout = 30
+        # the workers are replaced, the task isn't left running in one of them
+        assert pool._executor is None
+        for process in processes:
+            process.join(timeout=5)
+            assert not process.is_alive()
+        page = ExtractedPage.from_text("x " * 1024)
+
+        async def rendered():
+            return await pool.arender(page)
+
+        assert asyncio.run(rendered()) == page.render_prompt()